@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+import sys, getopt
+from scripts import benchmark_helper
+
+def print_usage():
+	print('\tUsage: path/to/modbus-bench.py')
+	print('\t\t'+'-t <path to a Modbus template file (.csv format) to benchmark, can be repeated, default all the templates of the template/ folder> (--template) [optional]')
+	print('\t\t'+'-s <comma separated tag counts of the synthetic templates to benchmark, default 10,100,1000,10000> (--synthetic) [optional]')
+	print('\t\t'+'-d <seconds to poll for each template, default 5> (--duration) [optional]')
+	print('\t\t'+'-f <log_file_type to write, one of csv, json, ndjson, mbcol, mbraw or sqlite, default csv> (--log-file-type) [optional]')
+	print('\t\t'+'-P <pipeline_depth of the client, default 1> (--pipeline-depth) [optional]')
+	print('\t\t'+'-g <max_gap of the read plan, default 0> (--max-gap) [optional]')
+	print('\t\t'+'-l <latency in milliseconds added by the simulator to each response, default 0> (--latency) [optional]')
+	print('\t\t'+'-o <path to a .json file to write the results to, to compare runs> (--output) [optional]')
+	print('\t\t'+'-h to show the help message and exit (--help) [optional]')
+
+if __name__ == '__main__':
+	argv = sys.argv[1:]
+
+	short_options = 't:s:d:f:P:g:l:o:h'
+	long_options = ['template=','synthetic=','duration=','log-file-type=','pipeline-depth=','max-gap=','latency=','output=','help']
+
+	try:
+		opts, args = getopt.getopt(argv,short_options,long_options)
+	except getopt.error as err:
+		print('\tERROR! For help please try:')
+		print('\t\tpath/to/modbus-bench.py -h')
+		print('')
+		print_usage()
+		print(str(err))
+		sys.exit()
+
+	# Set some defaults
+	modbus_template_locations = []
+	tag_counts = None
+	duration_seconds = 5
+	log_file_type = 'csv'
+	pipeline_depth = 1
+	max_gap = 0
+	latency_seconds = 0
+	results_location = None
+
+	try:
+		for opt, arg in opts:
+			if opt in ('-h', '--help'):
+				print('Usage: modbus-bench.py [-h] [-t TEMPLATE_FILE]... [-s TAG_COUNTS] [-d DURATION] [-f LOG_FILE_TYPE] [-P PIPELINE_DEPTH] [-g MAX_GAP] [-l LATENCY_MS] [-o RESULTS_FILE]')
+				print('')
+				print('End-to-end throughput benchmark of modbus-dl against the local Modbus TCP Server simulator: cycles/s, decode us/tag, bytes/record and peak RSS')
+				print('')
+				print_usage()
+				sys.exit()
+			elif opt in ('-t', '--template'):
+				modbus_template_locations.append(str(arg))
+			elif opt in ('-s', '--synthetic'):
+				tag_counts = [int(tag_count) for tag_count in str(arg).split(',') if tag_count.strip()]
+			elif opt in ('-d', '--duration'):
+				duration_seconds = float(arg)
+			elif opt in ('-f', '--log-file-type'):
+				log_file_type = str(arg)
+			elif opt in ('-P', '--pipeline-depth'):
+				pipeline_depth = int(arg)
+			elif opt in ('-g', '--max-gap'):
+				max_gap = int(arg)
+			elif opt in ('-l', '--latency'):
+				latency_seconds = float(arg) / 1000
+			elif opt in ('-o', '--output'):
+				results_location = str(arg)
+	except ValueError as err:
+		print('\tERROR!',str(err))
+		print_usage()
+		sys.exit()
+
+	if not modbus_template_locations:
+		modbus_template_locations = benchmark_helper.ModbusBenchmark.sample_templates()
+
+	benchmark_helper.ModbusBenchmark.run(
+			full_paths_to_modbus_template_csv=modbus_template_locations,
+			tag_counts=tag_counts,
+			duration_seconds=duration_seconds,
+			log_file_type=log_file_type,
+			pipeline_depth=pipeline_depth,
+			max_gap=max_gap,
+			latency_seconds=latency_seconds,
+			full_path_to_results_json=results_location
+		)
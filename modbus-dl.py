@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
-import sys, getopt, datetime
-from scripts import modbus_helper
+import os, sys, getopt, datetime
+from scripts import modbus_helper, async_helper, gateway_helper, data_helper, metrics_helper, decoder_helper, supervisor_helper
 
 time_format = '%Y-%m-%d %H:%M:%S%z'
 
@@ -10,8 +10,8 @@ start_utc = start_local.astimezone(datetime.timezone.utc)
 
 argv = sys.argv[1:]
 
-short_options = 'c:t:o:qnh' 
-long_options =  ['config=','template=','output=','quiet','no-data-logging','--help']
+short_options = 'c:t:m:w:o:x:r:M:qnpPh' 
+long_options =  ['config=','template=','manifest=','workers=','output=','convert-json=','decode-raw=','quiet','no-data-logging','print-plan','metrics-port=','profile','--help']
 
 try:
 	opts, args = getopt.getopt(argv,short_options,long_options)
@@ -24,9 +24,16 @@ except getopt.error as err:
 	print('\tUsage: path/to/modbus-dl.py')
 	print('\t\t'+'-c <path to Modbus configuration file (.json format)> (--config) [REQUIRED]')
 	print('\t\t'+'-t <path to Modbus template file (.csv format)> (--template) [REQUIRED]')
+	print('\t\t'+'-m <path to Modbus manifest file (.json format) listing several config/template pairs to poll concurrently, replaces -c and -t> (--manifest) [optional]')
+	print('\t\t'+'-w <number of worker processes to spread the devices of -m over, balanced by their estimated cost, 0 for one per CPU core> (--workers) [optional]')
 	print('\t\t'+'-o <path to output log files> (--output) [optional]')
 	print('\t\t'+'-q <to be quiet and to not display the interval Modbus reads, default False> (--quiet) [optional]')
 	print('\t\t'+'-n to make modbus-dl behave as a "real-time" Modbus TCP Client without data logging (--no-data-logging) [optional]')
+	print('\t\t'+'-p to print the Modbus read plan built from the config and template files and exit (--print-plan) [optional]')
+	print('\t\t'+'-x <path to a .json log file> to convert it to a .ndjson log file (one record per line) and exit (--convert-json) [optional]')
+	print('\t\t'+'-r <path to a .mbraw capture file> to decode it into log files of the log_file_type of -c (csv by default), with the template of -t or the one stored in the capture, and exit (--decode-raw) [optional]')
+	print('\t\t'+'-M <local TCP port to serve the hot path metrics on, in the Prometheus text format at http://127.0.0.1:PORT/metrics> (--metrics-port) [optional]')
+	print('\t\t'+'-P to print the time spent in each stage of the hot path when exiting (--profile) [optional]')
 	print('\t\t'+'-h to show the help message and exit (--help) [optional]')
 	print(str(err))
 	sys.exit()
@@ -35,7 +42,7 @@ list_of_options_passed = []
 for item in opts:
 	list_of_options_passed.append(item[0])
 
-if ('-h' not in list_of_options_passed) and ('--help' not in list_of_options_passed):
+if ('-h' not in list_of_options_passed) and ('--help' not in list_of_options_passed) and ('-m' not in list_of_options_passed) and ('--manifest' not in list_of_options_passed) and ('-x' not in list_of_options_passed) and ('--convert-json' not in list_of_options_passed) and ('-r' not in list_of_options_passed) and ('--decode-raw' not in list_of_options_passed):
 	if ('-c' not in list_of_options_passed) and ('--config' not in list_of_options_passed):
 		print('\tERROR!')
 		print('\tMissing required argument -c or --config <path to Modbus configuration file (.json format)> [REQUIRED]')
@@ -48,12 +55,19 @@ if ('-h' not in list_of_options_passed) and ('--help' not in list_of_options_pas
 		print('\tUsage: path/to/modbus-dl.py')
 		print('\t\t'+'-c <path to Modbus configuration file (.json format)> (--config) [REQUIRED]')
 		print('\t\t'+'-t <path to Modbus template file (.csv format)> (--template) [REQUIRED]')
+		print('\t\t'+'-m <path to Modbus manifest file (.json format) listing several config/template pairs to poll concurrently, replaces -c and -t> (--manifest) [optional]')
+		print('\t\t'+'-w <number of worker processes to spread the devices of -m over, balanced by their estimated cost, 0 for one per CPU core> (--workers) [optional]')
 		print('\t\t'+'-o <path to output log files> (--output) [optional]')
 		print('\t\t'+'-q <to be quiet and to not display the interval Modbus reads, default False> (--quiet) [optional]')
 		print('\t\t'+'-n to make modbus-dl behave as a "real-time" Modbus TCP Client without data logging (--no-data-logging) [optional]')
+		print('\t\t'+'-p to print the Modbus read plan built from the config and template files and exit (--print-plan) [optional]')
+		print('\t\t'+'-x <path to a .json log file> to convert it to a .ndjson log file (one record per line) and exit (--convert-json) [optional]')
+		print('\t\t'+'-r <path to a .mbraw capture file> to decode it into log files of the log_file_type of -c (csv by default), with the template of -t or the one stored in the capture, and exit (--decode-raw) [optional]')
+		print('\t\t'+'-M <local TCP port to serve the hot path metrics on, in the Prometheus text format at http://127.0.0.1:PORT/metrics> (--metrics-port) [optional]')
+		print('\t\t'+'-P to print the time spent in each stage of the hot path when exiting (--profile) [optional]')
 		print('\t\t'+'-h to show the help message and exit (--help) [optional]')
 		sys.exit()
-	elif ('-t' not in list_of_options_passed) and ('--template' not in list_of_options_passed):
+	elif ('-t' not in list_of_options_passed) and ('--template' not in list_of_options_passed) and not modbus_helper.ModbusHelper.config_lists_units([arg for opt, arg in opts if opt in ('-c', '--config')][-1]):
 		print('\tERROR!')
 		print('\tMissing required argument -t or --template <path to Modbus template file (.csv format)> [REQUIRED]')
 		print('')
@@ -65,9 +79,16 @@ if ('-h' not in list_of_options_passed) and ('--help' not in list_of_options_pas
 		print('\tUsage: path/to/modbus-dl.py')
 		print('\t\t'+'-c <path to Modbus configuration file (.json format)> (--config) [REQUIRED]')
 		print('\t\t'+'-t <path to Modbus template file (.csv format)> (--template) [REQUIRED]')
+		print('\t\t'+'-m <path to Modbus manifest file (.json format) listing several config/template pairs to poll concurrently, replaces -c and -t> (--manifest) [optional]')
+		print('\t\t'+'-w <number of worker processes to spread the devices of -m over, balanced by their estimated cost, 0 for one per CPU core> (--workers) [optional]')
 		print('\t\t'+'-o <path to output log files> (--output) [optional]')
 		print('\t\t'+'-q <to be quiet and to not display the interval Modbus reads, default False> (--quiet) [optional]')
 		print('\t\t'+'-n to make modbus-dl behave as a "real-time" Modbus TCP Client without data logging (--no-data-logging) [optional]')
+		print('\t\t'+'-p to print the Modbus read plan built from the config and template files and exit (--print-plan) [optional]')
+		print('\t\t'+'-x <path to a .json log file> to convert it to a .ndjson log file (one record per line) and exit (--convert-json) [optional]')
+		print('\t\t'+'-r <path to a .mbraw capture file> to decode it into log files of the log_file_type of -c (csv by default), with the template of -t or the one stored in the capture, and exit (--decode-raw) [optional]')
+		print('\t\t'+'-M <local TCP port to serve the hot path metrics on, in the Prometheus text format at http://127.0.0.1:PORT/metrics> (--metrics-port) [optional]')
+		print('\t\t'+'-P to print the time spent in each stage of the hot path when exiting (--profile) [optional]')
 		print('\t\t'+'-h to show the help message and exit (--help) [optional]')
 		sys.exit()
 
@@ -75,10 +96,18 @@ if ('-h' not in list_of_options_passed) and ('--help' not in list_of_options_pas
 be_quiet = False
 output_log_files_location = None
 data_logging = True
+print_plan = False
+modbus_manifest_location = None
+workers = None
+modbus_config_location = None
+modbus_template_location = None
+mbraw_capture_location = None
+metrics_port = None
+profile = False
 
 for opt, arg in opts:
 	if opt in ('-h', '--help'):
-		print('Usage: modbus-dl.py [-h] -c CONFIG_FILE -t TEMPLATE_FILE [-o OUTPUT_FOLDER] [-q] [-n]')
+		print('Usage: modbus-dl.py [-h] (-c CONFIG_FILE -t TEMPLATE_FILE | -m MANIFEST_FILE [-w WORKERS]) [-o OUTPUT_FOLDER] [-q] [-n] [-p] [-x JSON_LOG_FILE] [-r MBRAW_CAPTURE_FILE [-c CONFIG_FILE] [-t TEMPLATE_FILE]] [-M METRICS_PORT] [-P]')
 		print('')
 		print('OPTIONS:')
 		print('\t-h, --help\tshow this help message and exit')
@@ -86,21 +115,52 @@ for opt, arg in opts:
 		print('\t\t\t.json configuration file to use (defines the Modbus TCP Server to connect to and log file properties)')
 		print('\t-t TEMPLATE_FILE, --template TEMPLATE_FILE')
 		print('\t\t\t.csv template file to use (defines the Modbus registers to poll, mapped tag names, scaling)')
+		print('\t-m MANIFEST_FILE, --manifest MANIFEST_FILE')
+		print('\t\t\t.json manifest file listing several {"config": CONFIG_FILE, "template": TEMPLATE_FILE} to poll concurrently from this single process')
+		print('\t-w WORKERS, --workers WORKERS')
+		print('\t\t\tpoll the devices of MANIFEST_FILE from WORKERS supervised processes instead (0 for one per CPU core), balanced by their')
+		print('\t\t\testimated cost per second (tags decoded times poll rate); crashed workers are restarted and their stats gathered')
 		print('\t-o OUTPUT_FOLDER, --output OUTPUT_FOLDER')
 		print('\t\t\tspecify the directory where log files will be stored, default is "data/" folder')
 		print('\t-q, --quiet\tmute the display of scanned data to the terminal prompt')
 		print('\t-n, --no-data-logging\tdo not perform data logging')
+		print('\t-p, --print-plan\tprint the Modbus read plan (read requests and estimated round trips per poll cycle) and exit')
+		print('\t-x JSON_LOG_FILE, --convert-json JSON_LOG_FILE')
+		print('\t\t\tconvert a .json log file (keyed by timestamp) to a .ndjson log file (one record per line) next to it and exit')
+		print('\t-r MBRAW_CAPTURE_FILE, --decode-raw MBRAW_CAPTURE_FILE')
+		print('\t\t\tdecode a .mbraw capture file (log_file_type "mbraw") into log files of the log_file_type of CONFIG_FILE (csv by default) and exit,')
+		print('\t\t\twith TEMPLATE_FILE (ex: corrected scaling or data types) or the template stored in the capture')
+		print('\t-M METRICS_PORT, --metrics-port METRICS_PORT')
+		print('\t\t\tserve per-stage timing histograms and wire/log counters in the Prometheus text format on http://127.0.0.1:METRICS_PORT/metrics')
+		print('\t-P, --profile\tprint the time spent in each stage of the hot path (per device and call group) when exiting')
 		sys,exit()
 	elif opt in ('-c', '--config'):
 		modbus_config_location = str(arg)
 	elif opt in ('-t', '--template'):
 		modbus_template_location = str(arg)
+	elif opt in ('-m', '--manifest'):
+		modbus_manifest_location = str(arg)
+	elif opt in ('-w', '--workers'):
+		workers = int(arg)
 	elif opt in ('-o', '--output'):
 		output_log_files_location = str(arg)
 	elif opt in ('-q','--quiet'):
 		be_quiet = True
 	elif opt in ('-n','--no-data-logging'):
 		data_logging = False
+	elif opt in ('-p','--print-plan'):
+		print_plan = True
+	elif opt in ('-M','--metrics-port'):
+		metrics_port = int(arg)
+	elif opt in ('-P','--profile'):
+		profile = True
+	elif opt in ('-r','--decode-raw'):
+		mbraw_capture_location = str(arg)
+	elif opt in ('-x','--convert-json'):
+		full_path_to_ndjson_file = data_helper.DataHelper.json_log_to_ndjson(str(arg))
+		if full_path_to_ndjson_file is not None:
+			print('\t[INFO] converted',str(arg),'to',full_path_to_ndjson_file)
+		sys.exit()
 	else:
 		print('\tERROR! For help please try:')
 		print('\t\tpath/to/modbus-dl.py -h')
@@ -110,9 +170,16 @@ for opt, arg in opts:
 		print('\tUsage: path/to/modbus-dl.py')
 		print('\t\t'+'-c <path to Modbus configuration file (.json format)> (--config) [REQUIRED]')
 		print('\t\t'+'-t <path to Modbus template file (.csv format)> (--template) [REQUIRED]')
+		print('\t\t'+'-m <path to Modbus manifest file (.json format) listing several config/template pairs to poll concurrently, replaces -c and -t> (--manifest) [optional]')
+		print('\t\t'+'-w <number of worker processes to spread the devices of -m over, balanced by their estimated cost, 0 for one per CPU core> (--workers) [optional]')
 		print('\t\t'+'-o <path to output log files> (--output) [optional]')
 		print('\t\t'+'-q <to be quiet and to not display the interval Modbus reads, default False> (--quiet) [optional]')
 		print('\t\t'+'-n to make modbus-dl behave as a "real-time" Modbus TCP Client without data logging (--no-data-logging) [optional]')
+		print('\t\t'+'-p to print the Modbus read plan built from the config and template files and exit (--print-plan) [optional]')
+		print('\t\t'+'-x <path to a .json log file> to convert it to a .ndjson log file (one record per line) and exit (--convert-json) [optional]')
+		print('\t\t'+'-r <path to a .mbraw capture file> to decode it into log files of the log_file_type of -c (csv by default), with the template of -t or the one stored in the capture, and exit (--decode-raw) [optional]')
+		print('\t\t'+'-M <local TCP port to serve the hot path metrics on, in the Prometheus text format at http://127.0.0.1:PORT/metrics> (--metrics-port) [optional]')
+		print('\t\t'+'-P to print the time spent in each stage of the hot path when exiting (--profile) [optional]')
 		print('\t\t'+'-h to show the help message and exit (--help) [optional]')
 		print(str(err))
 		sys.exit()
@@ -122,10 +189,96 @@ print('\t[INFO] start_local\t=', start_local.strftime(time_format))
 print('\t[INFO] start_utc\t=', start_utc.strftime(time_format))
 print('')
 
+if mbraw_capture_location is not None:
+	modbus_config = None
+	if modbus_config_location is not None:
+		modbus_config = modbus_helper.ModbusHelper.parse_json_config(modbus_config_location)
+		if modbus_config is None:
+			sys.exit()
+	decoder_helper.RawCaptureDecoder.decode(mbraw_capture_location, modbus_template_location, modbus_config, output_log_files_location)
+	sys.exit()
+
+if (modbus_manifest_location is not None) and (workers is not None) and (metrics_port is not None):
+	# each worker process instruments its own devices, their profiles are printed when they exit
+	print('\t[WARNING] the hot path metrics can not be served from several worker processes, -M is ignored')
+	metrics_port = None
+
+# the hot path is only instrumented when its metrics are served or profiled
+stage_metrics = None
+if (metrics_port is not None) or profile:
+	stage_metrics = metrics_helper.StageMetrics()
+if metrics_port is not None:
+	metrics_helper.MetricsServer(stage_metrics, metrics_port).start()
+
+if modbus_manifest_location is not None:
+	devices = modbus_helper.ModbusHelper.parse_json_manifest(modbus_manifest_location)
+	if devices is None:
+		sys.exit()
+	if print_plan:
+		for modbus_config_location, modbus_template_location in devices:
+			modbus_config = modbus_helper.ModbusHelper.parse_json_config(modbus_config_location)
+			if modbus_config is None:
+				sys.exit()
+			print('\t[INFO] read plan of',str(modbus_config_location),'with',str(modbus_template_location))
+			call_groups, interpreter_helper = modbus_helper.ModbusHelper.parse_template_build_calls(modbus_template_location, modbus_config['max_gap'], modbus_config['max_read_sizes'])
+			modbus_helper.ModbusHelper.print_read_plan(call_groups, interpreter_helper)
+		if workers is not None:
+			supervisor_helper.FleetPlan.print_plan(supervisor_helper.FleetPlan.balance(supervisor_helper.FleetPlan.estimate(devices), workers if workers > 0 else (os.cpu_count() or 1)))
+		sys.exit()
+	if workers is not None:
+		fleet_supervisor = supervisor_helper.FleetSupervisor(
+				devices=devices,
+				workers=workers,
+				full_path_to_logged_data=output_log_files_location,
+				quiet=be_quiet,
+				data_logging=data_logging,
+				profile=profile
+			)
+		fleet_supervisor.run()
+		sys.exit()
+	modbus_poller = async_helper.AsyncModbusTCPPoller(
+			devices=devices,
+			full_path_to_logged_data=output_log_files_location,
+			quiet=be_quiet,
+			data_logging=data_logging,
+			metrics=stage_metrics,
+			profile=profile
+		)
+	modbus_poller.run()
+	sys.exit()
+
+if print_plan:
+	modbus_config = modbus_helper.ModbusHelper.parse_json_config(modbus_config_location)
+	if modbus_config is None:
+		sys.exit()
+	for unit in modbus_config['units']:
+		print('\t[INFO] read plan of unit',str(unit['server_id']),'with',str(unit['template']))
+		call_groups, interpreter_helper = modbus_helper.ModbusHelper.parse_template_build_calls(unit['template'], modbus_config['max_gap'], modbus_config['max_read_sizes'])
+		modbus_helper.ModbusHelper.print_read_plan(call_groups, interpreter_helper)
+	if modbus_config['units']:
+		sys.exit()
+	call_groups, interpreter_helper = modbus_helper.ModbusHelper.parse_template_build_calls(modbus_template_location, modbus_config['max_gap'], modbus_config['max_read_sizes'])
+	modbus_helper.ModbusHelper.print_read_plan(call_groups, interpreter_helper)
+	sys.exit()
+
+if modbus_helper.ModbusHelper.config_lists_units(modbus_config_location):
+	# one connection to a Modbus TCP gateway polling all the units listed in the config
+	modbus_logger = gateway_helper.ModbusTCPGatewayDataLogger(
+			full_path_to_modbus_config_json=modbus_config_location,
+			full_path_to_logged_data=output_log_files_location,
+			quiet=be_quiet,
+			data_logging=data_logging,
+			metrics=stage_metrics,
+			profile=profile
+		)
+	sys.exit()
+
 modbus_logger = modbus_helper.ModbusTCPDataLogger(
 		full_path_to_modbus_config_json=modbus_config_location, 
 		full_path_to_modbus_template_csv=modbus_template_location, 
 		full_path_to_logged_data=output_log_files_location, 
 		quiet=be_quiet,
-		data_logging=data_logging
+		data_logging=data_logging,
+		metrics=stage_metrics,
+		profile=profile
 	)		
\ No newline at end of file
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+import sys, getopt
+from scripts import simulator_helper
+
+argv = sys.argv[1:]
+
+short_options = 't:a:p:l:j:e:x:r:i:h'
+long_options = ['template=','address=','port=','latency=','jitter=','error-rate=','exception-rate=','replay=','replay-interval=','help']
+
+def print_usage():
+	print('\tUsage: path/to/modbus-sim.py')
+	print('\t\t'+'-t <path to Modbus template file (.csv format) defining the tags to serve> (--template) [optional]')
+	print('\t\t'+'-a <IP address to listen on, default 127.0.0.1> (--address) [optional]')
+	print('\t\t'+'-p <TCP port to listen on, default 5020> (--port) [optional]')
+	print('\t\t'+'-l <latency in milliseconds added to each response, default 0> (--latency) [optional]')
+	print('\t\t'+'-j <jitter in milliseconds, +/- around the latency, default 0> (--jitter) [optional]')
+	print('\t\t'+'-e <probability [0,1] to drop the connection instead of answering a request, default 0> (--error-rate) [optional]')
+	print('\t\t'+'-x <probability [0,1] to answer a request with a Modbus exception (Server Device Failure), default 0> (--exception-rate) [optional]')
+	print('\t\t'+'-r <path to a modbus-dl log file (.csv, .json or .ndjson) to replay instead of synthetic values> (--replay) [optional]')
+	print('\t\t'+'-i <seconds between two (2) replayed records, default 1> (--replay-interval) [optional]')
+	print('\t\t'+'-h to show the help message and exit (--help) [optional]')
+
+try:
+	opts, args = getopt.getopt(argv,short_options,long_options)
+except getopt.error as err:
+	print('\tERROR! For help please try:')
+	print('\t\tpath/to/modbus-sim.py -h')
+	print('')
+	print_usage()
+	print(str(err))
+	sys.exit()
+
+# Set some defaults
+modbus_template_location = None
+address = '127.0.0.1'
+port = 5020
+latency_seconds = 0
+jitter_seconds = 0
+error_rate = 0
+exception_rate = 0
+replay_log_location = None
+replay_interval_seconds = 1
+
+try:
+	for opt, arg in opts:
+		if opt in ('-h', '--help'):
+			print('Usage: modbus-sim.py [-h] [-t TEMPLATE_FILE] [-a ADDRESS] [-p PORT] [-l LATENCY_MS] [-j JITTER_MS] [-e ERROR_RATE] [-x EXCEPTION_RATE] [-r REPLAY_LOG_FILE] [-i REPLAY_INTERVAL]')
+			print('')
+			print('Local Modbus TCP Server simulator answering FC01 to FC04 read requests, the tags of the template are served with synthetic or replayed values')
+			print('')
+			print_usage()
+			sys.exit()
+		elif opt in ('-t', '--template'):
+			modbus_template_location = str(arg)
+		elif opt in ('-a', '--address'):
+			address = str(arg)
+		elif opt in ('-p', '--port'):
+			port = int(arg)
+		elif opt in ('-l', '--latency'):
+			latency_seconds = float(arg) / 1000
+		elif opt in ('-j', '--jitter'):
+			jitter_seconds = float(arg) / 1000
+		elif opt in ('-e', '--error-rate'):
+			error_rate = float(arg)
+		elif opt in ('-x', '--exception-rate'):
+			exception_rate = float(arg)
+		elif opt in ('-r', '--replay'):
+			replay_log_location = str(arg)
+		elif opt in ('-i', '--replay-interval'):
+			replay_interval_seconds = float(arg)
+except ValueError as err:
+	print('\tERROR!',str(err))
+	print_usage()
+	sys.exit()
+
+modbus_simulator = simulator_helper.ModbusTCPSimulator(
+		full_path_to_modbus_template_csv=modbus_template_location,
+		host=address,
+		port=port,
+		latency_seconds=latency_seconds,
+		jitter_seconds=jitter_seconds,
+		error_rate=error_rate,
+		exception_rate=exception_rate,
+		full_path_to_replay_log=replay_log_location,
+		replay_interval_seconds=replay_interval_seconds
+	)
+modbus_simulator.serve_forever()
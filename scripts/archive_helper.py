@@ -0,0 +1,152 @@
+import os, time, glob, threading, queue, shutil, gzip, bz2, lzma
+
+# background compression of the rotated log files: the rotated file is handed over to a low priority thread that compresses it next to
+# itself (<rotated file>.gz, .bz2 or .xz) and deletes it, so that neither the poll loop nor the log writer ever waits on the compression
+# the compressed file is written as <compressed file>.tmp, forced to the storage and renamed, it is either complete or absent;
+# the temporary files and the rotated files left uncompressed by a logger that did not exit gracefully are picked up at the next start
+class RotatedFileCompressor(object):
+
+	# method: (extension of the compressed file, compressing writer over an open binary file)
+	METHODS = {
+		'gzip': ('.gz', lambda raw_file, file_name: gzip.GzipFile(filename=file_name, mode='wb', compresslevel=6, fileobj=raw_file)),
+		'bz2': ('.bz2', lambda raw_file, file_name: bz2.BZ2File(raw_file, 'wb', compresslevel=9)),
+		'lzma': ('.xz', lambda raw_file, file_name: lzma.LZMAFile(raw_file, 'wb', preset=6))
+	}
+	TEMPORARY_SUFFIX = '.tmp'
+	CHUNK_BYTES = 1048576
+	# nice value of the compression thread, Linux threads have their own (the I/O priority follows it unless set otherwise)
+	NICE = 19
+
+	# sentinel put on the queue to stop the compression thread once all the files before it are compressed
+	STOP = object()
+
+	def __init__(self, method='gzip', name='compressor'):
+		if method not in RotatedFileCompressor.METHODS:
+			print('\t[WARNING] in RotatedFileCompressor: unknown method "'+str(method)+'", supported are',list(RotatedFileCompressor.METHODS))
+			print('\t[WARNING] will default to "gzip"')
+			method = 'gzip'
+		self.method = method
+		self.extension = RotatedFileCompressor.METHODS[method][0]
+		self.name = name
+		# unbounded, handing a rotated file over never blocks
+		self.queue = queue.Queue()
+		self.thread = None
+		self.stats_lock = threading.Lock()
+		self.stats = {
+			'files_queued': 0,
+			'files_compressed': 0,
+			'compress_errors': 0,
+			'last_error': None,
+			'bytes_in': 0,
+			'bytes_out': 0,
+			'compress_seconds_total': 0.0,
+			'compress_seconds_max': 0.0
+		}
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name=str(self.name)+' compressor', daemon=True)
+		self.thread.start()
+
+	def compressed_path(self, full_path_to_rotated_file):
+		return full_path_to_rotated_file+self.extension
+
+	# Method to hand a rotated file over to the compression thread
+	def put(self, full_path_to_rotated_file):
+		self.queue.put(full_path_to_rotated_file)
+		with self.stats_lock:
+			self.stats['files_queued'] += 1
+
+	# Method to delete the temporary files and queue the rotated files left over in log_file_location by a logger that did not exit gracefully,
+	# named log_file_name_<time of the rotation>.log_file_type (at least 10 digits, the seconds since the Unix epoch of the former naming)
+	# the files of other logs sharing the prefix (ex: plant_a and plant_rollup_60s of plant) are left alone
+	def recover(self, log_file_location, log_file_name, log_file_type):
+		prefix = os.path.join(log_file_location, log_file_name+'_')
+		for extension, writer in RotatedFileCompressor.METHODS.values():
+			suffix = '.'+log_file_type+extension+RotatedFileCompressor.TEMPORARY_SUFFIX
+			for full_path_to_temporary_file in glob.glob(glob.escape(prefix)+'*'+suffix):
+				if RotatedFileCompressor.is_rotation_time(full_path_to_temporary_file[len(prefix):-len(suffix)]):
+					os.remove(full_path_to_temporary_file)
+		for full_path_to_rotated_file in sorted(glob.glob(glob.escape(prefix)+'*.'+log_file_type)):
+			if RotatedFileCompressor.is_rotation_time(full_path_to_rotated_file[len(prefix):-len('.'+log_file_type)]):
+				self.put(full_path_to_rotated_file)
+
+	@classmethod
+	def is_rotation_time(cls, rotation_time):
+		return rotation_time.isdigit() and (len(rotation_time) >= 10)
+
+	# compression thread: compresses one rotated file at a time, a failed compression is counted and reported, the rotated file is kept
+	def run(self):
+		try:
+			os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), RotatedFileCompressor.NICE)
+		except (AttributeError, OSError):
+			pass
+		while True:
+			full_path_to_rotated_file = self.queue.get()
+			if full_path_to_rotated_file is RotatedFileCompressor.STOP:
+				self.queue.task_done()
+				return
+			started = time.monotonic()
+			try:
+				bytes_in, bytes_out = self.compress(full_path_to_rotated_file)
+			except Exception as err:
+				with self.stats_lock:
+					self.stats['compress_errors'] += 1
+					self.stats['last_error'] = repr(err)
+				print('\t[ERROR] '+str(self.name)+': failed compressing',str(full_path_to_rotated_file),'with',repr(err))
+			else:
+				compress_seconds = time.monotonic() - started
+				with self.stats_lock:
+					self.stats['files_compressed'] += 1
+					self.stats['bytes_in'] += bytes_in
+					self.stats['bytes_out'] += bytes_out
+					self.stats['compress_seconds_total'] += compress_seconds
+					self.stats['compress_seconds_max'] = max(self.stats['compress_seconds_max'], compress_seconds)
+			self.queue.task_done()
+
+	# Method to compress one rotated file and delete it, it returns the sizes of the rotated and compressed files
+	def compress(self, full_path_to_rotated_file):
+		full_path_to_compressed_file = self.compressed_path(full_path_to_rotated_file)
+		full_path_to_temporary_file = full_path_to_compressed_file+RotatedFileCompressor.TEMPORARY_SUFFIX
+		writer = RotatedFileCompressor.METHODS[self.method][1]
+		try:
+			with open(full_path_to_rotated_file, 'rb') as rotated_file, open(full_path_to_temporary_file, 'wb') as raw_file:
+				with writer(raw_file, os.path.basename(full_path_to_rotated_file)) as compressed_file:
+					shutil.copyfileobj(rotated_file, compressed_file, RotatedFileCompressor.CHUNK_BYTES)
+				raw_file.flush()
+				os.fsync(raw_file.fileno())
+			os.replace(full_path_to_temporary_file, full_path_to_compressed_file)
+		except BaseException:
+			if os.path.exists(full_path_to_temporary_file):
+				os.remove(full_path_to_temporary_file)
+			raise
+		# the rename is forced to the storage before the rotated file is deleted
+		directory = os.open(os.path.dirname(full_path_to_compressed_file) or '.', os.O_RDONLY)
+		try:
+			os.fsync(directory)
+		finally:
+			os.close(directory)
+		bytes_in = os.path.getsize(full_path_to_rotated_file)
+		os.remove(full_path_to_rotated_file)
+		return bytes_in, os.path.getsize(full_path_to_compressed_file)
+
+	# Method to compress all the queued files and stop the compression thread, to be called when exiting
+	# the files not compressed within timeout seconds are left rotated, they are compressed at the next start
+	def close(self, timeout=None):
+		if (self.thread is None) or (not self.thread.is_alive()):
+			return
+		self.queue.put(RotatedFileCompressor.STOP)
+		self.thread.join(timeout)
+		if self.thread.is_alive():
+			print('\t[WARNING] '+str(self.name)+': compressor thread still busy after',str(timeout),'seconds,',str(self.queue.qsize()),'file(s) left to compress at the next start')
+
+	# Method to return a summary of the compression statistics gathered so far
+	def get_stats(self):
+		with self.stats_lock:
+			stats = dict(self.stats)
+		stats['queue_depth'] = self.queue.qsize()
+		stats['compression_ratio'] = round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None
+		return stats
+
+	def print_stats(self):
+		for key, value in self.get_stats().items():
+			print('\t[INFO] '+str(self.name)+' compressor '+str(key)+':', str(value))
@@ -0,0 +1,393 @@
+import os, sys, asyncio, datetime, time, signal
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper, ModbusDataLog, ModbusTCPTransport
+from schedule_helper import PollScheduler, ScanClassSchedule
+from metrics_helper import StageMetrics
+from connection_helper import ReconnectBackoff, ConnectionHealth
+from history_helper import RecordHistory
+from snapshot_helper import SnapshotPublisher
+from umodbus.exceptions import ModbusError, ServerDeviceBusyError
+
+# one Modbus TCP Server polled on its own schedule over a non-blocking asyncio connection
+class AsyncModbusTCPDevice:
+	def __init__(self, full_path_to_modbus_config_json, full_path_to_modbus_template_csv, full_path_to_logged_data, quiet=True, data_logging=True, metrics=None):
+		self.modbus_config = ModbusHelper.parse_json_config(full_path_to_modbus_config_json)
+		if self.modbus_config is None:
+			print('\t[ERROR] An error occured while parsing the Modbus json configuration file:',str(full_path_to_modbus_config_json))
+			return
+		if self.modbus_config['log_file_type'] == 'mbraw':
+			print('\t[ERROR] raw captures (log_file_type "mbraw") are only supported when polling a single Modbus TCP Server, not from a manifest:',str(full_path_to_modbus_config_json))
+			self.modbus_config = None
+			return
+		self.name = str(self.modbus_config['log_file_name'])+' @ '+str(self.modbus_config['server_ip'])+':'+str(self.modbus_config['server_port'])+' ID '+str(self.modbus_config['server_id'])
+		# DeviceMetrics of the hot path stages, None when not instrumented
+		self.metrics = None
+		if metrics is not None:
+			self.metrics = metrics.device(self.modbus_config['log_file_name'])
+		self.call_groups, self.interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv, self.modbus_config['max_gap'], self.modbus_config['max_read_sizes'])
+		self.transactions = ModbusHelper.build_transactions(self.call_groups, self.interpreter_helper, self.modbus_config['server_id'])
+		self.transaction_id = 0
+		# maximum number of requests in flight on the connection, 1 for serial request/response transactions
+		self.pipeline_depth = self.modbus_config['pipeline_depth']
+		self.sent_at = [0.0]*len(self.transactions)
+		self.scan_class_schedule = ScanClassSchedule(self.transactions, self.modbus_config['poll_interval_seconds'])
+		self.latest_values = {}
+		self.quiet = quiet
+		self.data_log = None
+		if data_logging:
+			self.data_log = ModbusDataLog(
+					self.modbus_config,
+					full_path_to_logged_data,
+					ModbusHelper.record_column_types(self.interpreter_helper),
+					ModbusHelper.record_compression_settings(self.interpreter_helper),
+					self.metrics
+				)
+		# in-memory history of the last history_records records, None when disabled
+		self.history = None
+		if self.modbus_config['history_records'] > 0:
+			self.history = RecordHistory.build(ModbusHelper.record_column_types(self.interpreter_helper), self.modbus_config['history_records'])
+		# latest record published to a shared memory block for the other local processes, None when disabled
+		self.snapshot = None
+		if self.modbus_config['snapshot_name'] is not None:
+			self.snapshot = SnapshotPublisher(self.modbus_config['snapshot_name'], ModbusHelper.record_column_types(self.interpreter_helper))
+		self.poll_scheduler = PollScheduler(
+				interval_seconds=self.scan_class_schedule.base_interval_seconds,
+				overrun_policy=self.modbus_config['overrun_policy'],
+				align_to_interval=self.modbus_config['align_poll_interval']
+			)
+		self.reader = None
+		self.writer = None
+		# connect latency, outages and reconnect schedule, a broken connection is re-opened with a jittered exponential backoff
+		self.health = ConnectionHealth(ReconnectBackoff(
+				initial_seconds=self.modbus_config['reconnect_initial_seconds'],
+				max_seconds=self.modbus_config['reconnect_max_seconds'],
+				jitter=self.modbus_config['reconnect_jitter']
+			))
+		self.stats = {
+			'cycles': 0,
+			'errors': 0,
+			'last_error': None
+		}
+
+	async def connect(self):
+		started = time.perf_counter()
+		self.reader, self.writer = await asyncio.wait_for(
+				asyncio.open_connection(self.modbus_config['server_ip'], self.modbus_config['server_port']),
+				timeout=self.modbus_config['server_timeout_seconds']
+			)
+		connect_seconds = time.perf_counter() - started
+		self.health.connect_succeeded(connect_seconds)
+		if self.metrics is not None:
+			self.metrics.observe('connect', connect_seconds)
+
+	# Method to (re)connect when the backoff allows it, without raising: it returns True when connected
+	async def try_connect(self):
+		if self.writer is not None:
+			return True
+		if not self.health.reconnect_due():
+			return False
+		try:
+			await self.connect()
+		except (OSError, asyncio.TimeoutError) as err:
+			delay = self.health.connect_failed(err)
+			print('\t[WARNING] '+self.name+': unable to connect -',repr(err)+', next connection attempt in',str(round(delay, 2)),'seconds')
+			return False
+		if self.health.stats['connects'] > 1:
+			print('\t[INFO] '+self.name+': reconnected after an outage of',str(round(self.health.stats['outage_seconds_last'], 2)),'seconds')
+		return True
+
+	async def disconnect(self):
+		if self.writer is not None:
+			self.writer.close()
+			try:
+				await self.writer.wait_closed()
+			except OSError:
+				pass
+		self.reader = None
+		self.writer = None
+
+	# Method to write the prebuilt read requests of the transactions listed by index, in a single write when there are several
+	def send_requests(self, transaction_indexes, in_flight):
+		if self.metrics is not None:
+			started = time.perf_counter()
+		frames = []
+		for transaction_index in transaction_indexes:
+			request_frame = self.transactions[transaction_index]['request_frame']
+			self.transaction_id = (self.transaction_id + 1) & 0xFFFF
+			ModbusTCPTransport.TRANSACTION_ID.pack_into(request_frame, 0, self.transaction_id)
+			in_flight[self.transaction_id] = transaction_index
+			frames.append(request_frame)
+		if len(frames) > 1:
+			frames = [b''.join(frames)]
+		if self.metrics is not None:
+			sent = time.perf_counter()
+			self.metrics.observe('request_build', sent - started)
+			self.metrics.inc('modbus_requests_total', len(transaction_indexes))
+			self.metrics.inc('modbus_bytes_sent_total', len(frames[0]))
+			for transaction_index in transaction_indexes:
+				self.sent_at[transaction_index] = sent
+		self.writer.write(frames[0])
+
+	# Method to receive one response, matched to its request in flight by MBAP transaction ID, and decode it
+	async def receive_response(self, in_flight):
+		transaction_id, protocol_id, length, unit_id = ModbusTCPTransport.MBAP_HEADER.unpack(await self.reader.readexactly(7))
+		if transaction_id not in in_flight:
+			raise ValueError('unexpected transaction ID '+str(transaction_id)+' in response')
+		transaction_index = in_flight.pop(transaction_id)
+		transaction = self.transactions[transaction_index]
+		if unit_id != transaction['request_frame'][6]:
+			raise ValueError('unexpected unit ID '+str(unit_id)+' in response to transaction ID '+str(transaction_id))
+		if (length < 3) or (length - 1 > len(transaction['response_buffer'])):
+			raise ValueError('unexpected response length '+str(length)+' for transaction ID '+str(transaction_id))
+		response_pdu = await self.reader.readexactly(length - 1)
+		ModbusHelper.check_response_pdu(transaction, response_pdu)
+		if self.metrics is not None:
+			# with many devices on one event loop, the round trip also holds the time waiting for the loop to resume this device
+			received = time.perf_counter()
+			self.metrics.observe('round_trip', received - self.sent_at[transaction_index], transaction['call_group'])
+			self.metrics.inc('modbus_bytes_received_total', 6 + length)
+		interpreted_response = ModbusHelper.decode_response(transaction['decode_plan'], ModbusHelper.response_pdu_payload(response_pdu))
+		if self.metrics is not None:
+			self.metrics.observe('interpret_response', time.perf_counter() - received, transaction['call_group'])
+		return interpreted_response
+
+	# Method to read the transactions listed by index with up to pipeline_depth requests written ahead of their responses,
+	# each response being awaited for at most server_timeout_seconds
+	# it returns the interpreted responses merged in one dict, a failed cycle leaves latest_values untouched
+	# a Modbus exception response is raised once all the responses in flight are read, so that the connection stays in sync
+	async def read_transactions(self, transaction_indexes):
+		interpreted_responses = {}
+		in_flight = {}
+		modbus_error = None
+		next_transaction = 0
+		transaction_count = len(transaction_indexes)
+		while (next_transaction < transaction_count) or in_flight:
+			window = min(self.pipeline_depth - len(in_flight), transaction_count - next_transaction)
+			if window > 0:
+				self.send_requests(transaction_indexes[next_transaction:next_transaction + window], in_flight)
+				await self.writer.drain()
+				next_transaction += window
+			try:
+				interpreted_responses.update(await asyncio.wait_for(self.receive_response(in_flight), timeout=self.modbus_config['server_timeout_seconds']))
+			except ModbusError as err:
+				if modbus_error is None:
+					modbus_error = err
+		if modbus_error is not None:
+			raise modbus_error
+		return interpreted_responses
+
+	# Method to read the due transactions, falling back once to serial transactions when the Modbus TCP Server fails on pipelined requests
+	async def poll_transactions(self, due_transactions):
+		try:
+			return await self.read_transactions(due_transactions)
+		except (OSError, EOFError, ValueError, asyncio.TimeoutError, ServerDeviceBusyError) as err:
+			if self.pipeline_depth == 1:
+				raise
+			# some servers and gateways only handle one transaction at a time, fall back to serial transactions on a fresh connection
+			# the connection dropped for it is recorded as lost, as any other
+			print('\t[WARNING] '+self.name+': pipelined poll failed with',repr(err))
+			self.health.connection_lost(err)
+			if self.metrics is not None:
+				self.metrics.inc('modbus_connections_lost_total')
+			pipeline_depth = self.pipeline_depth
+			self.pipeline_depth = 1
+			await self.disconnect()
+			try:
+				await self.connect()
+			except (OSError, asyncio.TimeoutError) as connect_err:
+				# the next attempt follows the reconnect backoff, the connection is already recorded as lost
+				self.pipeline_depth = pipeline_depth
+				self.health.connect_failed(connect_err)
+				raise
+			try:
+				interpreted_responses = await self.read_transactions(due_transactions)
+			except (OSError, EOFError, ValueError, asyncio.TimeoutError):
+				# serial requests fail as well, the connection was lost: keep on pipelining once reconnected
+				self.pipeline_depth = pipeline_depth
+				raise
+			print('\t[WARNING] '+self.name+': Modbus TCP Server does not seem to support pipelined requests, falling back to serial requests')
+			return interpreted_responses
+
+	# Method to build the record of a poll cycle that could not read the Modbus TCP Server: timestamps and quality only, no tag values
+	def bad_quality_record(self, err, ts_utc, ts_local, time_format, timestamp_ns):
+		self.stats['errors'] += 1
+		self.health.stats['bad_quality_records'] += 1
+		if err is not None:
+			self.stats['last_error'] = repr(err)
+		if self.metrics is not None:
+			self.metrics.inc('modbus_poll_errors_total')
+		return {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_BAD, 'timestamp_ns': timestamp_ns}
+
+	# Method to poll the scan classes due at this tick and return a record with the latest value of every tag, None when no scan class is due
+	# a cycle that fails returns a quality-bad record, a lost connection is re-opened on the following cycles with a jittered exponential backoff
+	async def cycle_poll(self, time_format = '%Y-%m-%d %H:%M:%S%z'):
+		due_transactions = self.scan_class_schedule.due()
+		if not due_transactions:
+			return None
+		if self.metrics is not None:
+			started = time.perf_counter()
+		timestamp_ns = time.time_ns()
+		ts_local = datetime.datetime.fromtimestamp(timestamp_ns / 1000000000).astimezone()
+		ts_utc = ts_local.astimezone(datetime.timezone.utc)
+		if not await self.try_connect():
+			return self.bad_quality_record(None, ts_utc, ts_local, time_format, timestamp_ns)
+		try:
+			interpreted_responses = await self.poll_transactions(due_transactions)
+		except ModbusError as err:
+			# the exception response was read in full, the connection is still usable
+			print('\t[WARNING] '+self.name+': Modbus TCP Server answered with an exception:',repr(err))
+			return self.bad_quality_record(err, ts_utc, ts_local, time_format, timestamp_ns)
+		except (OSError, EOFError, ValueError, asyncio.TimeoutError) as err:
+			print('\t[WARNING] '+self.name+': connection lost:',repr(err))
+			# not connected anymore when the serial fallback could not reconnect, its connection loss and failed attempt are already recorded
+			if self.writer is not None:
+				self.health.connection_lost(err)
+				if self.metrics is not None:
+					self.metrics.inc('modbus_connections_lost_total')
+			await self.disconnect()
+			return self.bad_quality_record(err, ts_utc, ts_local, time_format, timestamp_ns)
+		if self.metrics is not None:
+			polled = time.perf_counter()
+		self.latest_values.update(interpreted_responses)
+		combined_responses = {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_GOOD, 'timestamp_ns': timestamp_ns}
+		combined_responses.update(self.latest_values)
+		if self.metrics is not None:
+			combined = time.perf_counter()
+			self.metrics.observe('combine_tag_responses', combined - polled)
+			self.metrics.observe('cycle', combined - started)
+		return combined_responses
+
+	# Method to poll the Modbus TCP Server forever; a failure only closes this device's connection, which is re-opened with a backoff
+	# an unexpected error of a cycle (ex: writing the log file) is reported and the device carries on at its next poll deadline,
+	# so that it never stops the other devices polled on the same event loop
+	async def run(self):
+		while True:
+			missed_deadlines = await self.poll_scheduler.async_wait()
+			if missed_deadlines and not self.quiet:
+				print('\t[WARNING] '+self.name+': previous poll cycle overran the poll interval,',str(missed_deadlines),'poll deadline(s) skipped')
+			try:
+				await self.run_cycle()
+			except Exception as err:
+				self.stats['errors'] += 1
+				self.stats['last_error'] = repr(err)
+				print('\t[ERROR] '+self.name+': poll cycle failed with',repr(err))
+
+	# Method to poll one cycle and hand its record over to the data log, the history, the snapshot and the console
+	async def run_cycle(self):
+		modbus_poll_response = await self.cycle_poll()
+		if modbus_poll_response is None:
+			return
+		if modbus_poll_response['quality'] == ModbusHelper.QUALITY_GOOD:
+			self.stats['cycles'] += 1
+			if self.metrics is not None:
+				self.metrics.inc('modbus_cycles_total')
+		if self.data_log is not None:
+			self.data_log.append(modbus_poll_response)
+		if self.history is not None:
+			self.history.append(modbus_poll_response)
+		if self.snapshot is not None:
+			self.snapshot.publish(modbus_poll_response)
+		if not self.quiet:
+			if self.metrics is not None:
+				started = time.perf_counter()
+			print('\t[INFO] '+self.name)
+			ModbusHelper.pretty_print(modbus_poll_response)
+			if self.metrics is not None:
+				self.metrics.observe('pretty_print', time.perf_counter() - started)
+
+	# Method to return a summary of the throughput and health of this device, ex: reported by the worker processes of a FleetSupervisor
+	def get_stats(self):
+		stats = {'name': self.name}
+		stats.update(self.stats)
+		health_stats = self.health.get_stats()
+		for key in ['connected', 'bad_quality_records', 'outages', 'outage_seconds_total']:
+			stats[key] = health_stats[key]
+		stats['late_cycles'] = self.poll_scheduler.stats['late_cycles']
+		stats['missed_deadlines'] = self.poll_scheduler.stats['missed_deadlines']
+		if (self.data_log is not None) and (self.data_log.writer is not None):
+			writer_stats = self.data_log.writer.get_stats()
+			stats['writer_queue_depth'] = writer_stats['queue_depth']
+			stats['batches_dropped'] = writer_stats['batches_dropped']
+		return stats
+
+	def print_stats(self):
+		print('\t[INFO] '+self.name+':',', '.join(str(key)+'='+str(value) for key, value in self.stats.items()))
+		self.poll_scheduler.print_stats()
+		self.health.print_stats()
+		if self.data_log is not None:
+			self.data_log.print_stats()
+		if self.snapshot is not None:
+			self.snapshot.print_stats()
+
+# many Modbus TCP Servers polled concurrently from a single process and a single thread
+class AsyncModbusTCPPoller:
+	# metrics is an optional StageMetrics instrumenting the hot path of every device, its per-stage breakdown is printed when exiting with profile=True
+	# report is an optional callable handed the list of the get_stats() of every device each report_interval_seconds seconds and when exiting
+	def __init__(self, devices=None, full_path_to_logged_data=None, quiet=True, data_logging=True, metrics=None, profile=False, report=None, report_interval_seconds=10):
+		if not devices:
+			print('\t[ERROR] no devices provided to AsyncModbusTCPPoller, please provide a list of (config, template) pairs')
+			return
+		if full_path_to_logged_data is None:
+			full_path_to_logged_data = ModbusHelper.default_log_file_location()
+		if profile and (metrics is None):
+			metrics = StageMetrics()
+		self.metrics = metrics
+		self.profile = profile
+		self.report = report
+		self.report_interval_seconds = report_interval_seconds
+		self.devices = []
+		log_file_names = []
+		for full_path_to_modbus_config_json, full_path_to_modbus_template_csv in devices:
+			device = AsyncModbusTCPDevice(full_path_to_modbus_config_json, full_path_to_modbus_template_csv, full_path_to_logged_data, quiet, data_logging, metrics)
+			if device.modbus_config is None:
+				print('\t[WARNING] Skipping device configured in',str(full_path_to_modbus_config_json))
+				continue
+			# two devices writing to the same live log file would corrupt it
+			if data_logging and (device.modbus_config['log_file_name'] in log_file_names):
+				print('\t[ERROR] "log_file_name" of',str(full_path_to_modbus_config_json),'is already used by another device:',str(device.modbus_config['log_file_name']))
+				print('\t[WARNING] Skipping device configured in',str(full_path_to_modbus_config_json))
+				continue
+			log_file_names.append(device.modbus_config['log_file_name'])
+			self.devices.append(device)
+		print('\t[INFO] AsyncModbusTCPPoller will poll',str(len(self.devices)),'Modbus TCP Server(s)')
+
+	async def run_all(self):
+		coroutines = [device.run() for device in self.devices]
+		if (self.report is not None) and self.devices:
+			coroutines.append(self.run_report())
+		await asyncio.gather(*coroutines)
+
+	# Method to report the stats of every device each report_interval_seconds seconds
+	async def run_report(self):
+		while True:
+			await asyncio.sleep(self.report_interval_seconds)
+			try:
+				self.report([device.get_stats() for device in self.devices])
+			except Exception as err:
+				print('\t[ERROR] AsyncModbusTCPPoller: report failed with',repr(err))
+
+	# Method to run all the devices until Ctrl+C (or SIGTERM), then write the buffered records of every device to disk
+	# the logs are closed whatever stopped the event loop, the error of a device that could not be closed does not prevent closing the others
+	def run(self):
+		signal.signal(signal.SIGTERM, signal.default_int_handler)
+		print('Press Ctrl+C to stop and exit gracefully...')
+		try:
+			asyncio.run(self.run_all())
+		except KeyboardInterrupt:
+			print('\nYou pressed Ctrl+C!')
+		finally:
+			for device in self.devices:
+				try:
+					if device.data_log is not None:
+						device.data_log.close()
+					if device.snapshot is not None:
+						device.snapshot.close()
+				except Exception as err:
+					print('\t[ERROR] '+device.name+': failed closing its logs with',repr(err))
+				device.print_stats()
+		if self.report is not None:
+			# last report, with the records written when exiting
+			self.report([device.get_stats() for device in self.devices])
+		if self.profile:
+			self.metrics.print_profile()
+		print('Bye!')
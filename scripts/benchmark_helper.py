@@ -0,0 +1,177 @@
+import os, sys, time, json, tempfile, shutil, resource, multiprocessing
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper, ModbusTCPClient, ModbusDataLog
+from simulator_helper import ModbusTCPSimulator
+from capture_helper import RawCaptureFormat
+from data_helper import DataHelper
+
+# end-to-end throughput benchmark of the polling hot path against the local ModbusTCPSimulator
+# each case polls as fast as possible for duration_seconds and reports cycles/s, decode time per tag, bytes written per record and peak RSS
+class ModbusBenchmark(object):
+
+	# data types cycled through by the synthetic templates, with the read_type they are polled with
+	SYNTHETIC_TAG_TYPES = [
+		('HR', 'float32'),
+		('HR', 'uint16'),
+		('HR', 'sint16'),
+		('IR', 'float32'),
+		('IR', 'float64'),
+		('HR', 'packedbool'),
+		('IR', 'rfloat32_word_swap'),
+		('DI', 'di'),
+		('Coil', 'coil')
+	]
+
+	SYNTHETIC_TAG_COUNTS = [10, 100, 1000, 10000]
+
+	# Method to write a synthetic template of tag_count tags, each function code filled with contiguous addresses
+	@classmethod
+	def synthetic_template(cls, tag_count, full_path_to_modbus_template_csv):
+		next_address = {}
+		template_lod = []
+		for tag_index in range(tag_count):
+			read_type, data_type = cls.SYNTHETIC_TAG_TYPES[tag_index % len(cls.SYNTHETIC_TAG_TYPES)]
+			address = next_address.get(read_type, 0)
+			next_address[read_type] = address + ModbusHelper.DATA_TYPES_REGISTER_COUNT[data_type]
+			template_lod.append({
+				'address': address,
+				'read_type': read_type,
+				'data_type': data_type,
+				'tag_name': 'tag_'+str(tag_index)+'_'+data_type,
+				'scaling_coeff': '1.5' if tag_index % 4 == 0 else '',
+				'scaling_offset': ''
+			})
+		DataHelper.lod_to_csv(template_lod, full_path_to_modbus_template_csv)
+		return full_path_to_modbus_template_csv
+
+	# Method to list the sample templates shipped in the template/ folder
+	@classmethod
+	def sample_templates(cls):
+		template_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'template')
+		return sorted(os.path.join(template_folder, file_name) for file_name in os.listdir(template_folder) if file_name.endswith('.csv'))
+
+	# Method to serve a template from a simulator in its own process, the port it listens on is put on the ports queue
+	@classmethod
+	def serve_simulator(cls, ports, full_path_to_modbus_template_csv, latency_seconds=0):
+		sys.stdout = open(os.devnull, 'w')
+		simulator = ModbusTCPSimulator(full_path_to_modbus_template_csv, port=0, latency_seconds=latency_seconds)
+		simulator.build_server()
+		ports.put(simulator.port)
+		simulator.server.serve_forever()
+
+	# Method to run one benchmark case against a simulator serving the same template from another process, so that both do not share the GIL
+	# meant to run in its own process (see run_isolated)
+	@classmethod
+	def run_case(cls, full_path_to_modbus_template_csv, duration_seconds=5, log_file_type='csv', pipeline_depth=1, max_gap=0, latency_seconds=0, decode_rounds=200):
+		context = multiprocessing.get_context('spawn')
+		ports = context.Queue()
+		simulator = context.Process(target=cls.serve_simulator, args=(ports, full_path_to_modbus_template_csv, latency_seconds), daemon=True)
+		simulator.start()
+		port = ports.get(timeout=60)
+		client = ModbusTCPClient(server_ip='127.0.0.1', server_port=port, server_id=1, poll_interval_seconds=1, pipeline_depth=pipeline_depth)
+		client.load_template(full_path_to_modbus_template_csv, max_gap)
+		client.connect(5)
+		log_folder = tempfile.mkdtemp(prefix='modbus-bench-')
+		modbus_config = dict(ModbusHelper.CONFIG_DEFAULTS)
+		modbus_config.update({
+			'log_file_type': log_file_type,
+			'log_file_name': 'bench',
+			'in_memory_records': 100,
+			'file_rotation': {'max_file_records': 1000000},
+			'json_indent': None,
+			'writer_queue_size': 0
+		})
+		# with log_file_type "mbraw" the responses are captured without being decoded
+		capture = (log_file_type == 'mbraw')
+		raw_capture_schema = None
+		if capture:
+			raw_capture_schema = RawCaptureFormat.build_schema(client.transactions, DataHelper.csv_to_lod(full_path_to_modbus_template_csv), 1)
+		data_log = ModbusDataLog(modbus_config, log_folder, ModbusHelper.record_column_types(client.interpreter_helper), None, None, raw_capture_schema)
+		try:
+			tag_count = len(ModbusHelper.record_column_types(client.interpreter_helper))
+			cycles = 0
+			started = time.perf_counter()
+			while time.perf_counter() - started < duration_seconds:
+				data_log.append(client.cycle_poll(capture=capture))
+				cycles += 1
+			elapsed = time.perf_counter() - started
+			data_log.close()
+			bytes_written = sum(os.path.getsize(os.path.join(log_folder, file_name)) for file_name in os.listdir(log_folder))
+
+			# decode only: the responses of the last poll are still in the receive buffers of the transactions
+			decode_started = time.perf_counter()
+			for decode_round in range(decode_rounds):
+				for transaction in client.transactions:
+					ModbusHelper.decode_response(transaction['decode_plan'], transaction['response_buffer'], 2)
+			decode_seconds = (time.perf_counter() - decode_started) / decode_rounds
+		finally:
+			client.disconnect()
+			simulator.terminate()
+			simulator.join()
+			shutil.rmtree(log_folder, ignore_errors=True)
+		return {
+			'template': os.path.basename(full_path_to_modbus_template_csv),
+			'columns': tag_count,
+			'read_requests': len(client.transactions),
+			'log_file_type': log_file_type,
+			'pipeline_depth': pipeline_depth,
+			'cycles': cycles,
+			'cycles_per_second': cycles / elapsed,
+			'decode_us_per_column': 1e6 * decode_seconds / max(1, tag_count),
+			'bytes_per_record': bytes_written / max(1, cycles),
+			# ru_maxrss is in kilobytes on Linux
+			'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+		}
+
+	@classmethod
+	def run_case_into_queue(cls, results, *args):
+		# the client and the template parsing are verbose, only the results are reported
+		sys.stdout = open(os.devnull, 'w')
+		try:
+			results.put(cls.run_case(*args))
+		except Exception as err:
+			results.put({'template': os.path.basename(args[0]), 'error': repr(err)})
+
+	# Method to run one benchmark case in a fresh process, so that the peak RSS of each case is its own
+	@classmethod
+	def run_isolated(cls, *args):
+		context = multiprocessing.get_context('spawn')
+		results = context.Queue()
+		process = context.Process(target=cls.run_case_into_queue, args=(results,) + args)
+		process.start()
+		result = results.get()
+		process.join()
+		return result
+
+	# Method to benchmark the given templates and synthetic templates of SYNTHETIC_TAG_COUNTS tags, printing one line per case
+	@classmethod
+	def run(cls, full_paths_to_modbus_template_csv=None, tag_counts=None, duration_seconds=5, log_file_type='csv', pipeline_depth=1, max_gap=0, latency_seconds=0, full_path_to_results_json=None):
+		if full_paths_to_modbus_template_csv is None:
+			full_paths_to_modbus_template_csv = []
+		if tag_counts is None:
+			tag_counts = cls.SYNTHETIC_TAG_COUNTS
+		synthetic_folder = tempfile.mkdtemp(prefix='modbus-bench-templates-')
+		templates = list(full_paths_to_modbus_template_csv)
+		for tag_count in tag_counts:
+			templates.append(cls.synthetic_template(tag_count, os.path.join(synthetic_folder, 'synthetic_template_'+str(tag_count)+'.csv')))
+		results = []
+		print('')
+		print('\t'+'template'.ljust(36)+'columns'.rjust(9)+'reads'.rjust(7)+'cycles/s'.rjust(11)+'decode us/column'.rjust(18)+'bytes/record'.rjust(14)+'peak RSS MB'.rjust(13))
+		try:
+			for template in templates:
+				result = cls.run_isolated(template, duration_seconds, log_file_type, pipeline_depth, max_gap, latency_seconds)
+				results.append(result)
+				if 'error' in result:
+					print('\t[ERROR] benchmark of',result['template'],'failed with',result['error'])
+					continue
+				print('\t'+result['template'][:35].ljust(36)+str(result['columns']).rjust(9)+str(result['read_requests']).rjust(7)
+						+('%.1f' % result['cycles_per_second']).rjust(11)+('%.3f' % result['decode_us_per_column']).rjust(18)
+						+('%.1f' % result['bytes_per_record']).rjust(14)+('%.1f' % result['peak_rss_mb']).rjust(13))
+		finally:
+			shutil.rmtree(synthetic_folder, ignore_errors=True)
+		print('')
+		if full_path_to_results_json is not None:
+			with open(full_path_to_results_json, 'w') as results_json:
+				json.dump(results, results_json, indent=4)
+			print('\t[INFO] benchmark results written to',str(full_path_to_results_json))
+		return results
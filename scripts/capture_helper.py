@@ -0,0 +1,182 @@
+import os, sys, mmap, json, struct, array
+
+# .mbraw raw capture file, little-endian, every section aligned on 8 bytes, written instead of a log file with log_file_type "mbraw":
+# the responses are not decoded while polling, only their raw data bytes are stored to be decoded later (see decoder_helper)
+#
+#	file header:	8 bytes magic b'MBRAWv1\x00'
+#					uint32 length of the schema
+#					schema, utf-8 json: {"format": "mbraw", "version": 1, "byte_order": "little", "server_id": ...,
+#						"call_groups": [{"fc": ..., "start_address": ..., "register_count": ..., "poll_interval": ..., "payload_size": ...}, ...],
+#						"template": [template rows, as read from the template .csv file]}
+#					zero padding up to the next multiple of 8 bytes
+#	chunks:			one chunk per batch of poll cycles, appended one after the other until the file is rotated
+#					4 bytes magic b'RAWC'
+#					uint32 number of poll cycles in the chunk (n)
+#					uint64 length in bytes of the chunk body following this 16 bytes chunk header
+#					chunk body, each part zero padded up to the next multiple of 8 bytes:
+#						int64 timestamp_ns of each cycle (nanoseconds since the Unix epoch)
+#						uint8 quality of each cycle
+#						for each call group of the schema, in order:
+#							uint8 for each cycle, 1 when the call group was read at this cycle (its scan class was due and the cycle did not fail)
+#							the data bytes of its responses (after the function code and byte count of the PDU), payload_size bytes per cycle it was read at
+#
+# the responses of one call group are contiguous within a chunk, so that a batch of cycles can be decoded at once
+class RawCaptureFormat(object):
+
+	MAGIC = b'MBRAWv1\x00'
+	CHUNK_MAGIC = b'RAWC'
+	SCHEMA_LENGTH = struct.Struct('<I')
+	CHUNK_HEADER = struct.Struct('<4sIQ')
+	ALIGNMENT = 8
+
+	@classmethod
+	def padding(cls, length):
+		return (-length) % cls.ALIGNMENT
+
+	@classmethod
+	def padded(cls, part):
+		return part + bytes(cls.padding(len(part)))
+
+	# Method to build the schema of a capture from the prebuilt transactions of ModbusHelper.build_transactions and the rows of the template
+	@classmethod
+	def build_schema(cls, transactions, template_lod, server_id):
+		call_groups = []
+		for transaction in transactions:
+			decode_plan = transaction['decode_plan']
+			call_groups.append({
+				'fc': transaction['fc'],
+				'start_address': transaction['start_address'],
+				'register_count': decode_plan['register_count'],
+				'poll_interval': transaction['poll_interval'],
+				'payload_size': len(transaction['response_buffer']) - 2
+			})
+		return {'format': 'mbraw', 'version': 1, 'byte_order': 'little', 'server_id': server_id, 'call_groups': call_groups, 'template': template_lod}
+
+# live .mbraw capture file, each batch of raw records handed over by ModbusDataLog is appended as one chunk
+# a raw record holds timestamp_ns, quality and the data bytes of the call groups read by transaction index ("payloads"), see ModbusTCPClient.cycle_poll
+class RawCaptureSink(object):
+	def __init__(self, full_path_to_mbraw_file, schema):
+		self.full_path_to_mbraw_file = full_path_to_mbraw_file
+		self.schema = schema
+		self.call_group_count = len(schema['call_groups'])
+		self.file = None
+
+	def open(self):
+		self.file = open(self.full_path_to_mbraw_file, 'ab')
+		# the header is only written to a new (empty) live file
+		if self.file.tell() == 0:
+			schema = json.dumps(self.schema).encode('utf-8')
+			self.file.write(RawCaptureFormat.padded(RawCaptureFormat.MAGIC + RawCaptureFormat.SCHEMA_LENGTH.pack(len(schema)) + schema))
+
+	# Method to append a list of raw records to the live capture file as one chunk
+	def write_records(self, records):
+		if not records:
+			return
+		if self.file is None:
+			self.open()
+		timestamps = array.array('q', [record['timestamp_ns'] for record in records])
+		if sys.byteorder != 'little':
+			timestamps.byteswap()
+		body = [RawCaptureFormat.padded(timestamps.tobytes()), RawCaptureFormat.padded(bytes(record['quality'] for record in records))]
+		for call_group_index in range(self.call_group_count):
+			payloads = [record.get('payloads', {}).get(call_group_index) for record in records]
+			body.append(RawCaptureFormat.padded(bytes(payload is not None for payload in payloads)))
+			body.append(RawCaptureFormat.padded(b''.join(payload for payload in payloads if payload is not None)))
+		body = b''.join(body)
+		self.file.write(RawCaptureFormat.CHUNK_HEADER.pack(RawCaptureFormat.CHUNK_MAGIC, len(records), len(body)) + body)
+		self.file.flush()
+
+	# Method to force the chunks written to the live file to the storage, ex: before the spooled records they hold are released
+	def sync(self):
+		if self.file is None:
+			return
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	# Method to close the live capture file, to be called before the file is rotated and when exiting
+	def close(self):
+		if self.file is None:
+			return
+		self.file.close()
+		self.file = None
+
+# memory-mapped .mbraw capture file; only the schema and the chunk layouts are parsed, the responses are read as views of the file
+class RawCaptureReader(object):
+	def __init__(self, full_path_to_mbraw_file):
+		self.full_path_to_mbraw_file = full_path_to_mbraw_file
+		self.file = open(full_path_to_mbraw_file, 'rb')
+		self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view = None
+		if self.mmap[:len(RawCaptureFormat.MAGIC)] != RawCaptureFormat.MAGIC:
+			self.close()
+			raise ValueError('"'+str(full_path_to_mbraw_file)+'" is not a .mbraw capture file')
+		self.view = memoryview(self.mmap)
+		offset = len(RawCaptureFormat.MAGIC)
+		schema_length = RawCaptureFormat.SCHEMA_LENGTH.unpack_from(self.mmap, offset)[0]
+		offset += RawCaptureFormat.SCHEMA_LENGTH.size
+		self.schema = json.loads(self.mmap[offset:offset+schema_length].decode('utf-8'))
+		offset += schema_length
+		offset += RawCaptureFormat.padding(offset)
+		self.call_groups = self.schema['call_groups']
+		self.chunks = []
+		self.cycle_count = 0
+		# each chunk is indexed as (number of cycles, offset of the timestamps, offset of the qualities, [(offset of the read flags, offset of the payloads, number of responses), ...])
+		while offset + RawCaptureFormat.CHUNK_HEADER.size <= len(self.mmap):
+			chunk_magic, chunk_cycles, body_length = RawCaptureFormat.CHUNK_HEADER.unpack_from(self.mmap, offset)
+			offset += RawCaptureFormat.CHUNK_HEADER.size
+			if (chunk_magic != RawCaptureFormat.CHUNK_MAGIC) or (offset + body_length > len(self.mmap)):
+				# the last chunk of a live file may be incomplete if the logger was stopped while writing it
+				print('\t[WARNING] incomplete or corrupted chunk found in "'+str(full_path_to_mbraw_file)+'", ignoring the rest of the file')
+				break
+			cycles_length = chunk_cycles + RawCaptureFormat.padding(chunk_cycles)
+			timestamps_offset = offset
+			quality_offset = timestamps_offset + 8*chunk_cycles
+			part_offset = quality_offset + cycles_length
+			call_group_parts = []
+			for call_group in self.call_groups:
+				responses = self.mmap[part_offset:part_offset+chunk_cycles].count(1)
+				payloads_length = responses*call_group['payload_size']
+				call_group_parts.append((part_offset, part_offset + cycles_length, responses))
+				part_offset += cycles_length + payloads_length + RawCaptureFormat.padding(payloads_length)
+			self.chunks.append((chunk_cycles, timestamps_offset, quality_offset, call_group_parts))
+			self.cycle_count += chunk_cycles
+			offset += body_length
+
+	# Method to read one chunk: it returns the timestamps_ns and qualities of its cycles, then for each call group the read flag of each cycle
+	# and a view of the payloads of the cycles it was read at, back to back (payload_size bytes each)
+	def read_chunk(self, chunk_index):
+		chunk_cycles, timestamps_offset, quality_offset, call_group_parts = self.chunks[chunk_index]
+		timestamps = array.array('q')
+		timestamps.frombytes(self.mmap[timestamps_offset:timestamps_offset+8*chunk_cycles])
+		if sys.byteorder != 'little':
+			timestamps.byteswap()
+		qualities = self.mmap[quality_offset:quality_offset+chunk_cycles]
+		call_group_responses = []
+		for call_group, (read_offset, payloads_offset, responses) in zip(self.call_groups, call_group_parts):
+			call_group_responses.append((
+				self.mmap[read_offset:read_offset+chunk_cycles],
+				self.view[payloads_offset:payloads_offset+responses*call_group['payload_size']],
+				responses
+			))
+		return timestamps, qualities, call_group_responses
+
+	def close(self):
+		if self.view is not None:
+			self.view.release()
+			self.view = None
+		if self.mmap is not None:
+			try:
+				self.mmap.close()
+			except BufferError:
+				# views of the payloads still reference the memory map, it is released with them
+				pass
+			self.mmap = None
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
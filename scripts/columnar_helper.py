@@ -0,0 +1,259 @@
+import os, sys, mmap, json, struct, array
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# .mbcol columnar log file container, little-endian, every section aligned on 8 bytes so that any column can be memory-mapped as an array
+#
+#	file header:	8 bytes magic b'MBCOLv1\x00'
+#					uint32 length of the schema
+#					schema, utf-8 json: {"format": "mbcol", "version": 2, "byte_order": "little", "columns": [{"name": ..., "type": ..., "validity": true}, ...]}
+#					zero padding up to the next multiple of 8 bytes
+#	chunks:			one chunk per batch of records, appended one after the other until the file is rotated
+#					4 bytes magic b'CHNK'
+#					uint32 number of records in the chunk (n)
+#					uint64 length in bytes of the chunk body following this 16 bytes chunk header
+#					chunk body: each column of the schema in order, n values of its type, zero padded up to the next multiple of 8 bytes,
+#					followed for the columns with "validity" by their validity bitmap: ceil(n/8) bytes, bit i (least significant bit first)
+#					set when the value of record i is present, zero padded up to the next multiple of 8 bytes
+#
+# the first column is always "timestamp_ns" (int64, nanoseconds since the Unix epoch, UTC), then "quality" and one column per tag
+# column types are bool (1 byte), int16, uint16, float32, float64 and int64; a tag missing from a record (left out by report-by-exception
+# or quality-bad) is stored as NaN in float columns and 0 otherwise, with its bit cleared in the validity bitmap
+# version 1 files have no validity bitmaps, the sink keeps appending version 1 chunks to an existing version 1 live file
+
+class ColumnarLogFormat(object):
+
+	MAGIC = b'MBCOLv1\x00'
+	CHUNK_MAGIC = b'CHNK'
+	SCHEMA_LENGTH = struct.Struct('<I')
+	CHUNK_HEADER = struct.Struct('<4sIQ')
+	ALIGNMENT = 8
+
+	# column type: (array typecode, numpy dtype, item size in bytes, value stored for a missing tag)
+	COLUMN_TYPES = {
+		'bool': ('B', '|b1', 1, 0),
+		'int16': ('h', '<i2', 2, 0),
+		'uint16': ('H', '<u2', 2, 0),
+		'float32': ('f', '<f4', 4, float('nan')),
+		'float64': ('d', '<f8', 8, float('nan')),
+		'int64': ('q', '<i8', 8, 0)
+	}
+
+	TIMESTAMP_COLUMN = 'timestamp_ns'
+	VERSION = 2
+	# columns never missing from a record, written without a validity bitmap
+	ALWAYS_VALID_COLUMNS = [TIMESTAMP_COLUMN, 'quality']
+
+	@classmethod
+	def padding(cls, length):
+		return (-length) % cls.ALIGNMENT
+
+	# Method to read the schema of an open .mbcol file, it returns the schema and the offset of the first chunk, or None if it is not a .mbcol file
+	@classmethod
+	def read_schema(cls, buffer):
+		if buffer[:len(cls.MAGIC)] != cls.MAGIC:
+			return None
+		offset = len(cls.MAGIC)
+		schema_length = cls.SCHEMA_LENGTH.unpack_from(buffer, offset)[0]
+		offset += cls.SCHEMA_LENGTH.size
+		schema = json.loads(bytes(buffer[offset:offset+schema_length]).decode('utf-8'))
+		offset += schema_length
+		return schema, offset + cls.padding(offset)
+
+	# Method to infer the column type of a decoded value when no template is available
+	@classmethod
+	def infer_column_type(cls, value):
+		if isinstance(value, float):
+			return 'float64'
+		return 'int64'
+
+# live .mbcol log file, each batch of records handed over by ModbusDataLog is appended as one chunk
+class ColumnarLogSink(object):
+	def __init__(self, full_path_to_mbcol_file, column_types=None):
+		self.full_path_to_mbcol_file = full_path_to_mbcol_file
+		self.column_types = None
+		if column_types is not None:
+			self.column_types = dict(column_types)
+		self.file = None
+		self.version = ColumnarLogFormat.VERSION
+
+	def open(self):
+		self.file = open(self.full_path_to_mbcol_file, 'ab+')
+		# the header is only written to a new (empty) live file, the chunks appended to an existing one follow its version
+		if self.file.tell() == 0:
+			columns = [{'name': ColumnarLogFormat.TIMESTAMP_COLUMN, 'type': 'int64'}]
+			for column, column_type in self.column_types.items():
+				columns.append({'name': column, 'type': column_type, 'validity': column not in ColumnarLogFormat.ALWAYS_VALID_COLUMNS})
+			schema = json.dumps({'format': 'mbcol', 'version': ColumnarLogFormat.VERSION, 'byte_order': 'little', 'columns': columns}).encode('utf-8')
+			header = ColumnarLogFormat.MAGIC + ColumnarLogFormat.SCHEMA_LENGTH.pack(len(schema)) + schema
+			self.file.write(header + bytes(ColumnarLogFormat.padding(len(header))))
+			self.version = ColumnarLogFormat.VERSION
+		else:
+			self.file.seek(0)
+			header = self.file.read(len(ColumnarLogFormat.MAGIC)+ColumnarLogFormat.SCHEMA_LENGTH.size)
+			if len(header) == len(ColumnarLogFormat.MAGIC)+ColumnarLogFormat.SCHEMA_LENGTH.size:
+				header += self.file.read(ColumnarLogFormat.SCHEMA_LENGTH.unpack_from(header, len(ColumnarLogFormat.MAGIC))[0])
+			schema = ColumnarLogFormat.read_schema(header)
+			self.version = schema[0].get('version', 1) if schema is not None else 1
+			self.file.seek(0, os.SEEK_END)
+
+	def encode_column(self, column_type, values):
+		column = array.array(ColumnarLogFormat.COLUMN_TYPES[column_type][0], values)
+		if sys.byteorder != 'little':
+			column.byteswap()
+		column = column.tobytes()
+		return column + bytes(ColumnarLogFormat.padding(len(column)))
+
+	# Method to encode the validity bitmap of a column, bit i set when the value of record i is present
+	def encode_validity(self, valid):
+		record_count = len(valid)
+		if all(valid):
+			bitmap = b'\xff'*(record_count // 8) + (bytes([(1 << (record_count % 8)) - 1]) if record_count % 8 else b'')
+		else:
+			bitmap = bytearray((record_count + 7) // 8)
+			for i, value in enumerate(valid):
+				if value:
+					bitmap[i >> 3] |= 1 << (i & 7)
+			bitmap = bytes(bitmap)
+		return bitmap + bytes(ColumnarLogFormat.padding(len(bitmap)))
+
+	# Method to append a list of records to the live log file as one chunk
+	def write_records(self, records):
+		if not records:
+			return
+		if self.column_types is None:
+			self.column_types = {column: ColumnarLogFormat.infer_column_type(value) for column, value in records[0].items() if column not in ['timestamp_utc', 'timestamp_local', ColumnarLogFormat.TIMESTAMP_COLUMN]}
+		if self.file is None:
+			self.open()
+		body = [self.encode_column('int64', [record[ColumnarLogFormat.TIMESTAMP_COLUMN] for record in records])]
+		for column, column_type in self.column_types.items():
+			missing = ColumnarLogFormat.COLUMN_TYPES[column_type][3]
+			body.append(self.encode_column(column_type, [record.get(column, missing) for record in records]))
+			if (self.version >= 2) and (column not in ColumnarLogFormat.ALWAYS_VALID_COLUMNS):
+				body.append(self.encode_validity([column in record for record in records]))
+		body = b''.join(body)
+		self.file.write(ColumnarLogFormat.CHUNK_HEADER.pack(ColumnarLogFormat.CHUNK_MAGIC, len(records), len(body)) + body)
+		self.file.flush()
+
+	# Method to force the chunks written to the live file to the storage, ex: before the spooled records they hold are released
+	def sync(self):
+		if self.file is None:
+			return
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	# Method to close the live log file, to be called before the file is rotated and when exiting
+	def close(self):
+		if self.file is None:
+			return
+		self.file.close()
+		self.file = None
+
+# memory-mapped .mbcol log file; only the schema and the 16 bytes chunk headers are parsed, columns are read as NumPy arrays on request
+class ColumnarLogReader(object):
+	def __init__(self, full_path_to_mbcol_file):
+		self.full_path_to_mbcol_file = full_path_to_mbcol_file
+		self.file = open(full_path_to_mbcol_file, 'rb')
+		self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		schema = ColumnarLogFormat.read_schema(self.mmap)
+		if schema is None:
+			self.close()
+			raise ValueError('"'+str(full_path_to_mbcol_file)+'" is not a .mbcol log file')
+		self.schema, offset = schema
+		self.column_types = {column['name']: column['type'] for column in self.schema['columns']}
+		# columns with a validity bitmap, none in version 1 files
+		self.validity_columns = [column['name'] for column in self.schema['columns'] if column.get('validity', False)]
+		self.chunks = []
+		self.record_count = 0
+		# each chunk is indexed as (number of records, offset of each column, offset of each validity bitmap)
+		while offset + ColumnarLogFormat.CHUNK_HEADER.size <= len(self.mmap):
+			chunk_magic, chunk_records, body_length = ColumnarLogFormat.CHUNK_HEADER.unpack_from(self.mmap, offset)
+			offset += ColumnarLogFormat.CHUNK_HEADER.size
+			if (chunk_magic != ColumnarLogFormat.CHUNK_MAGIC) or (offset + body_length > len(self.mmap)):
+				# the last chunk of a live file may be incomplete if the logger was stopped while writing it
+				print('\t[WARNING] incomplete or corrupted chunk found in "'+str(full_path_to_mbcol_file)+'", ignoring the rest of the file')
+				break
+			column_offsets = {}
+			validity_offsets = {}
+			column_offset = offset
+			for column, column_type in self.column_types.items():
+				column_offsets[column] = column_offset
+				column_length = chunk_records*ColumnarLogFormat.COLUMN_TYPES[column_type][2]
+				column_offset += column_length + ColumnarLogFormat.padding(column_length)
+				if column in self.validity_columns:
+					validity_offsets[column] = column_offset
+					bitmap_length = (chunk_records + 7) // 8
+					column_offset += bitmap_length + ColumnarLogFormat.padding(bitmap_length)
+			self.chunks.append((chunk_records, column_offsets, validity_offsets))
+			self.record_count += chunk_records
+			offset += body_length
+
+	@property
+	def columns(self):
+		return list(self.column_types)
+
+	# Method to read a subset of the columns (all of them by default) as NumPy arrays, concatenated over all the chunks
+	# the arrays of a file holding a single chunk are zero-copy views of the memory-mapped file
+	def read(self, columns=None):
+		if np is None:
+			print('\t[ERROR] NumPy is required to read .mbcol log files, please install it with: pip3 install numpy')
+			return
+		if columns is None:
+			columns = self.columns
+		arrays = {}
+		for column in columns:
+			if column not in self.column_types:
+				print('\t[WARNING] column "'+str(column)+'" not found in "'+str(self.full_path_to_mbcol_file)+'"')
+				continue
+			dtype = np.dtype(ColumnarLogFormat.COLUMN_TYPES[self.column_types[column]][1])
+			column_chunks = [np.frombuffer(self.mmap, dtype=dtype, count=chunk_records, offset=column_offsets[column]) for chunk_records, column_offsets, validity_offsets in self.chunks]
+			if len(column_chunks) == 1:
+				arrays[column] = column_chunks[0]
+			elif column_chunks:
+				arrays[column] = np.concatenate(column_chunks)
+			else:
+				arrays[column] = np.empty(0, dtype=dtype)
+		return arrays
+
+	# Method to read the validity of a subset of the columns (all of them by default) as NumPy bool arrays, True where the value is present
+	# the columns without a validity bitmap (the timestamp, the quality and all the columns of version 1 files) are reported valid
+	def read_validity(self, columns=None):
+		if np is None:
+			print('\t[ERROR] NumPy is required to read .mbcol log files, please install it with: pip3 install numpy')
+			return
+		if columns is None:
+			columns = self.columns
+		arrays = {}
+		for column in columns:
+			if column not in self.column_types:
+				print('\t[WARNING] column "'+str(column)+'" not found in "'+str(self.full_path_to_mbcol_file)+'"')
+				continue
+			if column not in self.validity_columns:
+				arrays[column] = np.ones(self.record_count, dtype=bool)
+				continue
+			column_chunks = []
+			for chunk_records, column_offsets, validity_offsets in self.chunks:
+				bitmap = np.frombuffer(self.mmap, dtype=np.uint8, count=(chunk_records + 7) // 8, offset=validity_offsets[column])
+				column_chunks.append(np.unpackbits(bitmap, count=chunk_records, bitorder='little').astype(bool))
+			arrays[column] = np.concatenate(column_chunks) if column_chunks else np.empty(0, dtype=bool)
+		return arrays
+
+	def close(self):
+		if self.mmap is not None:
+			try:
+				self.mmap.close()
+			except BufferError:
+				# zero-copy arrays still reference the memory map, it is released with them
+				pass
+			self.mmap = None
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -0,0 +1,171 @@
+import datetime, bisect
+
+# report-by-exception stage between the poll loop and the log files: a compressed tag is only written when its value is worth keeping
+#	'deadband': the value is written when it moves more than deadband away from the last written value
+#	'swinging_door': swinging door trending, the value is written when the straight line from the last written point can no longer
+#		represent all the values received since within +/- deadband; the written point is the last value received before that
+# with max_interval (seconds), a compressed tag is written at least once every max_interval seconds (heartbeat) even if it did not move
+# tags without compression settings, the timestamps and the quality are written on every record, as without compression;
+# a record left without any tag value is not written at all unless its quality changed since the last record written
+class RecordCompressor(object):
+
+	METHODS = ['deadband', 'swinging_door']
+	# keys of a record that are not tag values
+	RECORD_KEYS = ['timestamp_utc', 'timestamp_local', 'quality', 'timestamp_ns']
+
+	def __init__(self, tag_settings):
+		# tag_settings: {tag_name: (method, deadband, max_interval or None)}
+		self.tag_settings = dict(tag_settings)
+		self.tag_states = {}
+		# a swinging door point is only known to be worth writing when the next value is received, so that one record is held back
+		self.pending = None
+		self.last_quality = None
+		self.stats = {
+			'records_in': 0,
+			'records_dropped': 0,
+			'values_in': 0,
+			'values_out': 0
+		}
+
+	# Method to compress one polled record; it returns the previous record with only the values worth writing, or None if there is nothing to write
+	def compress(self, record):
+		t = record['timestamp_ns'] / 1000000000
+		compressed = {key: value for key, value in record.items() if key not in self.tag_settings}
+		self.stats['records_in'] += 1
+		for tag_name, (method, deadband, max_interval) in self.tag_settings.items():
+			if tag_name not in record:
+				continue
+			self.stats['values_in'] += 1
+			value = record[tag_name]
+			state = self.tag_states.get(tag_name)
+			if (state is None) or ((max_interval is not None) and (t - state['time'] >= max_interval)):
+				# first value and heartbeat are always written, along with the swinging door point held back so that the trend up to the heartbeat is kept
+				if (state is not None) and (state['previous'] is not None) and (state['previous'][2] is self.pending):
+					self.pending[tag_name] = state['previous'][1]
+				self.archive(tag_name, compressed, t, value)
+			elif method == 'deadband':
+				if abs(value - state['value']) > deadband:
+					self.archive(tag_name, compressed, t, value)
+			else:
+				self.swinging_door(tag_name, state, deadband, compressed, t, value)
+		to_write = self.pending
+		self.pending = compressed
+		# the held back record is final once handed over, no swinging door point can be written into it anymore
+		if (to_write is None) or (not self.worth_writing(to_write)):
+			return None
+		return to_write
+
+	# Method to tell whether a record handed over is worth writing: it holds a tag value or its quality changed since the last record written
+	def worth_writing(self, record):
+		if (record.get('quality') != self.last_quality) or any(key not in RecordCompressor.RECORD_KEYS for key in record):
+			self.last_quality = record.get('quality')
+			return True
+		self.stats['records_dropped'] += 1
+		return False
+
+	# Method to write the value of a tag in the given compressed record and restart its compression from that point
+	def archive(self, tag_name, compressed, t, value):
+		compressed[tag_name] = value
+		self.tag_states[tag_name] = {'time': t, 'value': value, 'upper_slope': float('-inf'), 'lower_slope': float('inf'), 'previous': None}
+
+	def swinging_door(self, tag_name, state, deviation, compressed, t, value):
+		dt = t - state['time']
+		if dt > 0:
+			upper_slope = max(state['upper_slope'], (value - state['value'] - deviation) / dt)
+			lower_slope = min(state['lower_slope'], (value - state['value'] + deviation) / dt)
+			if upper_slope > lower_slope:
+				# the doors opened: the previous value is the last one the line from the last written point could represent
+				previous = state['previous']
+				if (previous is None) or (previous[2] is not self.pending) or (previous[0] >= t):
+					# the previous value belongs to a record already handed over, write the current value instead
+					self.archive(tag_name, compressed, t, value)
+					return
+				previous_t, previous_value, previous_record = previous
+				self.archive(tag_name, previous_record, previous_t, previous_value)
+				state = self.tag_states[tag_name]
+				dt = t - previous_t
+				upper_slope = (value - previous_value - deviation) / dt
+				lower_slope = (value - previous_value + deviation) / dt
+			state['upper_slope'] = upper_slope
+			state['lower_slope'] = lower_slope
+		state['previous'] = (t, value, compressed)
+
+	# Method to return the record held back, with the last value of every swinging door tag so that the compressed stream ends on its last point
+	# to be called when exiting
+	def flush(self):
+		to_write = self.pending
+		self.pending = None
+		if to_write is None:
+			return None
+		for tag_name, state in self.tag_states.items():
+			previous = state['previous']
+			if (previous is not None) and (previous[2] is to_write):
+				to_write[tag_name] = previous[1]
+		if not self.worth_writing(to_write):
+			return None
+		return to_write
+
+	# Method to count the values written, to be called on each record returned by compress() and flush()
+	def count_written(self, record):
+		self.stats['values_out'] += sum(1 for tag_name in record if tag_name in self.tag_settings)
+
+	def get_stats(self):
+		stats = dict(self.stats)
+		stats['compression_ratio'] = (stats['values_in'] / stats['values_out']) if stats['values_out'] else None
+		return stats
+
+	def print_stats(self):
+		for key, value in self.get_stats().items():
+			print('\t[INFO] compression '+str(key)+':', str(value))
+
+	# Method to rebuild a record for each timestamp from a compressed stream of records (ex: loaded back from the log files)
+	# deadband tags hold their last written value, swinging door tags are linearly interpolated between their written points
+	# timestamps is an optional list of times to rebuild the records at, either timestamp_ns integers (nanoseconds since the Unix epoch)
+	# or timestamp_utc strings, by default the times of the compressed records
+	# the records are placed in time by their timestamp_ns, the ones without it (older .csv log files) by their timestamp_utc, at 1 s resolution
+	# records loaded from a .csv log file hold strings, their empty cells are the values that were not written
+	@classmethod
+	def reconstruct(cls, records, tag_settings, timestamps=None, time_format='%Y-%m-%d %H:%M:%S%z'):
+		def to_ns(timestamp_utc):
+			return int(datetime.datetime.strptime(timestamp_utc, time_format).timestamp())*1000000000
+		def record_ns(record):
+			if record.get('timestamp_ns') not in [None, '']:
+				return int(record['timestamp_ns'])
+			return to_ns(record['timestamp_utc'])
+		records = sorted(records, key=record_ns)
+		record_times = [record_ns(record) for record in records]
+		# written points of each tag, in time order
+		points = {}
+		for t, record in zip(record_times, records):
+			for tag_name, value in record.items():
+				if (tag_name in RecordCompressor.RECORD_KEYS) or (value is None) or (value == ''):
+					continue
+				if isinstance(value, str):
+					value = float(value)
+				points.setdefault(tag_name, ([], []))
+				points[tag_name][0].append(t)
+				points[tag_name][1].append(value)
+		if timestamps is None:
+			targets = [(t, {'timestamp_utc': record['timestamp_utc'], 'timestamp_local': record.get('timestamp_local'), 'timestamp_ns': t}) for t, record in zip(record_times, records)]
+		else:
+			targets = []
+			for timestamp in timestamps:
+				if isinstance(timestamp, str):
+					targets.append((to_ns(timestamp), {'timestamp_utc': timestamp, 'timestamp_ns': to_ns(timestamp)}))
+				else:
+					timestamp_utc = datetime.datetime.fromtimestamp(timestamp / 1000000000, datetime.timezone.utc).strftime(time_format)
+					targets.append((int(timestamp), {'timestamp_utc': timestamp_utc, 'timestamp_ns': int(timestamp)}))
+		reconstructed = []
+		for t, record in targets:
+			for tag_name, (point_times, point_values) in points.items():
+				index = bisect.bisect_right(point_times, t) - 1
+				if index < 0:
+					continue
+				value = point_values[index]
+				method = tag_settings.get(tag_name, ('deadband',))[0]
+				if (method == 'swinging_door') and (index + 1 < len(point_times)) and (point_times[index+1] > point_times[index]):
+					next_t, next_value = point_times[index+1], point_values[index+1]
+					value = value + (next_value - value) * (t - point_times[index]) / (next_t - point_times[index])
+				record[tag_name] = value
+			reconstructed.append(record)
+		return reconstructed
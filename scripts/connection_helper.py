@@ -0,0 +1,107 @@
+import time, random
+
+# jittered exponential backoff between two (2) reconnect attempts: initial_seconds, then multiplied by multiplier after each failed attempt up to max_seconds
+# each delay is drawn in [(1-jitter)*delay, delay] so that many clients losing the same link do not all retry at the same time
+class ReconnectBackoff(object):
+	def __init__(self, initial_seconds=1, max_seconds=60, multiplier=2, jitter=0.5, seed=None):
+		self.initial_seconds = initial_seconds
+		self.max_seconds = max_seconds
+		self.multiplier = multiplier
+		self.jitter = jitter
+		self.random = random.Random(seed)
+		self.attempts = 0
+
+	def next_delay(self):
+		delay = min(self.max_seconds, self.initial_seconds*(self.multiplier**self.attempts))
+		self.attempts += 1
+		return delay*(1 - self.jitter*self.random.random())
+
+	def reset(self):
+		self.attempts = 0
+
+# health of the connection to one Modbus TCP Server: connect latency, outages (from the connection lost to the connection back) and the reconnect schedule
+class ConnectionHealth(object):
+	def __init__(self, backoff=None):
+		if backoff is None:
+			backoff = ReconnectBackoff()
+		self.backoff = backoff
+		# monotonic time the current outage started at, None while connected
+		self.outage_started = None
+		self.next_attempt = 0
+		self.connect_seconds_sum = 0.0
+		self.outage_seconds_sum = 0.0
+		self.stats = {
+			'connects': 0,
+			'reconnects': 0,
+			'connect_failures': 0,
+			'connections_lost': 0,
+			'bad_quality_records': 0,
+			'connect_seconds_last': None,
+			'connect_seconds_max': 0.0,
+			'outages': 0,
+			'outage_seconds_last': None,
+			'outage_seconds_max': 0.0,
+			'last_error': None
+		}
+
+	@property
+	def connected(self):
+		return self.outage_started is None
+
+	# Method to tell whether the next reconnect attempt is due
+	def reconnect_due(self):
+		return time.monotonic() >= self.next_attempt
+
+	# Method to record a successful connect that took connect_seconds, closing the current outage if any
+	def connect_succeeded(self, connect_seconds):
+		self.stats['connects'] += 1
+		self.connect_seconds_sum += connect_seconds
+		self.stats['connect_seconds_last'] = connect_seconds
+		self.stats['connect_seconds_max'] = max(self.stats['connect_seconds_max'], connect_seconds)
+		if self.outage_started is not None:
+			outage_seconds = time.monotonic() - self.outage_started
+			self.stats['reconnects'] += 1
+			self.outage_seconds_sum += outage_seconds
+			self.stats['outage_seconds_last'] = outage_seconds
+			self.stats['outage_seconds_max'] = max(self.stats['outage_seconds_max'], outage_seconds)
+			self.outage_started = None
+		self.backoff.reset()
+		self.next_attempt = 0
+
+	# Method to record a failed connect attempt and schedule the next one after the backoff delay, it returns the delay
+	def connect_failed(self, err):
+		now = time.monotonic()
+		self.stats['connect_failures'] += 1
+		self.stats['last_error'] = repr(err)
+		if self.outage_started is None:
+			self.start_outage(now)
+		delay = self.backoff.next_delay()
+		self.next_attempt = now + delay
+		return delay
+
+	# Method to record a connection found broken while polling, the first reconnect attempt is made right away
+	def connection_lost(self, err):
+		self.stats['connections_lost'] += 1
+		self.stats['last_error'] = repr(err)
+		if self.outage_started is None:
+			self.start_outage(time.monotonic())
+		self.next_attempt = 0
+
+	def start_outage(self, now):
+		self.outage_started = now
+		self.stats['outages'] += 1
+
+	def get_stats(self):
+		stats = dict(self.stats)
+		stats['connect_seconds_mean'] = (self.connect_seconds_sum / stats['connects']) if stats['connects'] else None
+		outage_seconds_total = self.outage_seconds_sum
+		if self.outage_started is not None:
+			# the current outage is counted up to now
+			outage_seconds_total += time.monotonic() - self.outage_started
+		stats['outage_seconds_total'] = outage_seconds_total
+		stats['connected'] = self.connected
+		return stats
+
+	def print_stats(self):
+		for key, value in self.get_stats().items():
+			print('\t[INFO] connection '+str(key)+':', str(value))
@@ -1,4 +1,4 @@
-import struct, os, csv
+import struct, os, csv, json
 
 class DataHelper(object):
 
@@ -137,6 +137,31 @@ class DataHelper(object):
         swapped = DataHelper.float32_swap_bytes(swapped_words)
         return swapped
 
+    # Method to convert 2 raw bytes of a byte-swapped 16-bit register [B A] into its 16-bit unsigned integer
+    @classmethod
+    def bytes_16_swapped_to_int_16_unsigned(cls, raw_bytes):
+        return struct.unpack('<H', raw_bytes)[0]
+
+    # Method to convert 2 raw bytes of a byte-swapped 16-bit register [B A] into its 16-bit signed integer
+    @classmethod
+    def bytes_16_swapped_to_int_16_signed(cls, raw_bytes):
+        return struct.unpack('<h', raw_bytes)[0]
+
+    # Method to convert 4 raw bytes of a byte-swapped 32-bit float [B A D C] into its IEEE 754 single precision floating-point
+    @classmethod
+    def bytes_32_byte_swap_to_float(cls, raw_bytes):
+        return struct.unpack('<f', raw_bytes[2:4] + raw_bytes[0:2])[0]
+
+    # Method to convert 4 raw bytes of a word-swapped 32-bit float [C D A B] into its IEEE 754 single precision floating-point
+    @classmethod
+    def bytes_32_word_swap_to_float(cls, raw_bytes):
+        return struct.unpack('>f', raw_bytes[2:4] + raw_bytes[0:2])[0]
+
+    # Method to convert 4 raw bytes of a byte-and-word-swapped 32-bit float [D C B A] into its IEEE 754 single precision floating-point
+    @classmethod
+    def bytes_32_byte_word_swap_to_float(cls, raw_bytes):
+        return struct.unpack('<f', raw_bytes)[0]
+
     # Method to load a .csv file and convert its content into an in-memory Python list of dictionaries (lod)
     @classmethod
     def csv_to_lod(cls, full_path_to_csv_file, header=True):
@@ -165,4 +190,38 @@ class DataHelper(object):
             dict_writer = csv.DictWriter(output_file, keys)
             dict_writer.writeheader()
             dict_writer.writerows(lod)
-        output_file.close()
\ No newline at end of file
+        output_file.close()
+
+    # Method to append an in-memory Python list of dictionaries (lod) to a .ndjson file (one json record per line), the file is created if needed
+    @classmethod
+    def lod_to_ndjson(cls, lod, full_path_to_ndjson_file):
+        with open(full_path_to_ndjson_file, 'a') as output_file:
+            output_file.write(''.join(json.dumps(record)+'\n' for record in lod))
+
+    # Method to load a .ndjson file (one json record per line) into an in-memory Python list of dictionaries (lod)
+    @classmethod
+    def ndjson_to_lod(cls, full_path_to_ndjson_file):
+        if not os.path.isfile(full_path_to_ndjson_file):
+            print('\n\t'+'File "'+full_path_to_ndjson_file+'" not found! Unable to load to lod!'+'\n')
+            return
+        lod = []
+        with open(full_path_to_ndjson_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    lod.append(json.loads(line))
+        return lod
+
+    # Method to convert a .json log file keyed by timestamp ({"timestamp_utc": record, ...}) into a .ndjson log file with one record per line
+    # it returns the path to the .ndjson file, written next to the .json file when not specified
+    @classmethod
+    def json_log_to_ndjson(cls, full_path_to_json_file, full_path_to_ndjson_file=None):
+        if not os.path.isfile(full_path_to_json_file):
+            print('\n\t'+'File "'+full_path_to_json_file+'" not found! Unable to convert to ndjson!'+'\n')
+            return
+        if full_path_to_ndjson_file is None:
+            full_path_to_ndjson_file = os.path.splitext(full_path_to_json_file)[0]+'.ndjson'
+        with open(full_path_to_json_file, 'r') as f:
+            json_log = json.load(f)
+        with open(full_path_to_ndjson_file, 'w') as output_file:
+            output_file.write(''.join(json.dumps(json_log[timestamp])+'\n' for timestamp in json_log))
+        return full_path_to_ndjson_file
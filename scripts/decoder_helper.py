@@ -0,0 +1,84 @@
+import os, sys, time, datetime
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper, ModbusDataLog
+from capture_helper import RawCaptureReader
+from data_helper import DataHelper
+
+# offline decoder of the .mbraw capture files written with log_file_type "mbraw" into csv, json, ndjson or mbcol log files
+# the responses of each call group are decoded one chunk (batch of in_memory_records cycles) at a time with ModbusHelper.decode_response_batch,
+# then the records are rebuilt as the logger would have: each one holds the latest value of every tag, the ones of the scan classes not due included
+class RawCaptureDecoder(object):
+
+	# defaults of the output log files when no Modbus config .json file is given
+	OUTPUT_CONFIG = {
+		'log_file_type': 'csv',
+		'in_memory_records': 1000,
+		'file_rotation': {'max_file_records': 1000000},
+		'json_indent': None
+	}
+
+	# Method to decode a capture file into log files of the log_file_type of modbus_config (a parsed Modbus config .json file, "csv" when None)
+	# the template stored in the capture is used unless another one is given, ex: to re-decode with corrected scaling or data types;
+	# every tag of the template held entirely within the registers or bits of a captured read is decoded
+	# the log files are named after the capture file and written to full_path_to_logged_data, it returns the number of records decoded
+	@classmethod
+	def decode(cls, full_path_to_mbraw_file, full_path_to_modbus_template_csv=None, modbus_config=None, full_path_to_logged_data=None, time_format='%Y-%m-%d %H:%M:%S%z'):
+		if full_path_to_logged_data is None:
+			full_path_to_logged_data = ModbusHelper.default_log_file_location()
+		output_config = dict(ModbusHelper.CONFIG_DEFAULTS)
+		output_config.update(cls.OUTPUT_CONFIG)
+		if modbus_config is not None:
+			output_config.update(modbus_config)
+		if output_config['log_file_type'] == 'mbraw':
+			print('\t[ERROR] a capture file can not be decoded into another capture file, please use a log_file_type of',[log_file_type for log_file_type in ModbusHelper.LOG_FILE_TYPES if log_file_type != 'mbraw'])
+			return
+		# decoding is done offline, there is no poll loop to keep from waiting on the disk
+		output_config['writer_queue_size'] = 0
+		output_config['log_file_name'] = os.path.splitext(os.path.basename(full_path_to_mbraw_file))[0]
+		with RawCaptureReader(full_path_to_mbraw_file) as capture:
+			if full_path_to_modbus_template_csv is None:
+				template_lod = capture.schema['template']
+			else:
+				template_lod = DataHelper.csv_to_lod(full_path_to_modbus_template_csv)
+			call_groups, interpreter_helper = ModbusHelper.parse_template_lod_build_calls(template_lod)
+			decode_plans = []
+			for call_group in capture.call_groups:
+				address_maps = interpreter_helper[call_group['fc']]['address_maps'] if call_group['fc'] in interpreter_helper else {}
+				decode_plans.append(ModbusHelper.build_decode_plan(call_group['fc'], call_group['start_address'], call_group['register_count'], address_maps))
+			data_log = ModbusDataLog(
+					output_config,
+					full_path_to_logged_data,
+					ModbusHelper.record_column_types(interpreter_helper),
+					ModbusHelper.record_compression_settings(interpreter_helper)
+				)
+			print('\t[INFO] decoding',str(capture.cycle_count),'poll cycle(s) of',str(len(capture.call_groups)),'call group(s) from',str(full_path_to_mbraw_file))
+			started = time.perf_counter()
+			latest_values = {}
+			decode_seconds = 0.0
+			records = 0
+			for chunk_index in range(len(capture.chunks)):
+				timestamps, qualities, call_group_responses = capture.read_chunk(chunk_index)
+				decode_started = time.perf_counter()
+				# decoded columns of each call group along with the position of its next response
+				decoded = [(read_flags, ModbusHelper.decode_response_batch(decode_plan, payloads) if responses else {}, [0]) for decode_plan, (read_flags, payloads, responses) in zip(decode_plans, call_group_responses)]
+				decode_seconds += time.perf_counter() - decode_started
+				for cycle, timestamp_ns in enumerate(timestamps):
+					ts_local = datetime.datetime.fromtimestamp(timestamp_ns / 1000000000).astimezone()
+					ts_utc = ts_local.astimezone(datetime.timezone.utc)
+					record = {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': qualities[cycle], 'timestamp_ns': int(timestamp_ns)}
+					for read_flags, columns, position in decoded:
+						if not read_flags[cycle]:
+							continue
+						for tag_name, values in columns.items():
+							latest_values[tag_name] = values[position[0]]
+						position[0] += 1
+					# a quality-bad record holds no tag values, as when polling
+					if qualities[cycle] == ModbusHelper.QUALITY_GOOD:
+						record.update(latest_values)
+					data_log.append(record)
+					records += 1
+				# the views of the payloads are released so that the capture file can be closed
+				del timestamps, qualities, call_group_responses, decoded
+			data_log.close()
+		print('\t[INFO] decoded',str(records),'record(s) in',str(round(time.perf_counter() - started, 3)),'seconds ('+str(round(decode_seconds, 3)),'seconds decoding the responses) to',str(full_path_to_logged_data))
+		return records
@@ -0,0 +1,265 @@
+import os, sys, time, signal, datetime
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper, ModbusTCPClient, ModbusDataLog
+from schedule_helper import PollScheduler, ScanClassSchedule
+from connection_helper import ReconnectBackoff
+from metrics_helper import StageMetrics
+from history_helper import RecordHistory
+from snapshot_helper import SnapshotPublisher
+
+# one unit ID (ex: a serial slave) behind a Modbus TCP gateway, with its own template, call groups, latest values and log files
+class ModbusGatewayUnit(object):
+	def __init__(self, server_id, full_path_to_modbus_template_csv, log_file_name, poll_interval_seconds, max_gap=0, max_read_sizes=None):
+		self.server_id = server_id
+		self.log_file_name = log_file_name
+		self.poll_interval_seconds = poll_interval_seconds
+		self.call_groups, self.interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv, max_gap, max_read_sizes)
+		# the request frames carry the unit ID in their MBAP header, so that the transactions of all the units can share one transport
+		self.transactions = ModbusHelper.build_transactions(self.call_groups, self.interpreter_helper, server_id)
+		for transaction in self.transactions:
+			transaction['call_group'] = str(server_id)+'/'+transaction['call_group']
+			# the call groups without a scan class of their own are polled at the poll interval of the unit
+			if transaction['poll_interval'] is None:
+				transaction['poll_interval'] = poll_interval_seconds
+		self.latest_values = {}
+		self.data_log = None
+		# in-memory history of the last records of the unit, None when disabled
+		self.history = None
+		# latest record of the unit published to a shared memory block, None when disabled
+		self.snapshot = None
+		self.stats = {
+			'records': 0,
+			'bad_quality_records': 0,
+			'last_error': None
+		}
+
+	def print_stats(self):
+		print('\t[INFO] unit '+str(self.server_id)+' ('+str(self.log_file_name)+'):',', '.join(str(key)+'='+str(value) for key, value in self.stats.items()))
+		if self.data_log is not None:
+			self.data_log.print_stats()
+		if self.snapshot is not None:
+			self.snapshot.print_stats()
+
+# one connection to a Modbus TCP gateway carrying the polls of many unit IDs
+# the transactions of all the units are concatenated and polled through a single transport: serialized with pipeline_depth 1,
+# pipelined across units otherwise, the responses being matched by MBAP transaction ID; the scan classes of all the units share one schedule
+class ModbusTCPGatewayClient(ModbusTCPClient):
+	def __init__(self, server_ip=None, server_port=None, units=None, poll_interval_seconds=None, pipeline_depth=1, metrics=None, backoff=None):
+		self.units = units
+		# the read requests of each unit carry its own unit ID, the client is given the ID of the first unit
+		super().__init__(
+				server_ip=server_ip,
+				server_port=server_port,
+				server_id=units[0].server_id,
+				poll_interval_seconds=poll_interval_seconds,
+				pipeline_depth=pipeline_depth,
+				metrics=metrics,
+				backoff=backoff
+			)
+		self.transactions = []
+		# unit polled by each transaction
+		self.transaction_units = []
+		for unit in units:
+			self.transactions += unit.transactions
+			self.transaction_units += [unit]*len(unit.transactions)
+		self.scan_class_schedule = ScanClassSchedule(self.transactions, self.poll_interval_seconds)
+		print('\t[INFO] Client will poll',str(len(units)),'unit(s) with',str(len(self.transactions)),'read request(s) over one connection')
+		print('\t[INFO] Client will poll the Modbus IDs:\t\t\t\t\t',', '.join(str(unit.server_id) for unit in units))
+		if len(self.scan_class_schedule.scan_classes) > 1:
+			self.scan_class_schedule.print_scan_classes()
+
+	# Method to build the record of a unit that could not be read at this poll cycle: timestamps and quality only, no tag values
+	def unit_bad_quality_record(self, unit, err, ts_utc, ts_local, time_format, timestamp_ns):
+		unit.stats['bad_quality_records'] += 1
+		if err is not None:
+			unit.stats['last_error'] = err if isinstance(err, str) else repr(err)
+		return {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_BAD, 'timestamp_ns': timestamp_ns}
+
+	# Method to poll the scan classes due at this tick, across all the units, and return a (unit, record) pair for each unit polled, None when nothing is due
+	# a Modbus exception response (ex: gateway target device failed to respond) only makes the record of its own unit quality-bad
+	def cycle_poll(self, time_format = '%Y-%m-%d %H:%M:%S%z'):
+		due_transactions = self.scan_class_schedule.due()
+		if not due_transactions:
+			return None
+		if self.metrics is not None:
+			started = time.perf_counter()
+		timestamp_ns = time.time_ns()
+		ts_local = datetime.datetime.fromtimestamp(timestamp_ns / 1000000000).astimezone()
+		ts_utc = ts_local.astimezone(datetime.timezone.utc)
+		due_units = []
+		for transaction_index in due_transactions:
+			if self.transaction_units[transaction_index] not in due_units:
+				due_units.append(self.transaction_units[transaction_index])
+		connected = self.try_connect()
+		if connected:
+			modbus_errors = {}
+			try:
+				interpreted_responses = self.poll_transactions(due_transactions, modbus_errors)
+			except (OSError, EOFError, ValueError) as err:
+				print('\t[WARNING] connection to the Modbus TCP gateway lost:',repr(err))
+				# not connected anymore when the serial fallback could not reconnect, its connection loss and failed attempt are already recorded
+				if self.sock is not None:
+					self.health.connection_lost(err)
+					if self.metrics is not None:
+						self.metrics.inc('modbus_connections_lost_total')
+				self.disconnect()
+				connected = False
+		if not connected:
+			# the connection is down, none of the units due could be read
+			if self.metrics is not None:
+				self.metrics.inc('modbus_poll_errors_total', len(due_units))
+			return [(unit, self.unit_bad_quality_record(unit, self.health.stats['last_error'], ts_utc, ts_local, time_format, timestamp_ns)) for unit in due_units]
+		if self.metrics is not None:
+			polled = time.perf_counter()
+		failed_units = {}
+		for transaction_index, interpreted_response in zip(due_transactions, interpreted_responses):
+			unit = self.transaction_units[transaction_index]
+			if transaction_index in modbus_errors:
+				failed_units.setdefault(unit, modbus_errors[transaction_index])
+				continue
+			unit.latest_values.update(interpreted_response)
+		unit_records = []
+		for unit in due_units:
+			if unit in failed_units:
+				unit_records.append((unit, self.unit_bad_quality_record(unit, failed_units[unit], ts_utc, ts_local, time_format, timestamp_ns)))
+				continue
+			unit.stats['records'] += 1
+			combined_responses = {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_GOOD, 'timestamp_ns': timestamp_ns}
+			combined_responses.update(unit.latest_values)
+			unit_records.append((unit, combined_responses))
+		if self.metrics is not None:
+			combined = time.perf_counter()
+			self.metrics.observe('combine_tag_responses', combined - polled)
+			self.metrics.observe('cycle', combined - started)
+			self.metrics.inc('modbus_cycles_total')
+			if failed_units:
+				self.metrics.inc('modbus_poll_errors_total', len(failed_units))
+		return unit_records
+
+# data logger of the units of a Modbus config .json file listing "units": one connection to the gateway, one set of log files per unit
+class ModbusTCPGatewayDataLogger:
+	def termination_signal_handler(self, signal, frame):
+		print('\nYou pressed Ctrl+C!')
+		for unit in self.units:
+			if unit.data_log is not None:
+				unit.data_log.close()
+			if unit.snapshot is not None:
+				unit.snapshot.close()
+			unit.print_stats()
+		self.modbus_tcp_client.disconnect()
+		self.poll_scheduler.print_stats()
+		self.modbus_tcp_client.health.print_stats()
+		if self.profile:
+			self.metrics.print_profile()
+		print('Bye!')
+		time.sleep(2)
+		sys.exit(0)
+
+	# metrics is an optional StageMetrics instrumenting the hot path, its per-stage breakdown is printed when exiting with profile=True
+	def __init__(self, full_path_to_modbus_config_json=None, full_path_to_logged_data=None, quiet=False, data_logging=True, metrics=None, profile=False):
+		if full_path_to_modbus_config_json is None:
+			print('\t[ERROR] a Modbus config.json file is required for a ModbusTCPGatewayDataLogger instance')
+			print('\t[ERROR] please provide the full path to the Modbus config.json file')
+			return
+		if full_path_to_logged_data is None:
+			full_path_to_logged_data = ModbusHelper.default_log_file_location()
+		self.modbus_config = ModbusHelper.parse_json_config(full_path_to_modbus_config_json)
+		if self.modbus_config is None:
+			print('\t[ERROR] An error occured while parsing the Modbus json configuration file!')
+			print('\t[ERROR] Please review the error messages, correct the Modbus json configuration file and try again.')
+			print('\t[ERROR] Now exiting Python with sys.exit()')
+			sys.exit()
+		if not self.modbus_config['units']:
+			print('\t[ERROR] no "units" listed in the Modbus json configuration file:',str(full_path_to_modbus_config_json))
+			print('\t[ERROR] Now exiting Python with sys.exit()')
+			sys.exit()
+		if self.modbus_config['log_file_type'] not in ModbusHelper.LOG_FILE_TYPES:
+			print('\t[ERROR] on "log_file_type": '+str(self.modbus_config['log_file_type']))
+			print('\t[ERROR] currently supported log_file_type are',ModbusHelper.LOG_FILE_TYPES)
+			print('\t[ERROR] Now exiting Python with sys.exit()')
+			sys.exit()
+		if self.modbus_config['log_file_type'] == 'mbraw':
+			print('\t[ERROR] raw captures (log_file_type "mbraw") are only supported when polling a single Modbus TCP Server, not the units of a gateway')
+			print('\t[ERROR] Now exiting Python with sys.exit()')
+			sys.exit()
+		if profile and (metrics is None):
+			metrics = StageMetrics()
+		self.metrics = metrics
+		self.profile = profile
+
+		self.units = []
+		for unit in self.modbus_config['units']:
+			print('\t[INFO] unit',str(unit['server_id']),'polled with template',str(unit['template']))
+			self.units.append(ModbusGatewayUnit(
+					server_id=unit['server_id'],
+					full_path_to_modbus_template_csv=unit['template'],
+					log_file_name=unit['log_file_name'],
+					poll_interval_seconds=unit['poll_interval_seconds'],
+					max_gap=self.modbus_config['max_gap'],
+					max_read_sizes=self.modbus_config['max_read_sizes']
+				))
+		# the connection is instrumented as the gateway, the log files of each unit as the unit
+		gateway_metrics = None
+		if self.metrics is not None:
+			gateway_metrics = self.metrics.device(self.modbus_config['log_file_name'])
+		self.modbus_tcp_client = ModbusTCPGatewayClient(
+				server_ip=self.modbus_config['server_ip'],
+				server_port=self.modbus_config['server_port'],
+				units=self.units,
+				poll_interval_seconds=self.modbus_config['poll_interval_seconds'],
+				pipeline_depth=self.modbus_config['pipeline_depth'],
+				metrics=gateway_metrics,
+				backoff=ReconnectBackoff(
+					initial_seconds=self.modbus_config['reconnect_initial_seconds'],
+					max_seconds=self.modbus_config['reconnect_max_seconds'],
+					jitter=self.modbus_config['reconnect_jitter']
+				)
+			)
+		if data_logging:
+			for unit in self.units:
+				unit_config = dict(self.modbus_config)
+				unit_config['log_file_name'] = unit.log_file_name
+				unit.data_log = ModbusDataLog(
+						unit_config,
+						full_path_to_logged_data,
+						ModbusHelper.record_column_types(unit.interpreter_helper),
+						ModbusHelper.record_compression_settings(unit.interpreter_helper),
+						None if self.metrics is None else self.metrics.device(unit.log_file_name)
+					)
+		if self.modbus_config['history_records'] > 0:
+			for unit in self.units:
+				unit.history = RecordHistory.build(ModbusHelper.record_column_types(unit.interpreter_helper), self.modbus_config['history_records'])
+		# one shared memory block per unit: snapshot_name suffixed with "_unit_" and the unit ID
+		if self.modbus_config['snapshot_name'] is not None:
+			for unit in self.units:
+				unit.snapshot = SnapshotPublisher(self.modbus_config['snapshot_name']+'_unit_'+str(unit.server_id), ModbusHelper.record_column_types(unit.interpreter_helper))
+		# a Modbus TCP gateway not reachable yet is retried by the poll cycles, as after a lost connection
+		self.modbus_tcp_client.try_connect(self.modbus_config['server_timeout_seconds'])
+
+		self.poll_scheduler = PollScheduler(
+				interval_seconds=self.modbus_tcp_client.scan_class_schedule.base_interval_seconds,
+				overrun_policy=self.modbus_config['overrun_policy'],
+				align_to_interval=self.modbus_config['align_poll_interval']
+			)
+
+		signal.signal(signal.SIGINT, self.termination_signal_handler)
+		signal.signal(signal.SIGTERM, self.termination_signal_handler)
+
+		print('Press Ctrl+C to stop and exit gracefully...')
+		while True:
+			missed_deadlines = self.poll_scheduler.wait()
+			if missed_deadlines and not quiet:
+				print('\t[WARNING] previous poll cycle overran the poll interval of',str(self.poll_scheduler.interval_seconds),'seconds,',str(missed_deadlines),'poll deadline(s) skipped')
+			unit_records = self.modbus_tcp_client.cycle_poll()
+			if unit_records is None:
+				continue
+			for unit, modbus_poll_response in unit_records:
+				if unit.data_log is not None:
+					unit.data_log.append(modbus_poll_response)
+				if unit.history is not None:
+					unit.history.append(modbus_poll_response)
+				if unit.snapshot is not None:
+					unit.snapshot.publish(modbus_poll_response)
+				if not quiet:
+					print('\t[INFO] unit',str(unit.server_id),'('+str(unit.log_file_name)+')')
+					ModbusHelper.pretty_print(modbus_poll_response)
@@ -0,0 +1,116 @@
+import os, sys
+try:
+	import numpy as np
+except ImportError:
+	np = None
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from columnar_helper import ColumnarLogFormat
+
+# in-memory history of the last window_records polled records: one preallocated NumPy column per tag (typed as in the .mbcol log files),
+# an int64 "timestamp_ns" column (the time of the poll cycle of the record, in nanoseconds since the Unix epoch, UTC) and a bool "quality" column
+# each sample is written twice, at its slot and at its slot + window_records, so that the last n samples (n <= window_records) are always
+# contiguous in memory: latest(), window() and last() return views of the columns without copying them
+# the views are live, the samples they show are overwritten window_records records later, copy them (ex: view.copy()) to keep them longer
+class RecordHistory(object):
+
+	TIMESTAMP_COLUMN = 'timestamp_ns'
+	QUALITY_COLUMN = 'quality'
+
+	def __init__(self, column_types, window_records=3600):
+		self.window_records = window_records
+		self.column_types = {RecordHistory.TIMESTAMP_COLUMN: 'int64', RecordHistory.QUALITY_COLUMN: 'bool'}
+		self.column_types.update(column_types)
+		# column: (array of 2*window_records samples, value stored for a tag missing from a record)
+		self.arrays = {}
+		for column, column_type in self.column_types.items():
+			typecode, dtype, item_size, missing = ColumnarLogFormat.COLUMN_TYPES[column_type]
+			self.arrays[column] = (np.zeros(2*window_records, dtype=np.dtype(dtype).newbyteorder('=')), missing)
+		self.record_count = 0
+
+	# Method to build a history of window_records records, None when NumPy is not installed
+	@classmethod
+	def build(cls, column_types, window_records=3600):
+		if np is None:
+			print('\t[ERROR] NumPy is required to keep the history of the polled records, please install it with: pip3 install numpy')
+			print('\t[ERROR] the history of the polled records is disabled')
+			return None
+		return cls(column_types, window_records)
+
+	def __len__(self):
+		return min(self.record_count, self.window_records)
+
+	@property
+	def columns(self):
+		return list(self.column_types)
+
+	# Method to append one polled record, overwriting the oldest one once window_records records are held
+	def append(self, record):
+		slot = self.record_count % self.window_records
+		mirror = slot + self.window_records
+		for column, (array, missing) in self.arrays.items():
+			value = record.get(column, missing)
+			array[slot] = value
+			array[mirror] = value
+		self.record_count += 1
+
+	# Method to return the bounds, in the doubled arrays, of the last n records held
+	def bounds(self, n):
+		n = min(n, len(self))
+		end = self.record_count % self.window_records + self.window_records
+		return end - n, end
+
+	# Method to return views of the last n records of some columns (all of them by default), oldest first
+	def last(self, n, columns=None):
+		if columns is None:
+			columns = self.columns
+		start, end = self.bounds(n)
+		return {column: self.arrays[column][0][start:end] for column in columns if column in self.arrays}
+
+	# Method to return the latest value of some columns (all of them by default), None when no record is held yet
+	def latest(self, columns=None):
+		if len(self) == 0:
+			return None
+		if columns is None:
+			columns = self.columns
+		start, end = self.bounds(1)
+		return {column: self.arrays[column][0][start].item() for column in columns if column in self.arrays}
+
+	# Method to return views of the records between start_ns and end_ns (both included) of some columns (all of them by default)
+	# with seconds, the window is the last seconds seconds up to the latest record instead
+	def window(self, start_ns=None, end_ns=None, columns=None, seconds=None):
+		if columns is None:
+			columns = self.columns
+		start, end = self.bounds(self.window_records)
+		timestamps = self.arrays[RecordHistory.TIMESTAMP_COLUMN][0][start:end]
+		if (seconds is not None) and len(timestamps):
+			end_ns = int(timestamps[-1])
+			start_ns = end_ns - int(seconds*1000000000)
+		# timestamps only go backward if the wall clock does, the records are then held in poll order
+		low = 0 if start_ns is None else int(np.searchsorted(timestamps, start_ns, 'left'))
+		high = len(timestamps) if end_ns is None else int(np.searchsorted(timestamps, end_ns, 'right'))
+		return {column: self.arrays[column][0][start+low:start+max(low, high)] for column in columns if column in self.arrays}
+
+	# Method to compute the statistics of one column over a window (see window()), quality-bad records excluded
+	# it returns a dict of count, min, max, mean, std, first and last (None when there is no value in the window)
+	def stats(self, column, start_ns=None, end_ns=None, seconds=None):
+		if column not in self.arrays:
+			print('\t[WARNING] column "'+str(column)+'" not found in the history')
+			return None
+		views = self.window(start_ns, end_ns, [column, RecordHistory.QUALITY_COLUMN], seconds)
+		values = views[column]
+		quality = views[RecordHistory.QUALITY_COLUMN]
+		if not quality.all():
+			values = values[quality]
+		if values.dtype.kind == 'f':
+			values = values[~np.isnan(values)]
+		if len(values) == 0:
+			return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None, 'first': None, 'last': None}
+		return {
+			'count': len(values),
+			'min': values.min().item(),
+			'max': values.max().item(),
+			'mean': float(values.mean()),
+			'std': float(values.std()),
+			'first': values[0].item(),
+			'last': values[-1].item()
+		}
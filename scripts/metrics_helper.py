@@ -0,0 +1,183 @@
+import time, bisect, threading, http.server
+
+# low-overhead instrumentation of the poll hot path: per-stage timing histograms and counters, labelled per device and per call group
+# the stages of a poll cycle are:
+#	'request_build':			patching the transaction IDs of the prebuilt request frames of the call groups sent together
+#	'round_trip':				from the request of a call group written to the socket to its response received, per call group
+#	'interpret_response':		decoding the response of a call group into tag values, per call group
+#	'combine_tag_responses':	merging the decoded call groups into one record
+#	'cycle':					the whole poll cycle, i.e. all of the above
+#	'pretty_print':				printing the record to the terminal
+#	'write_data_to_disk':		writing one batch of records to the live log file (on the background writer thread when there is one)
+#	'connect':					opening the connection to the Modbus TCP Server, on start and on each reconnect
+# the metrics are rendered in the Prometheus text exposition format by render(), served by MetricsServer, and summarized by print_profile()
+# with pipeline_depth > 1 the round trips of the call groups in flight overlap, so that their sum can exceed the cycle time
+class StageMetrics(object):
+
+	# histogram bucket upper bounds, in seconds
+	BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+	STAGES = ['request_build', 'round_trip', 'interpret_response', 'combine_tag_responses', 'cycle', 'pretty_print', 'write_data_to_disk', 'connect']
+
+	COUNTERS = {
+		'modbus_cycles_total': 'Poll cycles completed',
+		'modbus_poll_errors_total': 'Poll cycles failed, each one logged as a quality-bad record',
+		'modbus_connections_lost_total': 'Connections to the Modbus TCP Server found broken while polling',
+		'modbus_requests_total': 'Read requests sent',
+		'modbus_bytes_sent_total': 'Bytes of Modbus TCP frames sent',
+		'modbus_bytes_received_total': 'Bytes of Modbus TCP frames received',
+		'modbus_log_flushes_total': 'Batches of records written to the live log file',
+		'modbus_log_records_total': 'Records written to the live log file',
+		'modbus_log_rotations_total': 'Live log files rotated'
+	}
+
+	def __init__(self):
+		# (device, stage, call_group): [count per bucket (last one is +Inf), count, sum, max]
+		self.histograms = {}
+		# (name, device): value
+		self.counters = {}
+		# only held to create a new series and to take a consistent copy of all of them, increments are done without it
+		self.lock = threading.Lock()
+		self.started = time.monotonic()
+
+	# Method to get the metrics of one device, bound to its label
+	def device(self, device):
+		return DeviceMetrics(self, str(device))
+
+	def observe(self, device, stage, seconds, call_group=''):
+		key = (device, stage, call_group)
+		histogram = self.histograms.get(key)
+		if histogram is None:
+			with self.lock:
+				histogram = self.histograms.setdefault(key, [[0]*(len(StageMetrics.BUCKETS)+1), 0, 0.0, 0.0])
+		histogram[0][bisect.bisect_left(StageMetrics.BUCKETS, seconds)] += 1
+		histogram[1] += 1
+		histogram[2] += seconds
+		if seconds > histogram[3]:
+			histogram[3] = seconds
+
+	def inc(self, device, name, value=1):
+		key = (name, device)
+		if key not in self.counters:
+			with self.lock:
+				self.counters.setdefault(key, 0)
+		self.counters[key] += value
+
+	# Method to escape a label value of the Prometheus text format
+	@classmethod
+	def escape(cls, value):
+		return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+	# Method to render all the metrics in the Prometheus text exposition format (version 0.0.4)
+	def render(self):
+		with self.lock:
+			histograms = sorted((key, [list(histogram[0])] + histogram[1:]) for key, histogram in self.histograms.items())
+			counters = sorted(self.counters.items())
+		lines = [
+			'# HELP modbus_stage_seconds Time spent in each stage of the poll hot path',
+			'# TYPE modbus_stage_seconds histogram'
+		]
+		for (device, stage, call_group), (bucket_counts, count, total, maximum) in histograms:
+			labels = 'device="'+self.escape(device)+'",stage="'+self.escape(stage)+'",call_group="'+self.escape(call_group)+'"'
+			cumulative = 0
+			for bound, bucket_count in zip(StageMetrics.BUCKETS, bucket_counts):
+				cumulative += bucket_count
+				lines.append('modbus_stage_seconds_bucket{'+labels+',le="'+repr(bound)+'"} '+str(cumulative))
+			lines.append('modbus_stage_seconds_bucket{'+labels+',le="+Inf"} '+str(count))
+			lines.append('modbus_stage_seconds_sum{'+labels+'} '+repr(total))
+			lines.append('modbus_stage_seconds_count{'+labels+'} '+str(count))
+		for name in StageMetrics.COUNTERS:
+			series = [(device, value) for (counter_name, device), value in counters if counter_name == name]
+			if not series:
+				continue
+			lines.append('# HELP '+name+' '+StageMetrics.COUNTERS[name])
+			lines.append('# TYPE '+name+' counter')
+			for device, value in series:
+				lines.append(name+'{device="'+self.escape(device)+'"} '+str(value))
+		lines.append('# HELP modbus_uptime_seconds Seconds since the metrics were started')
+		lines.append('# TYPE modbus_uptime_seconds gauge')
+		lines.append('modbus_uptime_seconds '+repr(time.monotonic() - self.started))
+		return '\n'.join(lines)+'\n'
+
+	# Method to print the per-stage breakdown of each device, call groups summed up per stage, to be called when exiting
+	def print_profile(self):
+		with self.lock:
+			histograms = sorted((key, histogram[1:]) for key, histogram in self.histograms.items())
+			counters = sorted(self.counters.items())
+		stages = {}
+		for (device, stage, call_group), (count, total, maximum) in histograms:
+			summed = stages.setdefault(device, {}).setdefault(stage, [0, 0.0, 0.0, 0])
+			summed[0] += count
+			summed[1] += total
+			summed[2] = max(summed[2], maximum)
+			summed[3] += 1
+		print('')
+		print('\t[INFO] profile of the poll hot path over',str(round(time.monotonic() - self.started, 1)),'seconds')
+		for device in stages:
+			cycle_seconds = stages[device].get('cycle', [0, 0.0])[1]
+			print('\t[INFO] device:',device)
+			print('\t\t'+'stage'.ljust(24)+'calls'.rjust(10)+'total s'.rjust(11)+'mean ms'.rjust(11)+'max ms'.rjust(11)+'% of cycle'.rjust(12)+'call groups'.rjust(13))
+			for stage in StageMetrics.STAGES:
+				if stage not in stages[device]:
+					continue
+				count, total, maximum, call_groups = stages[device][stage]
+				share = ('%.1f' % (100*total/cycle_seconds)) if cycle_seconds and (stage not in ['cycle', 'pretty_print', 'write_data_to_disk', 'connect']) else '-'
+				print('\t\t'+stage.ljust(24)+str(count).rjust(10)+('%.3f' % total).rjust(11)+('%.3f' % (1000*total/count)).rjust(11)+('%.3f' % (1000*maximum)).rjust(11)+share.rjust(12)+str(call_groups).rjust(13))
+			device_counters = [(name, value) for (name, counter_device), value in counters if counter_device == device]
+			if device_counters:
+				print('\t\t'+', '.join(str(name)+'='+str(value) for name, value in device_counters))
+		print('')
+
+# metrics of one device, so that the instrumented code does not carry its device label around
+class DeviceMetrics(object):
+	def __init__(self, stage_metrics, device):
+		self.stage_metrics = stage_metrics
+		self.device = device
+
+	def observe(self, stage, seconds, call_group=''):
+		self.stage_metrics.observe(self.device, stage, seconds, call_group)
+
+	def inc(self, name, value=1):
+		self.stage_metrics.inc(self.device, name, value)
+
+# local HTTP endpoint serving the metrics in the Prometheus text format on /metrics, from a background thread
+class MetricsServer(object):
+	def __init__(self, stage_metrics, port=9502, host='127.0.0.1'):
+		self.stage_metrics = stage_metrics
+		self.host = host
+		self.port = port
+		self.server = None
+		self.thread = None
+
+	def start(self):
+		stage_metrics = self.stage_metrics
+		class RequestHandler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] not in ['/metrics', '/']:
+					self.send_error(404)
+					return
+				body = stage_metrics.render().encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+			def log_message(self, format, *args):
+				# scrapes are not worth a line in the terminal
+				pass
+		try:
+			self.server = http.server.ThreadingHTTPServer((self.host, self.port), RequestHandler)
+		except OSError as err:
+			print('\t[ERROR] unable to serve the metrics on',str(self.host)+':'+str(self.port),'-',str(err))
+			return False
+		self.server.daemon_threads = True
+		self.thread = threading.Thread(target=self.server.serve_forever, name='metrics server', daemon=True)
+		self.thread.start()
+		print('\t[INFO] metrics served in the Prometheus text format on http://'+str(self.host)+':'+str(self.server.server_address[1])+'/metrics')
+		return True
+
+	def stop(self):
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
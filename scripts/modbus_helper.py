@@ -1,7 +1,26 @@
-import os, sys, socket, datetime, time, math, csv, json, signal
+import os, sys, socket, datetime, time, math, json, signal, struct
+try:
+	import numpy as np
+except ImportError:
+	np = None
 from umodbus.client import tcp
+from umodbus.exceptions import ModbusError, ServerDeviceBusyError, error_code_to_exception_map
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 from data_helper import DataHelper
+from schedule_helper import PollScheduler, ScanClassSchedule
+from writer_helper import BackgroundWriter
+from sink_helper import CSVLogSink
+from columnar_helper import ColumnarLogSink
+from capture_helper import RawCaptureFormat, RawCaptureSink
+from sqlite_helper import SQLiteLogSink
+from compression_helper import RecordCompressor
+from metrics_helper import StageMetrics
+from connection_helper import ReconnectBackoff, ConnectionHealth
+from history_helper import RecordHistory
+from snapshot_helper import SnapshotPublisher
+from spool_helper import RecordSpool
+from rollup_helper import RecordRollups
+from archive_helper import RotatedFileCompressor
 
 class ModbusHelper(object):
 
@@ -20,6 +39,19 @@ class ModbusHelper(object):
 		'04': tcp.read_input_registers
 	}
 
+	# supported log file types, "ndjson" is line-delimited json (one json record per line) appended to on each write
+	# "mbraw" captures the raw responses without decoding them while polling (see capture_helper), to be decoded later into any other log file type
+	# "sqlite" inserts the records in a database that is never rotated, the oldest records are deleted after sqlite_retention_seconds instead
+	LOG_FILE_TYPES = ['csv', 'json', 'ndjson', 'mbcol', 'mbraw', 'sqlite']
+
+	# maximum quantity of bits (FC01/FC02) or 16-bit registers (FC03/FC04) that a single Modbus read request may ask for
+	MAX_READ_SIZES = {
+		'01': 2000,
+		'02': 2000,
+		'03': 125,
+		'04': 125
+	}
+
 	DATA_TYPES_REGISTER_COUNT = {
 		'uint16': 1,
 		'sint16': 1,
@@ -36,16 +68,75 @@ class ModbusHelper(object):
 		'coil': 1
 	}
 
+	# struct format character used to unpack each data_type from the raw Big-Endian response bytes
+	# byte/word swapped data types are unpacked as raw bytes and finished by their DATA_TYPES_CONVERTER
+	DATA_TYPES_STRUCT_FORMAT = {
+		'uint16': 'H',
+		'sint16': 'h',
+		'float32': 'f',
+		'float64': 'd',
+		'packedbool': 'H',
+		'ruint16': '2s',
+		'rsint16': '2s',
+		'rfloat32_byte_swap': '4s',
+		'rfloat32_word_swap': '4s',
+		'rfloat32_byte_word_swap': '4s'
+	}
+
+	DATA_TYPES_CONVERTER = {
+		'ruint16': DataHelper.bytes_16_swapped_to_int_16_unsigned,
+		'rsint16': DataHelper.bytes_16_swapped_to_int_16_signed,
+		'rfloat32_byte_swap': DataHelper.bytes_32_byte_swap_to_float,
+		'rfloat32_word_swap': DataHelper.bytes_32_word_swap_to_float,
+		'rfloat32_byte_word_swap': DataHelper.bytes_32_byte_word_swap_to_float
+	}
+
+	# NumPy dtype each data_type is read with from the raw Big-Endian response bytes, see decode_registers_array
+	# byte swapped 16-bit types and the byte-and-word swapped float32 are read as Little-Endian, the byte or word swapped float32 as two (2) 16-bit words
+	DATA_TYPES_ARRAY_DTYPE = {
+		'uint16': '>u2',
+		'sint16': '>i2',
+		'float32': '>f4',
+		'float64': '>f8',
+		'packedbool': '>u2',
+		'ruint16': '<u2',
+		'rsint16': '<i2',
+		'rfloat32_byte_swap': ('<u2', (2,)), # [B A] [D C] read as the words AB and CD
+		'rfloat32_word_swap': ('>u2', (2,)), # [C D] [A B] read as the words CD and AB
+		'rfloat32_byte_word_swap': '<f4'
+	}
+
+	# type of the decoded value of each data_type once stored in a typed column, a scaled tag is always stored as float64
+	DATA_TYPES_COLUMN_TYPE = {
+		'uint16': 'uint16',
+		'sint16': 'int16',
+		'float32': 'float32',
+		'float64': 'float64',
+		'packedbool': 'uint16',
+		'ruint16': 'uint16',
+		'rsint16': 'int16',
+		'rfloat32_byte_swap': 'float32',
+		'rfloat32_word_swap': 'float32',
+		'rfloat32_byte_word_swap': 'float32',
+		'di': 'bool',
+		'coil': 'bool'
+	}
+
 	# Method to parse a Modbus template .csv configuration file and build the various Modbus TCP calls the client shall send in an "optimized" way (optimized to reduce/minimize the number of calls)
+	# max_gap is the number of unused addresses that may be over-read to merge two reads, max_read_sizes overrides MAX_READ_SIZES per function code
 	# it returns 2 elements: call_groups and interpreter_helper
 	@classmethod
-	def parse_template_build_calls(cls, full_path_to_modbus_template_csv):
+	def parse_template_build_calls(cls, full_path_to_modbus_template_csv, max_gap=0, max_read_sizes=None):
+		return cls.parse_template_lod_build_calls(DataHelper.csv_to_lod(full_path_to_modbus_template_csv), max_gap, max_read_sizes)
+
+	# Method to build the call_groups and interpreter_helper of parse_template_build_calls from the rows of a template already read (ex: from a .mbraw capture)
+	@classmethod
+	def parse_template_lod_build_calls(cls, template_lod, max_gap=0, max_read_sizes=None):
 		call_groups = {}
 		interpreter_helper = {}
-		template_lod = DataHelper.csv_to_lod(full_path_to_modbus_template_csv)
-		
+
 		# find unique/distinct read_type
-		for read_entry in template_lod:
+		for template_row, read_entry in enumerate(template_lod):
 			read_address = read_entry['address']
 
 			# skip entry if there is no address (mandatory field)
@@ -116,38 +207,550 @@ class ModbusHelper(object):
 						interpreter_helper[fc]['address_maps'][int(read_address)]['tag_name'] = read_tag_name
 						interpreter_helper[fc]['address_maps'][int(read_address)]['scaling_coeff'] = read_entry['scaling_coeff']
 						interpreter_helper[fc]['address_maps'][int(read_address)]['scaling_offset'] = read_entry['scaling_offset']
+						interpreter_helper[fc]['address_maps'][int(read_address)]['template_row'] = template_row
+						# optional report-by-exception columns of the template
+						interpreter_helper[fc]['address_maps'][int(read_address)]['deadband'] = read_entry.get('deadband')
+						interpreter_helper[fc]['address_maps'][int(read_address)]['max_interval'] = read_entry.get('max_interval')
+						interpreter_helper[fc]['address_maps'][int(read_address)]['compression'] = read_entry.get('compression')
+						# optional scan class of the tag, None for the poll_interval_seconds of the config
+						interpreter_helper[fc]['address_maps'][int(read_address)]['poll_interval'] = cls.parse_poll_interval(read_entry.get('poll_interval'), read_tag_name)
 
 						for call_address in range(int(read_address),int(read_address)+ModbusHelper.DATA_TYPES_REGISTER_COUNT[read_data_type]):
 							interpreter_helper[fc]['addresses'].append(call_address)
 						break
 		
+		# reads are only merged within a scan class, each call group is tagged with the poll_interval of its scan class
 		for fc in interpreter_helper:
-			previous_address = None
-			for address in sorted(interpreter_helper[fc]['addresses']):
-				if previous_address is None:
-					call_groups[fc].append({'start_address': address, 'register_count': 1})
-				else:
-					address_delta = address - previous_address
-					if address_delta == 1:
-						call_groups[fc][-1]['register_count'] += 1						
-					else:
-						call_groups[fc].append({'start_address': address, 'register_count': 1})
-				previous_address = address
+			call_groups[fc] = []
+			for poll_interval, address_maps in cls.scan_class_address_maps(interpreter_helper[fc]['address_maps']).items():
+				for query in cls.plan_read_groups(fc, address_maps, max_gap, max_read_sizes):
+					query['poll_interval'] = poll_interval
+					call_groups[fc].append(query)
+			call_groups[fc].sort(key=lambda query: query['start_address'])
+
+		# precompile one decode plan per call group so that each response is decoded without any per-cycle lookups or parsing
+		for fc in interpreter_helper:
+			interpreter_helper[fc]['decode_plans'] = {}
+			scan_classes = cls.scan_class_address_maps(interpreter_helper[fc]['address_maps'])
+			for query in call_groups[fc]:
+				interpreter_helper[fc]['decode_plans'][query['start_address']] = cls.build_decode_plan(fc, query['start_address'], query['register_count'], scan_classes[query['poll_interval']])
 
 		return call_groups, interpreter_helper
 
+	# Method to plan the read requests of one function code from its address_maps
+	# tags are merged into the same read as long as the hole between them is at most max_gap addresses (the unused addresses are read and thrown away)
+	# and the read stays within the maximum read size of the function code; overlapping tags always share the same read
+	@classmethod
+	def plan_read_groups(cls, fc, address_maps, max_gap=0, max_read_sizes=None):
+		max_read_size = cls.MAX_READ_SIZES[fc]
+		if (max_read_sizes is not None) and (fc in max_read_sizes):
+			max_read_size = max_read_sizes[fc]
+		read_groups = []
+		group_end = None
+		for address in sorted(address_maps):
+			tag_end = address + address_maps[address]['count']
+			if (group_end is not None) and (address - group_end <= max_gap) and (max(group_end, tag_end) - read_groups[-1]['start_address'] <= max_read_size):
+				group_end = max(group_end, tag_end)
+				read_groups[-1]['register_count'] = group_end - read_groups[-1]['start_address']
+			else:
+				group_end = tag_end
+				read_groups.append({'start_address': address, 'register_count': tag_end - address})
+		return read_groups
+
+	# Method to split the address_maps of one function code by scan class, i.e. by the poll_interval of the tags (None for the poll_interval_seconds of the config)
+	@classmethod
+	def scan_class_address_maps(cls, address_maps):
+		scan_classes = {}
+		for address in address_maps:
+			scan_classes.setdefault(address_maps[address].get('poll_interval'), {})[address] = address_maps[address]
+		return scan_classes
+
+	# Method to convert the optional poll_interval of a template entry into a strictly positive float, None when not specified
+	@classmethod
+	def parse_poll_interval(cls, poll_interval, tag_name=None):
+		if (poll_interval is None) or (str(poll_interval).strip() == ''):
+			return None
+		try:
+			poll_interval = float(poll_interval)
+		except ValueError:
+			poll_interval = float('nan')
+		if math.isnan(poll_interval) or (not poll_interval > 0):
+			print('\n\t[WARNING] poll_interval should be a strictly positive number of seconds on tag_name "'+str(tag_name)+'"')
+			print('\t[WARNING] will default to the poll_interval_seconds of the config')
+			return None
+		return poll_interval
+
+	# Method to display the read plan built by parse_template_build_calls along with its estimated number of round trips per poll cycle of each scan class
+	@classmethod
+	def print_read_plan(cls, call_groups, interpreter_helper):
+		round_trips = 0
+		contiguous_round_trips = 0
+		scan_class_round_trips = {}
+		print('')
+		for fc in call_groups:
+			scan_classes = cls.scan_class_address_maps(interpreter_helper[fc]['address_maps'])
+			for address_maps in scan_classes.values():
+				contiguous_round_trips += len(cls.plan_read_groups(fc, address_maps, 0, {fc: sys.maxsize}))
+			for query in call_groups[fc]:
+				round_trips += 1
+				poll_interval = query.get('poll_interval')
+				scan_class_round_trips[str(poll_interval)] = scan_class_round_trips.get(str(poll_interval), 0) + 1
+				address_maps = scan_classes[poll_interval]
+				addresses = range(query['start_address'], query['start_address']+query['register_count'])
+				tag_count = len([address for address in addresses if address in address_maps])
+				used_count = len(set(used for address in addresses if address in address_maps for used in range(address, address+address_maps[address]['count'])))
+				scan_class = ''
+				if poll_interval is not None:
+					scan_class = ' poll_interval='+str(poll_interval)
+				print('\t[INFO] FC'+str(fc)+' read start_address='+str(query['start_address'])+' count='+str(query['register_count'])+' tags='+str(tag_count)+' unused='+str(query['register_count']-used_count)+scan_class)
+		if len(scan_class_round_trips) > 1:
+			for poll_interval, scan_class_round_trip in scan_class_round_trips.items():
+				if poll_interval == 'None':
+					poll_interval = 'poll_interval_seconds of the config'
+				print('\t[INFO] scan class',poll_interval+':',str(scan_class_round_trip),'round trip(s) per poll')
+		print('\t[INFO] estimated round trips per poll cycle of all the scan classes:',str(round_trips),'(contiguous reads only:',str(contiguous_round_trips)+')')
+		print('')
+		return round_trips
+
+	# Method to convert the scaling_coeff and scaling_offset strings of a template entry into floats, once, at template load
+	# returns None when no scaling applies (both null), otherwise a (coeff, offset) tuple with 1 and 0 used for a single missing value
+	@classmethod
+	def parse_scaling(cls, scaling_coeff, scaling_offset, tag_name=None):
+		parsed = []
+		for scaling_value in [scaling_coeff, scaling_offset]:
+			if (scaling_value is None) or (str(scaling_value).strip() == ''):
+				parsed.append(None)
+				continue
+			try:
+				scaling_value = float(scaling_value)
+			except ValueError:
+				print('\n\t[WARNING] Unable to convert scaling value "'+str(scaling_value)+'" to float on tag_name "'+str(tag_name)+'"')
+				print('\t[WARNING] Ignoring this scaling value')
+				scaling_value = None
+			if (scaling_value is not None) and math.isnan(scaling_value):
+				scaling_value = None
+			parsed.append(scaling_value)
+		applied_coeff, applied_offset = parsed
+		if (applied_coeff is None) and (applied_offset is None):
+			return None
+		if applied_coeff is None:
+			applied_coeff = 1.0
+		if applied_offset is None:
+			applied_offset = 0.0
+		return (applied_coeff, applied_offset)
+
+	# Method to build the decode plan of one call group from the address_maps of its function code
+	# for FC01/FC02 the plan lists the (bit index, tag_name) to pick from the response
+	# for FC03/FC04 the plan holds one precompiled struct.Struct per non-overlapping run of tags (normally a single one covering the whole response),
+	# with the tag order, the converter of swapped data types and the scaling already converted to floats
+	@classmethod
+	def build_decode_plan(cls, fc, start_address, register_count, address_maps):
+		decode_plan = {
+			'fc': fc,
+			'start_address': start_address,
+			'register_count': register_count
+		}
+		if fc in ['01', '02']:
+			decode_plan['bits'] = []
+			for address in range(start_address, start_address+register_count):
+				if address in address_maps:
+					decode_plan['bits'].append((address - start_address, address_maps[address]['tag_name']))
+			# in a raw response the bits are packed 8 per byte, least significant bit first
+			decode_plan['packed_bits'] = [(tag_name, bit_index >> 3, bit_index & 7) for bit_index, tag_name in decode_plan['bits']]
+			decode_plan['payload_size'] = (register_count + 7) // 8
+			return decode_plan
+
+		# umodbus returns the registers as a list of unsigned ints, packed back to bytes with this Struct
+		decode_plan['response_struct'] = struct.Struct('>'+str(register_count)+'H')
+		segments = []
+		segment = None
+		cursor = 0
+		# every tag with its data_type and byte offset, to decode many responses at once with NumPy
+		array_fields = []
+		for address in range(start_address, start_address+register_count):
+			if address not in address_maps:
+				continue
+			address_map = address_maps[address]
+			data_type = address_map['data_type']
+			offset = address - start_address
+			# tags extending past the end of the call group are decoded by the call group holding them entirely
+			if offset + address_map['count'] > register_count:
+				continue
+			# a tag overlapping the previous one starts a new segment
+			if (segment is None) or (offset < cursor):
+				segment = {'offset': offset, 'format': '>', 'fields': []}
+				segments.append(segment)
+				cursor = offset
+			if offset > cursor:
+				segment['format'] += str(2*(offset - cursor))+'x'
+			segment['format'] += cls.DATA_TYPES_STRUCT_FORMAT[data_type]
+			cursor = offset + address_map['count']
+
+			tag_name = address_map['tag_name']
+			bit_tags = None
+			scaling = cls.parse_scaling(address_map['scaling_coeff'], address_map['scaling_offset'], tag_name)
+			if data_type == 'packedbool':
+				# packedbool is never scaled; bits are listed from bit15 (MSB) down to bit0 (LSB)
+				bit_tags = [(tag_name+'_bit'+str(bit), bit) for bit in range(15, -1, -1)]
+				tag_name = tag_name+'_uint16_value'
+				scaling = None
+			segment['fields'].append((tag_name, cls.DATA_TYPES_CONVERTER.get(data_type), scaling, bit_tags))
+			array_fields.append((tag_name, data_type, 2*offset, scaling, bit_tags))
+
+		decode_plan['segments'] = [(2*segment['offset'], struct.Struct(segment['format']), segment['fields']) for segment in segments]
+		# the same segments padded to the whole data bytes of a response, to unpack many responses laid out back to back in one pass
+		decode_plan['payload_size'] = 2*register_count
+		decode_plan['batch_segments'] = []
+		for byte_offset, segment_struct, fields in decode_plan['segments']:
+			trailing = decode_plan['payload_size'] - byte_offset - segment_struct.size
+			batch_format = '>'+(str(byte_offset)+'x' if byte_offset else '')+segment_struct.format[1:]+(str(trailing)+'x' if trailing else '')
+			decode_plan['batch_segments'].append((struct.Struct(batch_format), fields))
+		decode_plan['array_fields'] = array_fields
+		# structured dtype viewing the data bytes of one response as one field per tag, the fields of overlapping tags overlap
+		decode_plan['array_dtype'] = None
+		if np is not None:
+			decode_plan['array_dtype'] = np.dtype({
+					'names': ['f'+str(field_index) for field_index in range(len(array_fields))],
+					'formats': [cls.DATA_TYPES_ARRAY_DTYPE[data_type] for tag_name, data_type, byte_offset, scaling, bit_tags in array_fields],
+					'offsets': [byte_offset for tag_name, data_type, byte_offset, scaling, bit_tags in array_fields],
+					'itemsize': decode_plan['payload_size']
+				})
+		return decode_plan
+
+	# Method to list, once at template load, the columns of a polled record: both timestamps then the tags in the order of the template rows
+	@classmethod
+	def record_columns(cls, interpreter_helper):
+		return ['timestamp_utc', 'timestamp_local', 'quality'] + list(cls.record_column_types(interpreter_helper))
+
+	# Method to list, in the order of the template rows, the address_map of each tag along with the (column, column type) it expands to in a polled record
+	# a packedbool tag expands to its uint16 value followed by its bits, from bit15 down to bit0, as decoded by build_decode_plan (bits are never scaled)
+	@classmethod
+	def record_tag_columns(cls, interpreter_helper):
+		template_tags = []
+		for fc in interpreter_helper:
+			for address_map in interpreter_helper[fc]['address_maps'].values():
+				template_tags.append((address_map['template_row'], address_map))
+		tag_columns = []
+		for template_row, address_map in sorted(template_tags, key=lambda template_tag: template_tag[0]):
+			tag_name = address_map['tag_name']
+			data_type = address_map['data_type']
+			if data_type == 'packedbool':
+				tag_column_types = [(tag_name+'_uint16_value', 'uint16')] + [(tag_name+'_bit'+str(bit), 'bool') for bit in range(15, -1, -1)]
+			elif (data_type not in ['di', 'coil']) and (cls.parse_scaling(address_map['scaling_coeff'], address_map['scaling_offset']) is not None):
+				tag_column_types = [(tag_name, 'float64')]
+			else:
+				tag_column_types = [(tag_name, cls.DATA_TYPES_COLUMN_TYPE[data_type])]
+			tag_columns.append((address_map, tag_column_types))
+		return tag_columns
+
+	# Method to map, in the order of the template rows, each tag of a polled record to the type of its typed column (see DATA_TYPES_COLUMN_TYPE)
+	@classmethod
+	def record_column_types(cls, interpreter_helper):
+		column_types = {}
+		for address_map, tag_column_types in cls.record_tag_columns(interpreter_helper):
+			for column, column_type in tag_column_types:
+				column_types.setdefault(column, column_type)
+		return column_types
+
+	# Method to parse the optional deadband, max_interval and compression columns of a template row
+	# it returns None for a tag written on every record, (method, deadband, max_interval) otherwise
+	@classmethod
+	def parse_compression(cls, deadband, max_interval, compression, tag_name=None):
+		parsed = []
+		for key, key_value in [('deadband', deadband), ('max_interval', max_interval)]:
+			if (key_value is None) or (str(key_value).strip() == ''):
+				parsed.append(None)
+				continue
+			try:
+				key_value = float(key_value)
+			except ValueError:
+				print('\n\t[WARNING] Unable to convert '+key+' "'+str(key_value)+'" to float on tag_name "'+str(tag_name)+'"')
+				print('\t[WARNING] Ignoring this '+key)
+				key_value = None
+			if (key_value is not None) and (math.isnan(key_value) or (key_value < 0) or ((key == 'max_interval') and (key_value == 0))):
+				print('\n\t[WARNING] '+key+' should be a positive number on tag_name "'+str(tag_name)+'", current value is',str(key_value))
+				print('\t[WARNING] Ignoring this '+key)
+				key_value = None
+			parsed.append(key_value)
+		deadband, max_interval = parsed
+		method = 'deadband'
+		if (compression is not None) and (str(compression).strip() != ''):
+			method = str(compression).strip()
+			if method not in RecordCompressor.METHODS:
+				print('\n\t[WARNING] Unknown compression "'+method+'" on tag_name "'+str(tag_name)+'", supported are',RecordCompressor.METHODS)
+				print('\t[WARNING] will default to "deadband"')
+				method = 'deadband'
+		elif (deadband is None) and (max_interval is None):
+			return None
+		if deadband is None:
+			deadband = 0.0
+		return (method, deadband, max_interval)
+
+	# Method to map each compressed tag of a polled record to its (method, deadband, max_interval) compression settings
+	# swinging door trending is only meant for analog values, bits fall back to deadband
+	@classmethod
+	def record_compression_settings(cls, interpreter_helper):
+		tag_settings = {}
+		for address_map, tag_column_types in cls.record_tag_columns(interpreter_helper):
+			compression = cls.parse_compression(address_map['deadband'], address_map['max_interval'], address_map['compression'], address_map['tag_name'])
+			if compression is None:
+				continue
+			for column, column_type in tag_column_types:
+				if (column_type == 'bool') and (compression[0] == 'swinging_door'):
+					tag_settings.setdefault(column, ('deadband', compression[1], compression[2]))
+				else:
+					tag_settings.setdefault(column, compression)
+		return tag_settings
+
+	# Method to prebuild, once at template load, everything a poll cycle needs to send the read request of each call group and receive its response
+	# only the transaction ID of the request frame is patched on each send, the response PDU is received into the preallocated buffer and decoded from it
+	# it returns the list of transactions in call group order
+	@classmethod
+	def build_transactions(cls, call_groups, interpreter_helper, server_id):
+		transactions = []
+		for fc in call_groups:
+			for query in call_groups[fc]:
+				if fc in ['01', '02']:
+					data_size = (query['register_count'] + 7) // 8
+				else:
+					data_size = 2*query['register_count']
+				# response PDU: function code, byte count and data
+				response_buffer = bytearray(2 + data_size)
+				transactions.append({
+					'fc': fc,
+					'start_address': query['start_address'],
+					# label of the call group in the metrics: function code and first-last address read
+					'call_group': fc+':'+str(query['start_address'])+'-'+str(query['start_address']+query['register_count']-1),
+					'poll_interval': query.get('poll_interval'),
+					'request_frame': bytearray(cls.UMODBUS_TCP_CALL[fc](slave_id=server_id, starting_address=query['start_address'], quantity=query['register_count'])),
+					'response_buffer': response_buffer,
+					'response_view': memoryview(response_buffer),
+					'decode_plan': interpreter_helper[fc]['decode_plans'][query['start_address']]
+				})
+		return transactions
+
+	# Method to decode the raw packed bytes of a FC01/FC02 response with its precompiled decode plan
+	@classmethod
+	def decode_bits(cls, decode_plan, payload, payload_offset=0):
+		return {tag_name: (payload[payload_offset+byte_index] >> shift) & 1 for tag_name, byte_index, shift in decode_plan['packed_bits']}
+
+	# Method to decode the raw data bytes of any response (after the byte count of the PDU) with its precompiled decode plan
+	# payload_offset allows decoding straight from a larger receive buffer without slicing it
+	@classmethod
+	def decode_response(cls, decode_plan, payload, payload_offset=0):
+		if 'bits' in decode_plan:
+			return cls.decode_bits(decode_plan, payload, payload_offset)
+		return cls.decode_registers(decode_plan, payload, payload_offset)
+
+	# Method to check a raw response PDU, raising the matching umodbus ModbusError on a Modbus exception response
+	# it returns the data bytes of the PDU, i.e. after the function code and byte count
+	@classmethod
+	def response_pdu_payload(cls, response_pdu):
+		if response_pdu[0] & 0x80:
+			raise error_code_to_exception_map.get(response_pdu[1], ModbusError)
+		return response_pdu[2:]
+
+	# Method to check that a response PDU answers the read request of its transaction: an exception response to its function code,
+	# or its function code followed by the byte count and the data bytes expected; a malformed response raises ValueError
+	@classmethod
+	def check_response_pdu(cls, transaction, response_pdu):
+		if response_pdu[0] & 0x80:
+			if (len(response_pdu) != 2) or (response_pdu[0] & 0x7F != int(transaction['fc'])):
+				raise ValueError('malformed exception response to '+transaction['call_group']+': '+bytes(response_pdu).hex())
+			return
+		if (len(response_pdu) != len(transaction['response_buffer'])) or (response_pdu[0] != int(transaction['fc'])) or (response_pdu[1] != len(response_pdu) - 2):
+			raise ValueError('malformed response to '+transaction['call_group']+': function code '+str(response_pdu[0])+', '+str(len(response_pdu))+' bytes, byte count '+str(response_pdu[1] if len(response_pdu) > 1 else None))
+
+	# Method to decode the raw Big-Endian bytes of a FC03/FC04 response with its precompiled decode plan
+	@classmethod
+	def decode_registers(cls, decode_plan, payload, payload_offset=0):
+		interpreted_response = {}
+		for byte_offset, segment_struct, fields in decode_plan['segments']:
+			for (tag_name, converter, scaling, bit_tags), rv in zip(fields, segment_struct.unpack_from(payload, payload_offset+byte_offset)):
+				if converter is not None:
+					rv = converter(rv)
+				if scaling is not None:
+					rv = rv*scaling[0] + scaling[1]
+				interpreted_response[tag_name] = rv
+				if bit_tags is not None:
+					for bit_tag_name, bit in bit_tags:
+						interpreted_response[bit_tag_name] = (rv >> bit) & 1
+		return interpreted_response
+
+	# Method to decode the data bytes of many responses of one call group at once, laid out back to back in payloads (payload_size bytes each)
+	# it returns the decoded values as columns, {tag_name: [value decoded from each response]}, the same values decode_response returns one response at a time
+	# the responses are decoded with NumPy when installed (see decode_registers_array), with one precompiled struct per segment otherwise
+	@classmethod
+	def decode_response_batch(cls, decode_plan, payloads):
+		payload_size = decode_plan['payload_size']
+		if np is not None:
+			if len(payloads) == 0:
+				return {}
+			if 'bits' in decode_plan:
+				columns = cls.decode_bits_array(decode_plan, np.frombuffer(payloads, dtype=np.uint8).reshape(-1, payload_size))
+			else:
+				columns = cls.decode_registers_array(decode_plan, np.frombuffer(payloads, dtype='>u2').reshape(-1, decode_plan['register_count']))
+			return {tag_name: values.tolist() for tag_name, values in columns.items()}
+		if 'bits' in decode_plan:
+			return {tag_name: [(byte >> shift) & 1 for byte in payloads[byte_index::payload_size]] for tag_name, byte_index, shift in decode_plan['packed_bits']}
+		columns = {}
+		if len(payloads) == 0:
+			return columns
+		for batch_struct, fields in decode_plan['batch_segments']:
+			for (tag_name, converter, scaling, bit_tags), values in zip(fields, zip(*batch_struct.iter_unpack(payloads))):
+				if converter is not None:
+					values = [converter(rv) for rv in values]
+				if scaling is not None:
+					coeff, offset = scaling
+					values = [rv*coeff + offset for rv in values]
+				columns[tag_name] = values
+				if bit_tags is not None:
+					for bit_tag_name, bit in bit_tags:
+						columns[bit_tag_name] = [(rv >> bit) & 1 for rv in values]
+		return columns
+
+	# Method to decode many FC01/FC02 responses of one call group at once from a 2-D uint8 array of their data bytes, one row per response
+	# it returns one NumPy array per tag
+	@classmethod
+	def decode_bits_array(cls, decode_plan, payloads):
+		return {tag_name: (payloads[:, byte_index] >> shift) & 1 for tag_name, byte_index, shift in decode_plan['packed_bits']}
+
+	# Method to decode many FC03/FC04 responses of one call group at once from a 2-D uint16 array of their registers, one row per response
+	# the rows are viewed through the structured dtype of the decode plan, so that each tag is a strided view of the registers read with its own
+	# byte order; byte or word swapped float32 are reassembled from their two (2) words and scaled tags cost one multiply and one add per column
+	# it returns one NumPy array per tag (float64 for the scaled tags, as decode_registers)
+	@classmethod
+	def decode_registers_array(cls, decode_plan, registers):
+		if np is None:
+			print('\t[ERROR] NumPy is required to decode responses as arrays, please install it with: pip3 install numpy')
+			return
+		# the data bytes of the responses in Big-Endian order, without a copy when the registers already are (ex: read from a raw capture)
+		registers = np.ascontiguousarray(registers, dtype='>u2')
+		responses = registers.view(decode_plan['array_dtype'])[:, 0]
+		columns = {}
+		for field_index, (tag_name, data_type, byte_offset, scaling, bit_tags) in enumerate(decode_plan['array_fields']):
+			values = responses['f'+str(field_index)]
+			if data_type == 'rfloat32_byte_swap':
+				values = ((values[:, 0].astype(np.uint32) << 16) | values[:, 1]).view(np.float32)
+			elif data_type == 'rfloat32_word_swap':
+				values = ((values[:, 1].astype(np.uint32) << 16) | values[:, 0]).view(np.float32)
+			if scaling is not None:
+				# NaN and infinite floats are scaled silently, as by decode_registers
+				with np.errstate(invalid='ignore', over='ignore'):
+					values = np.multiply(values, scaling[0], dtype=np.float64)
+					values += scaling[1]
+			columns[tag_name] = values
+			if bit_tags is not None:
+				for bit_tag_name, bit in bit_tags:
+					columns[bit_tag_name] = (values >> bit) & 1
+		return columns
+
+	# quality of a polled record: good when the due call groups were read, bad when the poll cycle failed (the record then holds no tag values)
+	QUALITY_GOOD = 1
+	QUALITY_BAD = 0
+
+	# defaults applied to the optional keys of a Modbus config .json file when they are not specified
+	CONFIG_DEFAULTS = {
+		'overrun_policy': 'skip',
+		'align_poll_interval': True,
+		'max_gap': 0,
+		'max_read_sizes': {},
+		'pipeline_depth': 1,
+		'writer_queue_size': 16,
+		'writer_queue_policy': 'block',
+		'csv_buffer_bytes': 1048576,
+		'csv_flush_records': 0,
+		'csv_flush_seconds': 0,
+		'csv_fsync_seconds': 0,
+		'spool': False,
+		'spool_commit_records': 0,
+		'spool_commit_seconds': 0,
+		'sqlite_retention_seconds': 0,
+		'rollup_windows_seconds': [],
+		'reconnect_initial_seconds': 1,
+		'reconnect_max_seconds': 60,
+		'reconnect_jitter': 0.5,
+		'history_records': 0,
+		'snapshot_name': None,
+		'units': []
+	}
+
+	@classmethod
+	def pretty_print(cls, to_print, max_items_per_line=5):
+		headers = list(to_print.keys())		
+		header_max_length = max([len(str(h)) for h in headers])
+		values = list(to_print.values())
+		value_max_length = max([len(str(v)) for v in values])
+		max_length = max(header_max_length,value_max_length)
+
+		headers_padded = [h.ljust(max_length) for h in headers]
+		values_padded = [str(v).ljust(max_length) for v in values]
+		
+		print('')
+		for i in range(0,len(headers_padded),max_items_per_line):			
+			header_line = ' | '.join(str(x) for x in headers_padded[i:i+max_items_per_line])
+			value_line = ' | '.join(str(v) for v in values_padded[i:i+max_items_per_line])
+			sep_line = '-'.ljust(len(header_line),'-')
+			print('\t',sep_line)
+			print('\t',header_line)
+			print('\t',value_line)
+		print('\t',sep_line)
+		print('')
+
+	# Method to return the default location of the data log files, the "data/" folder of modbus-dl
+	@classmethod
+	def default_log_file_location(cls):
+		print('\t[WARNING] no explicit path location provided on where to store data log files on the local system')
+		default_path_to_data_files = os.path.dirname(os.path.realpath(__file__)).replace(os.path.join('modbus-dl','scripts'),os.path.join('modbus-dl','data'))
+		print('\t[WARNING] will default to using:', str(default_path_to_data_files))
+		return default_path_to_data_files
+
+	# Method to parse a Modbus manifest .json file listing several Modbus TCP Servers to poll, ex:
+	# [{"config": "config/modbus_config_10.json", "template": "template/modbus_template_10_clean.csv"}, ...]
+	# relative paths not found from the current directory are looked up from the folder of the manifest
+	# it returns a list of (config, template) pairs
+	@classmethod
+	def parse_json_manifest(cls, full_path_to_modbus_manifest_json):
+		with open(full_path_to_modbus_manifest_json) as json_file:
+			manifest = json.load(json_file)
+		if not isinstance(manifest, list):
+			print('\t[ERROR] Error parsing manifest file:',str(full_path_to_modbus_manifest_json))
+			print('\t[ERROR] the manifest should be a list of {"config": ..., "template": ...} entries')
+			return
+		manifest_location = os.path.dirname(os.path.realpath(full_path_to_modbus_manifest_json))
+		devices = []
+		for entry in manifest:
+			if (not isinstance(entry, dict)) or ('config' not in entry) or ('template' not in entry):
+				print('\t[ERROR] Error parsing manifest file:',str(full_path_to_modbus_manifest_json))
+				print('\t[ERROR] invalid entry, both "config" and "template" are required:',str(entry))
+				return
+			device = []
+			for key in ['config','template']:
+				full_path = str(entry[key])
+				if (not os.path.isabs(full_path)) and (not os.path.isfile(full_path)):
+					full_path = os.path.join(manifest_location, full_path)
+				if not os.path.isfile(full_path):
+					print('\t[ERROR] Error parsing manifest file:',str(full_path_to_modbus_manifest_json))
+					print('\t[ERROR] unable to find the "'+key+'" file:',str(entry[key]))
+					return
+				device.append(full_path)
+			devices.append(tuple(device))
+		return devices
+
 	@classmethod
 	def parse_json_config(cls, full_path_to_modbus_config_json):
 		with open(full_path_to_modbus_config_json) as json_file:
 			config = json.load(json_file)
 		json_file.close()
+		for key in cls.CONFIG_DEFAULTS:
+			config.setdefault(key, cls.CONFIG_DEFAULTS[key])
 		
 		# perform input validation
 		for key in config:
 			key_value = config[key]
 
 			# for keys/values that should be entered as string
-			if key in ['server_ip','log_file_type','log_file_name']:
+			if key in ['server_ip','log_file_type','log_file_name','overrun_policy','writer_queue_policy']:
 				if not isinstance(key_value,str):
 					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 					print('\t[ERROR] value of key "'+str(key)+'" should be of type "string" (str)')
@@ -182,10 +785,10 @@ class ModbusHelper(object):
 									return
 				# check for valid/supported log_file_type
 				elif key == 'log_file_type':
-					if key_value not in ['csv','json']:
+					if key_value not in cls.LOG_FILE_TYPES:
 						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 						print('\t[ERROR] invalid/not supported "log_file_type" provided:',str(key_value))
-						print('\t[ERROR] please provide a valid/supported log_file_type, either "csv" or "json"')
+						print('\t[ERROR] please provide a valid/supported log_file_type, one of',cls.LOG_FILE_TYPES)
 						return
 				# remove ambiguous characters for log_file_name, replace them with "_"
 				elif key == 'log_file_name':
@@ -195,9 +798,23 @@ class ModbusHelper(object):
 							print('\t[WARNING] will be replace by "_":',str(key_value.replace(ambiguous_char,'_')))
 							config[key] = key_value.replace(ambiguous_char,'_')
 							key_value = config[key]
+				# check for valid/supported overrun_policy of the poll scheduler
+				elif key == 'overrun_policy':
+					if key_value not in PollScheduler.OVERRUN_POLICIES:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] invalid/not supported "overrun_policy" provided:',str(key_value))
+						print('\t[ERROR] please provide a valid/supported overrun_policy, one of',PollScheduler.OVERRUN_POLICIES)
+						return
+				# check for valid/supported queue policy of the background log writer
+				elif key == 'writer_queue_policy':
+					if key_value not in BackgroundWriter.QUEUE_POLICIES:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] invalid/not supported "writer_queue_policy" provided:',str(key_value))
+						print('\t[ERROR] please provide a valid/supported writer_queue_policy, one of',BackgroundWriter.QUEUE_POLICIES)
+						return
 
 			# for keys/values that should be entered as integer
-			elif key in ['server_port','server_id','in_memory_records']:
+			elif key in ['server_port','server_id','in_memory_records','max_gap','pipeline_depth','writer_queue_size','csv_buffer_bytes','csv_flush_records','spool_commit_records','history_records']:
 				if not isinstance(key_value,int):
 					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 					print('\t[ERROR] value of key "'+str(key)+'" should be of type "integer" (int)')
@@ -218,14 +835,51 @@ class ModbusHelper(object):
 						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 						print('\t[ERROR] invalid server ID "'+str(key_value)+'" out of valid range [0,255]')
 						return
+				# ensure only positive or zero values configured
+				elif key in ['max_gap','writer_queue_size','csv_buffer_bytes','csv_flush_records','spool_commit_records','history_records']:
+					if not key_value >= 0:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide a positive value >= 0 (0 allowed)')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
 				# ensure only strictly positive values configured
-				elif key == 'in_memory_records':
+				elif key in ['in_memory_records','pipeline_depth']:
 					if not key_value > 0:
 						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 						print('\t[ERROR] for key "'+str(key)+'", please provide a strictly positive value > 0 (0 NOT allowed!)')
 						print('\t[ERROR] current value provided is',str(key_value))
 						return				
 
+			# for keys/values that should be entered as either string or null
+			elif key in ['snapshot_name']:
+				if key_value is None:
+					continue
+				if not isinstance(key_value,str):
+					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+					print('\t[ERROR] value of key "'+str(key)+'" should be of type "string" (str) or "NoneType" (null)')
+					print('\t[ERROR] current type of value for key "'+str(key)+'" is',type(key_value),'and current value is config["'+str(key)+'"] =',str(key_value))
+					return
+				# the name of a shared memory block is a single file name under /dev/shm
+				if (key_value == '') or ('/' in key_value) or ('\\' in key_value):
+					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+					print('\t[ERROR] invalid shared memory block name "'+str(key_value)+'", please provide a non-empty name without "/" nor "\\"')
+					return
+
+			# for keys/values that should be entered as a list of strictly positive integers
+			elif key in ['rollup_windows_seconds']:
+				if not isinstance(key_value,list):
+					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+					print('\t[ERROR] value of key "'+str(key)+'" should be of type "list" (list), ex: [60, 3600]')
+					print('\t[ERROR] current type of value for key "'+str(key)+'" is',type(key_value),'and current value is config["'+str(key)+'"] =',str(key_value))
+					return
+				for window_seconds in key_value:
+					if (not isinstance(window_seconds,int)) or isinstance(window_seconds,bool) or (not window_seconds > 0):
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide strictly positive integer values > 0 (0 NOT allowed!)')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
+				config[key] = sorted(set(key_value))
+
 			# for keys/values that should be entered as either integer or null
 			elif key in ['json_indent']:
 				if (not isinstance(key_value,int)) and (not key_value is None):
@@ -244,20 +898,80 @@ class ModbusHelper(object):
 						return
 
 			# for keys/values that should be entered as either integer or float
-			elif key in ['poll_interval_seconds','server_timeout_seconds']:
+			elif key in ['poll_interval_seconds','server_timeout_seconds','csv_flush_seconds','csv_fsync_seconds','spool_commit_seconds','sqlite_retention_seconds','reconnect_initial_seconds','reconnect_max_seconds','reconnect_jitter']:
 				if not (isinstance(key_value,int) or isinstance(config[key],float)):
 					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 					print('\t[ERROR] value of key "'+str(key)+'" should be of type "integer" (int) or "float" (float)')
 					print('\t[ERROR] current type of value for key "'+str(key)+'" is',type(key_value),'and current value is config["'+str(key)+'"] =',str(key_value))
 					return
+				# ensure only strictly positive poll intervals configured
+				if key == 'poll_interval_seconds':
+					if not key_value > 0:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide a strictly positive value > 0 (0 NOT allowed!)')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
+				# ensure only positive or zero flush and fsync periods configured
+				elif key in ['csv_flush_seconds','csv_fsync_seconds','spool_commit_seconds','sqlite_retention_seconds']:
+					if not key_value >= 0:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide a positive value >= 0 (0 allowed)')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
+				# ensure only strictly positive reconnect delays configured
+				elif key in ['reconnect_initial_seconds','reconnect_max_seconds']:
+					if not key_value > 0:
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide a strictly positive value > 0 (0 NOT allowed!)')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
+				# ensure the jitter is a fraction of the reconnect delay
+				elif key == 'reconnect_jitter':
+					if not (0 <= key_value <= 1):
+						print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+						print('\t[ERROR] for key "'+str(key)+'", please provide a value in range [0,1]')
+						print('\t[ERROR] current value provided is',str(key_value))
+						return
+
+			# for keys/values that should be entered as boolean
+			elif key in ['align_poll_interval','spool']:
+				if not isinstance(key_value,bool):
+					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+					print('\t[ERROR] value of key "'+str(key)+'" should be of type "boolean" (bool), true or false')
+					print('\t[ERROR] current type of value for key "'+str(key)+'" is',type(key_value),'and current value is config["'+str(key)+'"] =',str(key_value))
+					return
 
 			# for keys/values that should be entered as dictionary
-			elif key in ['file_rotation']:
+			elif key in ['file_rotation','max_read_sizes']:
 				if not isinstance(key_value,dict):
 					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
 					print('\t[ERROR] value of key "'+str(key)+'" should be of type "dictionary" (dict)')
 					print('\t[ERROR] current type of value for key "'+str(key)+'" is',type(key_value),'and current value is config["'+str(key)+'"] =',str(ckey_value))
 					return
+				# max_read_sizes is keyed by function code, ex: {"03": 100, "04": 60}
+				if key == 'max_read_sizes':
+					for sub_key in list(key_value):
+						sub_key_value = config[key][sub_key]
+						fc = None
+						for function_code in cls.FUNCTION_CODES:
+							if (sub_key == function_code) or (sub_key in cls.FUNCTION_CODES[function_code]):
+								fc = function_code
+								break
+						if fc is None:
+							print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+							print('\t[ERROR] unknown function code "'+str(sub_key)+'" in "'+str(key)+'", supported are',[str(i) for i in cls.MAX_READ_SIZES])
+							return
+						if (not isinstance(sub_key_value,int)) or (not sub_key_value > 0):
+							print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+							print('\t[ERROR] value of sub_key "'+str(sub_key)+'" should be an integer >= 1')
+							print('\t[ERROR] current value for sub_key "'+str(sub_key)+'" is',str(sub_key_value))
+							return
+						if sub_key_value > cls.MAX_READ_SIZES[fc]:
+							print('\t[WARNING] "'+str(key)+'" of',str(sub_key_value),'for function code',fc,'is above the Modbus protocol limit of',str(cls.MAX_READ_SIZES[fc]))
+							print('\t[WARNING] make sure the Modbus TCP Server does support such large reads')
+						del config[key][sub_key]
+						config[key][fc] = sub_key_value
+					continue
 				# for keys/values that should be entered as integer
 				for sub_key in key_value:
 					sub_key_value = config[key][sub_key]
@@ -273,10 +987,202 @@ class ModbusHelper(object):
 							print('\t[ERROR] value of sub_key "'+str(sub_key)+'" should be an integer >= 1')
 							print('\t[ERROR] current value for sub_key "'+str(sub_key)+'" is',str(sub_key_value))
 							return
+					# compression of the rotated log files, either null or one of the supported methods
+					elif sub_key == 'compression':
+						if (sub_key_value is not None) and (sub_key_value not in RotatedFileCompressor.METHODS):
+							print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+							print('\t[ERROR] invalid/not supported "'+str(sub_key)+'" of "'+str(key)+'" provided:',str(sub_key_value))
+							print('\t[ERROR] please provide null or a valid/supported compression, one of',list(RotatedFileCompressor.METHODS))
+							return
+		if config['units']:
+			config['units'] = cls.parse_units(config, full_path_to_modbus_config_json)
+			if config['units'] is None:
+				return
 		return config
 
+	# Method to parse the "units" of a Modbus config .json file: the unit IDs (serial slaves) polled through one Modbus TCP gateway connection, ex:
+	# [{"server_id": 11, "template": "template/slave_11.csv", "log_file_name": "slave_11", "poll_interval_seconds": 5}, ...]
+	# "log_file_name" defaults to the log_file_name of the config suffixed with the unit ID, "poll_interval_seconds" to the one of the config
+	# relative template paths not found from the current directory are looked up from the folder of the config file
+	# it returns the list of units with all their keys filled
+	@classmethod
+	def parse_units(cls, config, full_path_to_modbus_config_json):
+		units = config['units']
+		if not isinstance(units, list):
+			print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+			print('\t[ERROR] value of key "units" should be a list of {"server_id": ..., "template": ...} entries')
+			return
+		config_location = os.path.dirname(os.path.realpath(full_path_to_modbus_config_json))
+		parsed_units = []
+		for unit in units:
+			if (not isinstance(unit, dict)) or ('server_id' not in unit) or ('template' not in unit):
+				print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+				print('\t[ERROR] invalid unit, both "server_id" and "template" are required:',str(unit))
+				return
+			if (not isinstance(unit['server_id'], int)) or (unit['server_id'] not in range(0,256)):
+				print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+				print('\t[ERROR] invalid unit server ID "'+str(unit['server_id'])+'" out of valid range [0,255]')
+				return
+			full_path_to_modbus_template_csv = str(unit['template'])
+			if (not os.path.isabs(full_path_to_modbus_template_csv)) and (not os.path.isfile(full_path_to_modbus_template_csv)):
+				full_path_to_modbus_template_csv = os.path.join(config_location, full_path_to_modbus_template_csv)
+			if not os.path.isfile(full_path_to_modbus_template_csv):
+				print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+				print('\t[ERROR] unable to find the template file of unit',str(unit['server_id'])+':',str(unit['template']))
+				return
+			log_file_name = unit.get('log_file_name', str(config['log_file_name'])+'_unit_'+str(unit['server_id']))
+			if not isinstance(log_file_name, str):
+				print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+				print('\t[ERROR] "log_file_name" of unit',str(unit['server_id']),'should be of type "string" (str)')
+				return
+			poll_interval_seconds = unit.get('poll_interval_seconds', config['poll_interval_seconds'])
+			if (not isinstance(poll_interval_seconds, (int, float))) or (not poll_interval_seconds > 0):
+				print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+				print('\t[ERROR] "poll_interval_seconds" of unit',str(unit['server_id']),'should be a strictly positive number, current value is',str(poll_interval_seconds))
+				return
+			for parsed_unit in parsed_units:
+				# two units writing to the same live log file would corrupt it
+				if log_file_name == parsed_unit['log_file_name']:
+					print('\t[ERROR] Error parsing config file:',str(full_path_to_modbus_config_json))
+					print('\t[ERROR] "log_file_name" of unit',str(unit['server_id']),'is already used by unit',str(parsed_unit['server_id'])+':',log_file_name)
+					return
+			parsed_units.append({
+				'server_id': unit['server_id'],
+				'template': full_path_to_modbus_template_csv,
+				'log_file_name': log_file_name,
+				'poll_interval_seconds': poll_interval_seconds
+			})
+		return parsed_units
+
+	# Method to tell whether a Modbus config .json file lists gateway "units", without validating it
+	@classmethod
+	def config_lists_units(cls, full_path_to_modbus_config_json):
+		try:
+			with open(full_path_to_modbus_config_json) as json_file:
+				config = json.load(json_file)
+		except (OSError, ValueError):
+			return False
+		return isinstance(config, dict) and bool(config.get('units'))
+
+# native Modbus TCP transport: sends the prebuilt request frames of ModbusHelper.build_transactions on a connected socket
+# and receives each response into its preallocated buffer with recv_into, so that framing does no per-cycle allocation
+class ModbusTCPTransport:
+
+	MBAP_HEADER = struct.Struct('>HHHB')
+	TRANSACTION_ID = struct.Struct('>H')
+
+	def __init__(self, sock, transactions, pipeline_depth=1, metrics=None):
+		self.sock = sock
+		self.transactions = transactions
+		# maximum number of requests in flight on the connection, 1 for serial request/response transactions
+		self.pipeline_depth = pipeline_depth
+		# DeviceMetrics of the device polled, None when the hot path is not instrumented
+		self.metrics = metrics
+		self.sent_at = [0.0]*len(transactions)
+		self.transaction_id = 0
+		self.header_buffer = bytearray(7)
+		self.header_view = memoryview(self.header_buffer)
+		self.in_flight = {}
+		self.interpreted_responses = [None]*len(transactions)
+
+	# Method to fill a memoryview with exactly its length of received bytes
+	def recv_exactly_into(self, view):
+		received = self.sock.recv_into(view)
+		while received < len(view):
+			if received == 0:
+				raise EOFError('connection closed by the Modbus TCP Server')
+			more = self.sock.recv_into(view[received:])
+			if more == 0:
+				raise EOFError('connection closed by the Modbus TCP Server')
+			received += more
+
+	# Method to send the requests of the transactions listed by index, in a single write when there are several
+	def send_requests(self, transaction_indexes):
+		if self.metrics is not None:
+			started = time.perf_counter()
+		frames = []
+		for transaction_index in transaction_indexes:
+			request_frame = self.transactions[transaction_index]['request_frame']
+			self.transaction_id = (self.transaction_id + 1) & 0xFFFF
+			ModbusTCPTransport.TRANSACTION_ID.pack_into(request_frame, 0, self.transaction_id)
+			self.in_flight[self.transaction_id] = transaction_index
+			frames.append(request_frame)
+		if len(frames) > 1:
+			frames = [b''.join(frames)]
+		if self.metrics is not None:
+			sent = time.perf_counter()
+			self.metrics.observe('request_build', sent - started)
+			self.metrics.inc('modbus_requests_total', len(transaction_indexes))
+			self.metrics.inc('modbus_bytes_sent_total', len(frames[0]))
+			for transaction_index in transaction_indexes:
+				self.sent_at[transaction_index] = sent
+		self.sock.sendall(frames[0])
+
+	# Method to receive one response into the buffer of its transaction, matched by MBAP transaction ID
+	# it returns the transaction index and the length of the received PDU
+	def receive_response(self):
+		self.recv_exactly_into(self.header_view)
+		transaction_id, protocol_id, length, unit_id = ModbusTCPTransport.MBAP_HEADER.unpack_from(self.header_buffer)
+		if transaction_id not in self.in_flight:
+			raise ValueError('unexpected transaction ID '+str(transaction_id)+' in response')
+		transaction_index = self.in_flight.pop(transaction_id)
+		# behind a gateway, a response from another unit than the one addressed shall not be logged under the unit of the request
+		if unit_id != self.transactions[transaction_index]['request_frame'][6]:
+			raise ValueError('unexpected unit ID '+str(unit_id)+' in response to transaction ID '+str(transaction_id))
+		response_view = self.transactions[transaction_index]['response_view']
+		if (length < 3) or (length - 1 > len(response_view)):
+			raise ValueError('unexpected response length '+str(length)+' for transaction ID '+str(transaction_id))
+		self.recv_exactly_into(response_view[:length - 1])
+		# the response buffers are reused from one cycle to the next, a short or mismatched response shall not be decoded over the previous one
+		ModbusHelper.check_response_pdu(self.transactions[transaction_index], response_view[:length - 1])
+		return transaction_index, length - 1
+
+	# Method to poll the transactions listed by index (all of them by default) with up to pipeline_depth requests written ahead of their responses
+	# it returns the interpreted responses in call group order
+	# a Modbus exception response is raised once all the responses in flight are read, unless a modbus_errors dict is given: the exception
+	# is then stored in it by transaction index and the interpreted response of that transaction is empty
+	# with decode=False the responses are left undecoded in the response buffers of the transactions (raw capture)
+	def poll(self, transaction_indexes=None, modbus_errors=None, decode=True):
+		if transaction_indexes is None:
+			transaction_indexes = range(len(self.transactions))
+		self.in_flight.clear()
+		modbus_error = None
+		next_transaction = 0
+		transaction_count = len(transaction_indexes)
+		while (next_transaction < transaction_count) or self.in_flight:
+			window = min(self.pipeline_depth - len(self.in_flight), transaction_count - next_transaction)
+			if window > 0:
+				self.send_requests(transaction_indexes[next_transaction:next_transaction + window])
+				next_transaction += window
+			transaction_index, pdu_length = self.receive_response()
+			transaction = self.transactions[transaction_index]
+			if self.metrics is not None:
+				received = time.perf_counter()
+				self.metrics.observe('round_trip', received - self.sent_at[transaction_index], transaction['call_group'])
+				self.metrics.inc('modbus_bytes_received_total', 7 + pdu_length)
+			response_buffer = transaction['response_buffer']
+			if response_buffer[0] & 0x80:
+				if modbus_errors is not None:
+					modbus_errors[transaction_index] = error_code_to_exception_map.get(response_buffer[1], ModbusError)()
+					self.interpreted_responses[transaction_index] = {}
+					continue
+				# keep on reading the responses still in flight so that the connection stays in sync, then raise
+				if modbus_error is None:
+					modbus_error = error_code_to_exception_map.get(response_buffer[1], ModbusError)
+				continue
+			if not decode:
+				continue
+			self.interpreted_responses[transaction_index] = ModbusHelper.decode_response(transaction['decode_plan'], response_buffer, 2)
+			if self.metrics is not None:
+				self.metrics.observe('interpret_response', time.perf_counter() - received, transaction['call_group'])
+		if modbus_error is not None:
+			raise modbus_error
+		if transaction_count == len(self.transactions):
+			return self.interpreted_responses
+		return [self.interpreted_responses[transaction_index] for transaction_index in transaction_indexes]
+
 class ModbusTCPClient:
-	def __init__(self, server_ip=None, server_port=None, server_id=None, poll_interval_seconds=None):
+	def __init__(self, server_ip=None, server_port=None, server_id=None, poll_interval_seconds=None, pipeline_depth=1, metrics=None, backoff=None):
 		if server_ip is None:
 			print('\t[ERROR] no server_ip argument provided to ModbusTCPClient instance')
 			print('\t[ERROR] server_port, server_id and poll_interval_seconds arguments will default to 502, 1, and 1 second respectively if not specified')
@@ -302,15 +1208,29 @@ class ModbusTCPClient:
 			default_poll_interval = '(default)'
 			poll_interval_seconds = 1
 		self.poll_interval_seconds = poll_interval_seconds
+		# maximum number of requests in flight on the connection, 1 for serial request/response transactions
+		self.pipeline_depth = pipeline_depth
+		# DeviceMetrics of the hot path stages, None when not instrumented
+		self.metrics = metrics
+		self.timeout = None
 		self.call_groups = None
 		self.interpreter_helper = None
+		self.transactions = None
+		self.scan_class_schedule = None
+		# latest values of every tag, records are built from them so that each record holds the last value of the scan classes not due
+		self.latest_values = {}
+		self.transport = None
 		self.sock = None
+		# connect latency, outages and reconnect schedule, a broken connection is re-opened with a jittered exponential backoff
+		self.health = ConnectionHealth(backoff)
 		print('\t[INFO] Client will attempt to connect to Modbus TCP Server at:\t\t\t',str(self.modbus_tcp_server_ip_address))
 		print('\t[INFO] Client will attempt to connect to Modbus TCP Server on port:\t\t',str(self.modbus_tcp_server_port),default_server_port)
 		print('\t[INFO] Client will attempt to connect to Modbus TCP Server with Modbus ID:\t',str(self.modbus_tcp_server_id),default_server_id)
 		print('\t[INFO] Client will attempt to poll the Modbus TCP Server every:\t\t\t',str(self.poll_interval_seconds)+' seconds',default_poll_interval)
+		if self.pipeline_depth > 1:
+			print('\t[INFO] Client will attempt to pipeline up to',str(self.pipeline_depth),'requests in flight per poll cycle')
 
-	def load_template(self, full_path_to_modbus_template_csv=None):
+	def load_template(self, full_path_to_modbus_template_csv=None, max_gap=0, max_read_sizes=None):
 		if full_path_to_modbus_template_csv is None:
 			print('\t[ERROR] in ModbusTCPClient.load_template(): please make sure to provide a valid path to a modbus_template.csv file')
 			return
@@ -318,121 +1238,62 @@ class ModbusTCPClient:
 			print('\t[ERROR] in ModbusTCPClient.load_template(): unable to find "'+str(full_path_to_modbus_template_csv)+'"')
 			return
 		else:
-			self.call_groups, self.interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv)
+			self.call_groups, self.interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv, max_gap, max_read_sizes)
+			self.transactions = ModbusHelper.build_transactions(self.call_groups, self.interpreter_helper, self.modbus_tcp_server_id)
+			self.scan_class_schedule = ScanClassSchedule(self.transactions, self.poll_interval_seconds)
+			if len(self.scan_class_schedule.scan_classes) > 1:
+				self.scan_class_schedule.print_scan_classes()
 
 	def connect(self, timeout=5):
+		self.timeout = timeout
 		socket.setdefaulttimeout(timeout)
-		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)		
-		self.sock.connect((self.modbus_tcp_server_ip_address, self.modbus_tcp_server_port))
+		started = time.perf_counter()
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)		
+		# requests are small and latency bound, do not let Nagle's algorithm hold them back
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		try:
+			sock.connect((self.modbus_tcp_server_ip_address, self.modbus_tcp_server_port))
+		except OSError:
+			sock.close()
+			raise
+		connect_seconds = time.perf_counter() - started
+		self.sock = sock
+		self.transport = ModbusTCPTransport(self.sock, self.transactions, self.pipeline_depth, self.metrics)
+		self.health.connect_succeeded(connect_seconds)
+		if self.metrics is not None:
+			self.metrics.observe('connect', connect_seconds)
+
+	# Method to (re)connect when the backoff allows it, without raising: it returns True when connected
+	# the parsed template, the transactions and the latest values are kept across reconnects
+	def try_connect(self, timeout=None):
+		if timeout is not None:
+			self.timeout = timeout
+		if self.sock is not None:
+			return True
+		if not self.health.reconnect_due():
+			return False
+		try:
+			self.connect(self.timeout)
+		except OSError as err:
+			delay = self.health.connect_failed(err)
+			print('\t[WARNING] unable to connect to the Modbus TCP Server at',str(self.modbus_tcp_server_ip_address)+':'+str(self.modbus_tcp_server_port),'-',repr(err))
+			print('\t[WARNING] next connection attempt in',str(round(delay, 2)),'seconds')
+			return False
+		if self.health.stats['connects'] > 1:
+			print('\t[INFO] reconnected to the Modbus TCP Server after an outage of',str(round(self.health.stats['outage_seconds_last'], 2)),'seconds')
+		return True
 
 	def disconnect(self):
-		self.sock.close()
+		if self.sock is not None:
+			self.sock.close()
+		self.sock = None
+		self.transport = None
 
 	def interpret_response(self, response, fc, start_address):
-		interpreted_response = {}
-		skip_next = False
-		skip_count = 0
-		for i in range(len(response)):
-			address_index = i + start_address
-			if fc in ['01', '02']:
-				#interpreted_response[self.interpreter_helper[fc]['address_tag_name_map'][address_index]] = response[i]
-				interpreted_response[self.interpreter_helper[fc]['address_maps'][address_index]['tag_name']] = response[i]
-			else:
-				if skip_next:
-					if skip_count == 0:
-						skip_next = False
-					elif skip_count == 1:
-						skip_count -= 1
-						skip_next = False
-					else:
-						skip_count -= 1
-					continue								
-
-				#given_data_type = self.interpreter_helper[fc]['address_data_type_map'][address_index]
-				given_data_type = self.interpreter_helper[fc]['address_maps'][address_index]['data_type']
-				if given_data_type == 'float32':
-					float_32_items = response[i:i+2]
-					float_32_binaries = [DataHelper.int_16_unsigned_to_binary(reg) for reg in float_32_items]
-					rv = DataHelper.binary_32_to_ieee_754_single_precision_float(''.join(float_32_binaries))
-					skip_next = True
-				elif given_data_type == 'sint16':
-					rv = DataHelper.int_16_unsigned_to_signed(response[i])
-					skip_next = False
-				elif given_data_type == 'uint16':
-					rv = response[i]
-					skip_next = False
-				elif given_data_type == 'float64':
-					float_64_items = response[i:i+4]
-					float_64_binaries = [DataHelper.int_16_unsigned_to_binary(reg) for reg in float_64_items]
-					rv = DataHelper.binary_64_to_ieee_754_single_precision_float(''.join(float_64_binaries))
-					skip_next = True
-					skip_count = 3
-				elif given_data_type == 'rsint16':
-					swapped_rv = DataHelper.binary_string_16_bits_to_int_16_unsigned(DataHelper.int_16_swap_bytes(DataHelper.int_16_unsigned_to_binary(response[i])))
-					rv = DataHelper.int_16_unsigned_to_signed(swapped_rv)
-					skip_next = False
-				elif given_data_type == 'ruint16':
-					rv = DataHelper.binary_string_16_bits_to_int_16_unsigned(DataHelper.int_16_swap_bytes(DataHelper.int_16_unsigned_to_binary(response[i])))					
-					skip_next = False
-				elif given_data_type == 'packedbool':
-					binary_string_register = DataHelper.int_16_unsigned_to_binary(response[i])
-					binary_string_register_list = []
-					binary_string_register_list[:0]= binary_string_register 
-					skip_next = False
-				elif given_data_type == 'rfloat32_byte_swap':
-					float_32_items = response[i:i+2]
-					float_32_binary_string = ''.join([DataHelper.int_16_unsigned_to_binary(reg) for reg in float_32_items])
-					swapped_rv = DataHelper.float32_swap_bytes(float_32_binary_string)
-					rv = DataHelper.binary_32_to_ieee_754_single_precision_float(swapped_rv)
-					skip_next = True
-				elif given_data_type == 'rfloat32_word_swap':
-					float_32_items = response[i:i+2]
-					float_32_binary_string = ''.join([DataHelper.int_16_unsigned_to_binary(reg) for reg in float_32_items])
-					swapped_rv = DataHelper.float32_swap_words(float_32_binary_string)
-					rv = DataHelper.binary_32_to_ieee_754_single_precision_float(swapped_rv)
-					skip_next = True
-				elif given_data_type == 'rfloat32_byte_word_swap':
-					float_32_items = response[i:i+2]
-					float_32_binary_string = ''.join([DataHelper.int_16_unsigned_to_binary(reg) for reg in float_32_items])
-					swapped_rv = DataHelper.float32_swap_bytes_words(float_32_binary_string)
-					rv = DataHelper.binary_32_to_ieee_754_single_precision_float(swapped_rv)
-					skip_next = True
-				else:
-					print('\t[ERROR] unsupported data_type of "'+str(given_data_type)+'" on tag_name = "'+self.interpreter_helper[fc]['address_maps'][address_index]['tag_name']+'"')
-					skip_next = False
-					continue
-
-				# evaluate scaling to apply
-				applied_coeff = self.interpreter_helper[fc]['address_maps'][address_index]['scaling_coeff']
-				applied_offset = self.interpreter_helper[fc]['address_maps'][address_index]['scaling_offset']
-				if (not applied_coeff) ^ (not applied_offset):
-					one_scaling_null = True
-					applied_coeff_null = not applied_coeff
-					both_null_case = False
-				elif (not applied_coeff) & (not applied_offset):
-					both_null_case = True
-				else:
-					applied_coeff_null = (math.isnan(float(applied_coeff)) or (applied_coeff is None))
-					one_scaling_null =  applied_coeff_null ^ (math.isnan(float(applied_offset)) or (applied_offset is None))
-					both_null_case = (math.isnan(float(applied_coeff)) or (applied_coeff is None)) & (math.isnan(float(applied_offset)) or (applied_offset is None))
-				if not both_null_case:
-					if not (given_data_type == 'packedbool'):
-						if one_scaling_null:
-							if applied_coeff_null:
-								applied_coeff = 1
-							else:
-								applied_offset = 0
-						rv = rv*float(applied_coeff) + float(applied_offset)
-
-				if given_data_type == 'packedbool':					
-					interpreted_response[self.interpreter_helper[fc]['address_maps'][address_index]['tag_name']+'_uint16_value'] = response[i]
-					for string_char_pos, string_char in enumerate(binary_string_register_list):
-						suffix = str(15 - string_char_pos)
-						interpreted_response[self.interpreter_helper[fc]['address_maps'][address_index]['tag_name']+'_bit'+suffix] = int(string_char)
-				else:
-					interpreted_response[self.interpreter_helper[fc]['address_maps'][address_index]['tag_name']] = rv
-
-		return interpreted_response
+		decode_plan = self.interpreter_helper[fc]['decode_plans'][start_address]
+		if fc in ['01', '02']:
+			return {tag_name: response[bit_index] for bit_index, tag_name in decode_plan['bits']}
+		return ModbusHelper.decode_registers(decode_plan, decode_plan['response_struct'].pack(*response))
 	
 	def combine_tag_responses(self, lod):
 		combined_responses = {}
@@ -441,87 +1302,407 @@ class ModbusTCPClient:
 				combined_responses[tag] = resp[tag]
 		return combined_responses
 
-	def cycle_poll(self, time_format = '%Y-%m-%d %H:%M:%S%z'):
-		ts_local = datetime.datetime.now().astimezone()
+	# Method to poll the due transactions, falling back once to serial transactions when the Modbus TCP Server fails on pipelined requests
+	def poll_transactions(self, due_transactions, modbus_errors=None, decode=True):
+		try:
+			return self.transport.poll(due_transactions, modbus_errors, decode)
+		except (OSError, EOFError, ValueError, ServerDeviceBusyError) as err:
+			if self.transport.pipeline_depth == 1:
+				raise
+			# some servers and gateways only handle one transaction at a time, fall back to serial transactions on a fresh connection
+			# the connection dropped for it is recorded as lost, as any other
+			print('\t[WARNING] pipelined poll failed with',repr(err))
+			self.health.connection_lost(err)
+			if self.metrics is not None:
+				self.metrics.inc('modbus_connections_lost_total')
+			pipeline_depth = self.pipeline_depth
+			self.pipeline_depth = 1
+			self.disconnect()
+			if modbus_errors is not None:
+				modbus_errors.clear()
+			try:
+				self.connect(self.timeout)
+			except OSError as connect_err:
+				# the next attempt follows the reconnect backoff, the connection is already recorded as lost
+				self.pipeline_depth = pipeline_depth
+				self.health.connect_failed(connect_err)
+				raise
+			try:
+				interpreted_responses = self.transport.poll(due_transactions, modbus_errors, decode)
+			except (OSError, EOFError, ValueError):
+				# serial requests fail as well, the connection was lost: keep on pipelining once reconnected
+				self.pipeline_depth = pipeline_depth
+				raise
+			print('\t[WARNING] Modbus TCP Server does not seem to support pipelined requests, falling back to serial requests')
+			return interpreted_responses
+
+	# Method to build the record of a poll cycle that could not read the Modbus TCP Server: timestamps and quality only, no tag values
+	def bad_quality_record(self, ts_utc, ts_local, time_format, timestamp_ns):
+		self.health.stats['bad_quality_records'] += 1
+		if self.metrics is not None:
+			self.metrics.inc('modbus_poll_errors_total')
+		return {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_BAD, 'timestamp_ns': timestamp_ns}
+
+	# Method to poll the scan classes due at this tick and return a record with the latest value of every tag, None when no scan class is due
+	# a cycle that fails (connection lost, timeout, Modbus exception) returns a quality-bad record instead of raising, a lost connection is re-opened
+	# on the following cycles with a jittered exponential backoff
+	# every record holds the time of the cycle in nanoseconds since the Unix epoch ("timestamp_ns"), timestamp_utc and timestamp_local being its text forms
+	# with capture=True the responses are not decoded: the record holds the data bytes of each call group read, by transaction index ("payloads"),
+	# as written to a .mbraw capture file
+	def cycle_poll(self, time_format = '%Y-%m-%d %H:%M:%S%z', capture=False):
+		due_transactions = self.scan_class_schedule.due()
+		if not due_transactions:
+			return None
+		if self.metrics is not None:
+			started = time.perf_counter()
+		timestamp_ns = time.time_ns()
+		ts_local = datetime.datetime.fromtimestamp(timestamp_ns / 1000000000).astimezone()
 		ts_utc = ts_local.astimezone(datetime.timezone.utc)
-		all_interpreted_responses = [{'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format)}]
-		for modbus_call in self.call_groups:
-			modbus_request = ModbusHelper.UMODBUS_TCP_CALL[modbus_call]
-			for query in self.call_groups[modbus_call]:
-				message = modbus_request(slave_id=self.modbus_tcp_server_id, starting_address=query['start_address'], quantity=query['register_count'])
-
-				# Response depends on Modbus function code.
-				response = tcp.send_message(message, self.sock)
-				interpreted_response = self.interpret_response(response, modbus_call, query['start_address'])
-				all_interpreted_responses.append(interpreted_response)
-		combined_responses = self.combine_tag_responses(all_interpreted_responses)
+		if not self.try_connect():
+			return self.bad_quality_record(ts_utc, ts_local, time_format, timestamp_ns)
+		try:
+			all_interpreted_responses = self.poll_transactions(due_transactions, decode=not capture)
+		except ModbusError as err:
+			# the transport reads all the responses in flight before raising, the connection is still usable
+			print('\t[WARNING] Modbus TCP Server answered with an exception:',repr(err))
+			return self.bad_quality_record(ts_utc, ts_local, time_format, timestamp_ns)
+		except (OSError, EOFError, ValueError) as err:
+			print('\t[WARNING] connection to the Modbus TCP Server lost:',repr(err))
+			# not connected anymore when the serial fallback could not reconnect, its connection loss and failed attempt are already recorded
+			if self.sock is not None:
+				self.health.connection_lost(err)
+				if self.metrics is not None:
+					self.metrics.inc('modbus_connections_lost_total')
+			self.disconnect()
+			return self.bad_quality_record(ts_utc, ts_local, time_format, timestamp_ns)
+		if capture:
+			raw_record = {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_GOOD, 'timestamp_ns': timestamp_ns}
+			raw_record['payloads'] = {transaction_index: bytes(self.transactions[transaction_index]['response_view'][2:]) for transaction_index in due_transactions}
+			if self.metrics is not None:
+				self.metrics.observe('cycle', time.perf_counter() - started)
+				self.metrics.inc('modbus_cycles_total')
+			return raw_record
+		if self.metrics is not None:
+			polled = time.perf_counter()
+		self.latest_values.update(self.combine_tag_responses(all_interpreted_responses))
+		combined_responses = {'timestamp_utc': ts_utc.strftime(time_format), 'timestamp_local': ts_local.strftime(time_format), 'quality': ModbusHelper.QUALITY_GOOD, 'timestamp_ns': timestamp_ns}
+		combined_responses.update(self.latest_values)
+		if self.metrics is not None:
+			combined = time.perf_counter()
+			self.metrics.observe('combine_tag_responses', combined - polled)
+			self.metrics.observe('cycle', combined - started)
+			self.metrics.inc('modbus_cycles_total')
 		return combined_responses
 
 	def pretty_print_interpreted_response(self, to_print, max_items_per_line=5):
-		headers = list(to_print.keys())		
-		header_max_length = max([len(str(h)) for h in headers])
-		values = list(to_print.values())
-		value_max_length = max([len(str(v)) for v in values])
-		max_length = max(header_max_length,value_max_length)
+		ModbusHelper.pretty_print(to_print, max_items_per_line)
 
-		headers_padded = [h.ljust(max_length) for h in headers]
-		values_padded = [str(v).ljust(max_length) for v in values]
-		
-		print('')
-		for i in range(0,len(headers_padded),max_items_per_line):			
-			header_line = ' | '.join(str(x) for x in headers_padded[i:i+max_items_per_line])
-			value_line = ' | '.join(str(v) for v in values_padded[i:i+max_items_per_line])
-			sep_line = '-'.ljust(len(header_line),'-')
-			print('\t',sep_line)
-			print('\t',header_line)
-			print('\t',value_line)
-		print('\t',sep_line)
-		print('')
+# in-memory buffering of the polled records of one Modbus TCP Server and their csv/json log files, shared by ModbusTCPDataLogger and the asyncio poller
+# raw_capture_schema is the schema of the .mbraw capture file written with log_file_type "mbraw" (see RawCaptureFormat.build_schema)
+class ModbusDataLog:
+	def __init__(self, modbus_config, log_file_location, column_types=None, compression_settings=None, metrics=None, raw_capture_schema=None):
+		self.modbus_config = modbus_config
+		self.log_file_location = log_file_location
+		# DeviceMetrics of the disk writes, None when not instrumented
+		self.metrics = metrics
+		# report-by-exception of the tags with deadband/max_interval/compression settings in the template, raw captures hold no tag values
+		self.compressor = None
+		if compression_settings and (self.modbus_config['log_file_type'] != 'mbraw'):
+			self.compressor = RecordCompressor(compression_settings)
+		# the live .csv, .mbcol and .sqlite files are kept open between batches and their columns are fixed once, from the template when provided
+		self.sink = None
+		if self.modbus_config['log_file_type'] == 'csv':
+			columns = None
+			if column_types is not None:
+				columns = ['timestamp_utc', 'timestamp_local', 'quality'] + list(column_types)
+			self.sink = CSVLogSink(
+					full_path_to_csv_file=os.path.join(self.log_file_location,self.modbus_config['log_file_name']+'.csv'),
+					columns=columns,
+					buffer_bytes=self.modbus_config['csv_buffer_bytes'],
+					flush_records=self.modbus_config['csv_flush_records'],
+					flush_seconds=self.modbus_config['csv_flush_seconds'],
+					fsync_seconds=self.modbus_config['csv_fsync_seconds']
+				)
+		elif self.modbus_config['log_file_type'] == 'mbcol':
+			if column_types is not None:
+				column_types = dict([('quality', 'bool')] + list(column_types.items()))
+			self.sink = ColumnarLogSink(
+					full_path_to_mbcol_file=os.path.join(self.log_file_location,self.modbus_config['log_file_name']+'.mbcol'),
+					column_types=column_types
+				)
+		elif self.modbus_config['log_file_type'] == 'sqlite':
+			self.sink = SQLiteLogSink(
+					full_path_to_sqlite_file=os.path.join(self.log_file_location,self.modbus_config['log_file_name']+'.sqlite'),
+					column_types=column_types,
+					retention_seconds=self.modbus_config['sqlite_retention_seconds']
+				)
+		elif self.modbus_config['log_file_type'] == 'mbraw':
+			self.sink = RawCaptureSink(
+					full_path_to_mbraw_file=os.path.join(self.log_file_location,self.modbus_config['log_file_name']+'.mbraw'),
+					schema=raw_capture_schema
+				)
+		self.in_memory_records = 0
+		self.written_to_live_file_records = 0
+		self.last_rotation_ns = 0
+		self.data = self.new_data()
+		# the rotated log files are compressed by a low priority background thread, None when disabled; the ones left over are compressed first
+		self.archiver = None
+		if self.modbus_config['file_rotation'].get('compression') is not None:
+			self.archiver = RotatedFileCompressor(
+					method=self.modbus_config['file_rotation']['compression'],
+					name=self.modbus_config['log_file_name']
+				)
+			self.archiver.recover(self.log_file_location, self.modbus_config['log_file_name'], self.modbus_config['log_file_type'])
+			self.archiver.start()
+		# write-ahead spool of the buffered records, None when disabled; the records left over by a logger that did not exit gracefully are written first
+		self.spool = None
+		if self.modbus_config['spool']:
+			self.spool = RecordSpool(
+					full_path_to_spool=os.path.join(self.log_file_location,self.modbus_config['log_file_name']),
+					commit_records=self.modbus_config['spool_commit_records'],
+					commit_seconds=self.modbus_config['spool_commit_seconds']
+				)
+			self.replay_spool()
+		# streaming rollups of the polled records, each window written to its own log files, None when disabled; raw captures hold no tag values
+		self.rollups = None
+		self.rollup_logs = {}
+		if self.modbus_config['rollup_windows_seconds']:
+			if self.modbus_config['log_file_type'] == 'mbraw':
+				print('\t[WARNING] raw captures are not decoded while polling, rollup_windows_seconds is ignored with log_file_type "mbraw"')
+			elif column_types is None:
+				print('\t[WARNING] the column types of the records are required to roll them up, rollup_windows_seconds is ignored')
+			else:
+				self.rollups = RecordRollups(column_types, self.modbus_config['rollup_windows_seconds'])
+				for window_seconds in self.rollups.windows_seconds:
+					self.rollup_logs[window_seconds] = ModbusDataLog(self.rollup_config(window_seconds), self.log_file_location, self.rollups.column_types(column_types))
+		# with a writer queue, serialization, appends and rotations run on a background thread so that the poll loop never waits on the disk
+		self.writer = None
+		if self.modbus_config['writer_queue_size'] > 0:
+			self.writer = BackgroundWriter(
+					write_batch=self.write_batch,
+					queue_size=self.modbus_config['writer_queue_size'],
+					queue_policy=self.modbus_config['writer_queue_policy'],
+					name=self.modbus_config['log_file_name'],
+					on_drop=self.drop_batch
+				)
+			self.writer.start()
 
-class ModbusTCPDataLogger:
-	def termination_signal_handler(self, signal, frame):
-		print('\nYou pressed Ctrl+C!')
-		if self.data_logging:
-			self.write_data_to_disk(self.data_log['data'], self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
+	# Method to derive the config of the log files of one rollup window from the one of the raw records: a rollup record is written as soon
+	# as its window closes, with neither spool nor retention (rollups are kept for longer than the raw records)
+	def rollup_config(self, window_seconds):
+		rollup_config = dict(self.modbus_config)
+		rollup_config.update({
+			'log_file_name': self.modbus_config['log_file_name']+'_rollup_'+str(window_seconds)+'s',
+			'in_memory_records': 1,
+			'spool': False,
+			'sqlite_retention_seconds': 0,
+			'rollup_windows_seconds': []
+		})
+		return rollup_config
+
+	def new_data(self):
+		if self.modbus_config['log_file_type'] == 'json':
+			return {}
+		return []
+
+	# Method to compress and buffer one polled record in memory, writing the buffered records to disk once the in_memory_records threshold is met
+	def append(self, modbus_poll_response):
+		# the rollups see every polled record, before report-by-exception
+		if self.rollups is not None:
+			for window_seconds, rollup_record in self.rollups.add(modbus_poll_response, modbus_poll_response['quality'] == ModbusHelper.QUALITY_GOOD):
+				self.rollup_logs[window_seconds].append(rollup_record)
+		if self.compressor is not None:
+			modbus_poll_response = self.compressor.compress(modbus_poll_response)
+			if modbus_poll_response is None:
+				return
+			self.compressor.count_written(modbus_poll_response)
+		self.buffer(modbus_poll_response)
+
+	def buffer(self, modbus_poll_response):
+		if self.spool is not None:
+			self.spool.append(modbus_poll_response)
+		if self.modbus_config['log_file_type'] == 'json':
+			self.data[modbus_poll_response['timestamp_utc']] = modbus_poll_response
+		else:
+			self.data.append(modbus_poll_response)
+		self.in_memory_records += 1
+		if self.in_memory_records >= self.modbus_config['in_memory_records']:
+			self.flush()
+
+	# Method to hand the buffered records over as one batch to the background writer, or to write them right away without a writer queue
+	def flush(self):
+		if self.in_memory_records == 0:
+			return
+		# the spooled records of the batch are held by their own segment until the batch is written
+		segment = None
+		if self.spool is not None:
+			segment = self.spool.seal()
+		batch = (self.data, self.in_memory_records, segment)
+		self.data = self.new_data()
+		self.in_memory_records = 0
+		if self.writer is not None:
+			self.writer.put(batch)
+		else:
+			self.write_batch(batch)
+
+	# Method to release the spool segment of a batch dropped by the writer queue policy, its records are lost and shall not be replayed at the next start
+	def drop_batch(self, batch):
+		data, records, segment = batch
+		if segment is not None:
+			self.spool.release(segment)
+
+	# Method to write one batch of records to the live log file and rotate it once the max_file_records threshold is met
+	def write_batch(self, batch):
+		data, records, segment = batch
+		if self.metrics is not None:
+			started = time.perf_counter()
+		self.write_data_to_disk(data, self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
+		if segment is not None:
+			# the records of the batch are forced to the storage in the live log file before their spool segment is deleted
+			self.sync_live_file()
+			self.spool.release(segment)
+		if self.metrics is not None:
+			self.metrics.observe('write_data_to_disk', time.perf_counter() - started)
+			self.metrics.inc('modbus_log_flushes_total')
+			self.metrics.inc('modbus_log_records_total', records)
+		# keep track of and update the amount of records written to disk
+		self.written_to_live_file_records += records
+		# check if the file should be rotated, i.e. if the max_file_records_threshold is met; a .sqlite database is pruned instead
+		if (self.written_to_live_file_records >= self.modbus_config['file_rotation']['max_file_records']) and (self.modbus_config['log_file_type'] != 'sqlite'):
 			self.rotate_file(self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
-		self.modbus_tcp_client.disconnect()
-		print('Bye!')
-		time.sleep(2)
-		sys.exit(0)
+			self.written_to_live_file_records = 0
+
+	# Method to write the remaining buffered records and rotate the live log file, to be called when exiting
+	def close(self):
+		if self.compressor is not None:
+			modbus_poll_response = self.compressor.flush()
+			if modbus_poll_response is not None:
+				self.compressor.count_written(modbus_poll_response)
+				self.buffer(modbus_poll_response)
+		self.flush()
+		if self.writer is not None:
+			self.writer.close()
+		if self.spool is not None:
+			self.spool.close()
+		if self.sink is not None:
+			self.sink.close()
+		if (self.written_to_live_file_records > 0) and (self.modbus_config['log_file_type'] != 'sqlite'):
+			self.rotate_file(self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
+			self.written_to_live_file_records = 0
+		# the windows still open are written as they are, they only cover the records polled so far
+		if self.rollups is not None:
+			for window_seconds, rollup_record in self.rollups.flush():
+				self.rollup_logs[window_seconds].append(rollup_record)
+			for rollup_log in self.rollup_logs.values():
+				rollup_log.close()
+		if self.archiver is not None:
+			self.archiver.close()
+
+	def print_stats(self):
+		if self.writer is not None:
+			self.writer.print_stats()
+		if self.compressor is not None:
+			self.compressor.print_stats()
+		if self.spool is not None:
+			self.spool.print_stats()
+		if self.rollups is not None:
+			self.rollups.print_stats()
+		if self.archiver is not None:
+			self.archiver.print_stats()
+
+	# Method to write the records left over in the spool by a logger that did not exit gracefully to the live log file, oldest segment first
+	def replay_spool(self):
+		for segment, records in self.spool.replay():
+			if not records:
+				self.spool.release(segment)
+				continue
+			print('\t[INFO] writing',str(len(records)),'spooled record(s) left over in',self.spool.segment_path(segment),'to the live log file')
+			data = self.new_data()
+			for modbus_poll_response in records:
+				if self.modbus_config['log_file_type'] == 'json':
+					data[modbus_poll_response['timestamp_utc']] = modbus_poll_response
+				else:
+					data.append(modbus_poll_response)
+			self.write_batch((data, len(records), segment))
+
+	# Method to force the records written to the live log file to the storage
+	def sync_live_file(self):
+		if self.sink is not None:
+			self.sink.sync()
+			return
+		full_path_to_log_file = os.path.join(self.log_file_location,self.modbus_config['log_file_name']+'.'+self.modbus_config['log_file_type'])
+		if os.path.exists(full_path_to_log_file):
+			with open(full_path_to_log_file, 'rb') as log_file:
+				os.fsync(log_file.fileno())
 
 	def write_data_to_disk(self, data, log_file_type, log_file_name):
+		if self.sink is not None:
+			self.sink.write_records(data)
+			return
 		full_path_to_log_file = os.path.join(self.log_file_location,log_file_name+'.'+log_file_type)
 		if not os.path.exists(full_path_to_log_file):
-			if log_file_type == 'csv':
-				DataHelper.lod_to_csv(
-						lod = data, 
-						full_path_to_csv_file = full_path_to_log_file
-					)
-			elif log_file_type == 'json':
+			if log_file_type == 'json':
 				with open(full_path_to_log_file, 'w') as fp:
 					json.dump(data, fp, indent=self.modbus_config['json_indent'])
 				fp.close()
+			elif log_file_type == 'ndjson':
+				DataHelper.lod_to_ndjson(data, full_path_to_log_file)
 		else:
-			if log_file_type == 'csv':
-				with open(full_path_to_log_file, 'a', newline='') as csv_log:
-					for record in data:
-						csv_log_append = csv.writer(csv_log)
-						csv_log_append.writerow(list(record.values()))
-			elif log_file_type == 'json':
+			if log_file_type == 'json':
 				with open(full_path_to_log_file,'r+') as json_log:
 					json_data = json.load(json_log)
 					json_data.update(data)
 					json_log.seek(0)
 					json.dump(json_data, json_log, indent=self.modbus_config['json_indent'])
+					json_log.truncate()
+			elif log_file_type == 'ndjson':
+				# only the new records are appended, the cost of a write does not grow with the size of the live file
+				DataHelper.lod_to_ndjson(data, full_path_to_log_file)
 		return
 
+	# Method to name a rotated log file after the time of the rotation in nanoseconds since the Unix epoch (19 digits, sortable as text)
+	# the time is bumped past the previous rotation and any existing rotated file, so that rotations within the same clock tick do not collide
+	def rotated_file_path(self, log_file_type, log_file_name):
+		rotation_ns = max(time.time_ns(), self.last_rotation_ns + 1)
+		while True:
+			full_path_to_log_file_rotated = os.path.join(self.log_file_location,log_file_name+'_'+str(rotation_ns)+'.'+log_file_type)
+			if (not os.path.exists(full_path_to_log_file_rotated)) and ((self.archiver is None) or (not os.path.exists(self.archiver.compressed_path(full_path_to_log_file_rotated)))):
+				break
+			rotation_ns += 1
+		self.last_rotation_ns = rotation_ns
+		return full_path_to_log_file_rotated
+
 	def rotate_file(self, log_file_type, log_file_name):
+		if self.sink is not None:
+			self.sink.close()
 		full_path_to_log_file = os.path.join(self.log_file_location,log_file_name+'.'+log_file_type)
-		ts_str = str(int(time.time())) #str(time.time_ns())
-		full_path_to_log_file_rotated = os.path.join(self.log_file_location,log_file_name+'_'+ts_str+'.'+log_file_type)
+		full_path_to_log_file_rotated = self.rotated_file_path(log_file_type, log_file_name)
 		os.rename(full_path_to_log_file, full_path_to_log_file_rotated)
+		if self.archiver is not None:
+			self.archiver.put(full_path_to_log_file_rotated)
+		if self.metrics is not None:
+			self.metrics.inc('modbus_log_rotations_total')
+
+class ModbusTCPDataLogger:
+	def termination_signal_handler(self, signal, frame):
+		print('\nYou pressed Ctrl+C!')
+		if self.data_logging:
+			self.data_log.close()
+			self.data_log.print_stats()
+		if self.snapshot is not None:
+			self.snapshot.close()
+			self.snapshot.print_stats()
+		self.modbus_tcp_client.disconnect()
+		self.poll_scheduler.print_stats()
+		self.modbus_tcp_client.health.print_stats()
+		if self.profile:
+			self.metrics.print_profile()
+		print('Bye!')
+		time.sleep(2)
+		sys.exit(0)
 
-	def __init__(self, full_path_to_modbus_config_json=None, full_path_to_modbus_template_csv=None, full_path_to_logged_data=None, quiet=False, data_logging=True):
+	# metrics is an optional StageMetrics instrumenting the hot path, its per-stage breakdown is printed when exiting with profile=True
+	def __init__(self, full_path_to_modbus_config_json=None, full_path_to_modbus_template_csv=None, full_path_to_logged_data=None, quiet=False, data_logging=True, metrics=None, profile=False):
 		if full_path_to_modbus_config_json is None:
 			print('\t[ERROR] a Modbus config.json file is required for a ModbusTCPDataLogger instance')
 			print('\t[ERROR] please provide the full path to the Modbus config.json file')
@@ -531,79 +1712,112 @@ class ModbusTCPDataLogger:
 			print('\t[ERROR] please provide the full path to the Modbus template.csv file')
 			return
 		if full_path_to_logged_data is None:
-			print('\t[WARNING] no explicit path location provided on where to store data log files on the local system')
-			default_path_to_data_files = os.path.dirname(os.path.realpath(__file__)).replace(os.path.join('modbus-dl','scripts'),os.path.join('modbus-dl','data'))
-			print('\t[WARNING] will default to using:', str(default_path_to_data_files))
-			full_path_to_logged_data = default_path_to_data_files
+			full_path_to_logged_data = ModbusHelper.default_log_file_location()
 		if not data_logging:
 			print('\t[WARNING] data logging functionality has been explicitely disbaled by setting data_logging=False')
 			print('\t[WARNING] this overwrites the "quiet" argument and means that quiet=False')
 			quiet = False
 		self.data_logging = data_logging
 		self.log_file_location = full_path_to_logged_data
+		if profile and (metrics is None):
+			metrics = StageMetrics()
+		self.metrics = metrics
+		self.profile = profile
 				
-		self.data_log = {
-			'in_memory_records': 0,
-			'written_to_live_file_records': 0
-		}
 		self.modbus_config = ModbusHelper.parse_json_config(full_path_to_modbus_config_json)
 		if self.modbus_config is None:
 			print('\t[ERROR] An error occured while parsing the Modbus json configuration file!')
 			print('\t[ERROR] Please review the error messages, correct the Modbus json configuration file and try again.')
 			print('\t[ERROR] Now exiting Python with sys.exit()')
 			sys.exit()
-		if self.modbus_config['log_file_type'] == 'csv':
-			self.data_log['data'] = []
-		elif self.modbus_config['log_file_type'] == 'json':
-			self.data_log['data'] = {}
-		else:
+		if self.modbus_config['log_file_type'] not in ModbusHelper.LOG_FILE_TYPES:
 			print('\t[ERROR] on "log_file_type": '+str(self.modbus_config['log_file_type']))
-			print('\t[ERROR] currently supported log_file_type are either "csv" or "json"')
+			print('\t[ERROR] currently supported log_file_type are',ModbusHelper.LOG_FILE_TYPES)
 			print('\t[ERROR] Now exiting Python with sys.exit()')
 			sys.exit()
-
+		device_metrics = None
+		if self.metrics is not None:
+			device_metrics = self.metrics.device(self.modbus_config['log_file_name'])
 		self.modbus_tcp_client = ModbusTCPClient(
 				server_ip=self.modbus_config['server_ip'],
 				server_port=self.modbus_config['server_port'],
 				server_id=self.modbus_config['server_id'],
-				poll_interval_seconds=self.modbus_config['poll_interval_seconds']
+				poll_interval_seconds=self.modbus_config['poll_interval_seconds'],
+				pipeline_depth=self.modbus_config['pipeline_depth'],
+				metrics=device_metrics,
+				backoff=ReconnectBackoff(
+					initial_seconds=self.modbus_config['reconnect_initial_seconds'],
+					max_seconds=self.modbus_config['reconnect_max_seconds'],
+					jitter=self.modbus_config['reconnect_jitter']
+				)
+			)
+		self.modbus_tcp_client.load_template(full_path_to_modbus_template_csv, self.modbus_config['max_gap'], self.modbus_config['max_read_sizes'])
+		# with log_file_type "mbraw" the responses are captured without being decoded, to be decoded later with modbus-dl.py -r
+		self.capture = (self.modbus_config['log_file_type'] == 'mbraw')
+		raw_capture_schema = None
+		if self.capture:
+			raw_capture_schema = RawCaptureFormat.build_schema(self.modbus_tcp_client.transactions, DataHelper.csv_to_lod(full_path_to_modbus_template_csv), self.modbus_config['server_id'])
+		self.data_log = ModbusDataLog(
+				self.modbus_config,
+				self.log_file_location,
+				ModbusHelper.record_column_types(self.modbus_tcp_client.interpreter_helper),
+				ModbusHelper.record_compression_settings(self.modbus_tcp_client.interpreter_helper),
+				device_metrics,
+				raw_capture_schema
+			)
+		if self.capture and ((self.modbus_config['history_records'] > 0) or (self.modbus_config['snapshot_name'] is not None)):
+			print('\t[WARNING] raw captures are not decoded while polling, history_records and snapshot_name are ignored with log_file_type "mbraw"')
+			self.modbus_config['history_records'] = 0
+			self.modbus_config['snapshot_name'] = None
+		# in-memory history of the last history_records records, None when disabled
+		self.history = None
+		if self.modbus_config['history_records'] > 0:
+			self.history = RecordHistory.build(ModbusHelper.record_column_types(self.modbus_tcp_client.interpreter_helper), self.modbus_config['history_records'])
+		# latest record published to a shared memory block for the other local processes, None when disabled
+		self.snapshot = None
+		if self.modbus_config['snapshot_name'] is not None:
+			self.snapshot = SnapshotPublisher(self.modbus_config['snapshot_name'], ModbusHelper.record_column_types(self.modbus_tcp_client.interpreter_helper))
+		# a Modbus TCP Server not reachable yet is retried by the poll cycles, as after a lost connection
+		self.modbus_tcp_client.try_connect(self.modbus_config['server_timeout_seconds'])
+
+		# polls are released on fixed deadlines of the monotonic clock, so that the poll rate does not drift with the cycle duration
+		self.poll_scheduler = PollScheduler(
+				interval_seconds=self.modbus_tcp_client.scan_class_schedule.base_interval_seconds,
+				overrun_policy=self.modbus_config['overrun_policy'],
+				align_to_interval=self.modbus_config['align_poll_interval']
 			)
-		self.modbus_tcp_client.load_template(full_path_to_modbus_template_csv)
-		self.modbus_tcp_client.connect(self.modbus_config['server_timeout_seconds'])				
 
 		signal.signal(signal.SIGINT, self.termination_signal_handler)
+		signal.signal(signal.SIGTERM, self.termination_signal_handler)
 
 		print('Press Ctrl+C to stop and exit gracefully...')
 		while True:
-			modbus_poll_response = self.modbus_tcp_client.cycle_poll()			
-			
+			missed_deadlines = self.poll_scheduler.wait()
+			if missed_deadlines and not quiet:
+				print('\t[WARNING] previous poll cycle overran the poll interval of',str(self.poll_scheduler.interval_seconds),'seconds,',str(missed_deadlines),'poll deadline(s) skipped')
+			modbus_poll_response = self.modbus_tcp_client.cycle_poll(capture=self.capture)
+			if modbus_poll_response is None:
+				continue
+
 			if self.data_logging:
-				# continue to load records in memory as long as in_memory_records threshold is not met
-				if self.data_log['in_memory_records'] < self.modbus_config['in_memory_records']:
-					if self.modbus_config['log_file_type'] == 'csv':
-						self.data_log['data'].append(modbus_poll_response)
-					elif self.modbus_config['log_file_type'] == 'json':
-						self.data_log['data'][modbus_poll_response['timestamp_utc']] = modbus_poll_response
-					self.data_log['in_memory_records'] += 1
-				
-				# if in_memory_recods threshold is met, time to write data to disk
-				elif self.data_log['in_memory_records'] == self.modbus_config['in_memory_records']:
-					self.write_data_to_disk(self.data_log['data'], self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
-					
-					# keep track of and update the amount of records written to disk
-					self.data_log['written_to_live_file_records'] += self.data_log['in_memory_records']				
-					# check if the file should be rotated, i.e. if the max_file_records_threshold is met
-					if self.data_log['written_to_live_file_records'] >= self.modbus_config['file_rotation']['max_file_records']:
-						self.rotate_file(self.modbus_config['log_file_type'], self.modbus_config['log_file_name'])
-						self.data_log['written_to_live_file_records'] = 0
-
-					if self.modbus_config['log_file_type'] == 'csv':
-						self.data_log['data'] = [modbus_poll_response]
-					elif self.modbus_config['log_file_type'] == 'json':
-						self.data_log['data'] = {modbus_poll_response['timestamp_utc']: modbus_poll_response}
-					self.data_log['in_memory_records'] = 1
+				self.data_log.append(modbus_poll_response)
+			if self.history is not None:
+				self.history.append(modbus_poll_response)
+			if self.snapshot is not None:
+				self.snapshot.publish(modbus_poll_response)
 
 			if not quiet:
+				if device_metrics is not None:
+					started = time.perf_counter()
+				if self.capture:
+					# the raw payloads are not worth printing
+					modbus_poll_response = {
+						'timestamp_utc': modbus_poll_response['timestamp_utc'],
+						'timestamp_local': modbus_poll_response['timestamp_local'],
+						'quality': modbus_poll_response['quality'],
+						'call_groups_captured': len(modbus_poll_response.get('payloads', {}))
+					}
 				self.modbus_tcp_client.pretty_print_interpreted_response(modbus_poll_response)
-				print('Press Ctrl+C to stop and exit gracefully...')
-			time.sleep(self.modbus_config['poll_interval_seconds'])
\ No newline at end of file
+				if device_metrics is not None:
+					device_metrics.observe('pretty_print', time.perf_counter() - started)
+				print('Press Ctrl+C to stop and exit gracefully...')
\ No newline at end of file
@@ -0,0 +1,201 @@
+import datetime
+
+# running aggregates of one rollup window: O(1) state per tag, updated by each polled record (or merged from a shorter window) and reset when it closes
+# analog tags:	<tag>_min, <tag>_max, <tag>_mean, <tag>_last and <tag>_count (number of values received in the window)
+# bit tags:		<tag>_on_fraction (fraction of the values received that were on), <tag>_transitions (changes of state, the one from the
+#				previous window included), <tag>_last and <tag>_count
+# quality-bad records hold no tag values, they only count in "records" (all the records of the window) and not in "good_records"
+class RollupWindow(object):
+
+	def __init__(self, window_seconds, analog_tags, bit_tags):
+		self.window_seconds = window_seconds
+		self.window_ns = window_seconds*1000000000
+		self.analog_tags = analog_tags
+		self.bit_tags = bit_tags
+		# state of the bits carried over from one window to the next, so that a change of state at a boundary is counted
+		self.previous_bits = [None]*len(bit_tags)
+		self.start_ns = None
+		self.reset()
+
+	def reset(self):
+		self.records = 0
+		self.good_records = 0
+		self.count = [0]*len(self.analog_tags)
+		self.total = [0.0]*len(self.analog_tags)
+		self.minimum = [float('inf')]*len(self.analog_tags)
+		self.maximum = [float('-inf')]*len(self.analog_tags)
+		self.last = [None]*len(self.analog_tags)
+		self.bit_count = [0]*len(self.bit_tags)
+		self.on_count = [0]*len(self.bit_tags)
+		self.transitions = [0]*len(self.bit_tags)
+
+	# Method to open the window holding timestamp_ns, aligned on multiples of window_seconds since the Unix epoch, when none is open
+	def open(self, timestamp_ns):
+		if self.start_ns is None:
+			self.start_ns = timestamp_ns - timestamp_ns % self.window_ns
+
+	# Method to tell whether the open window ends at or before timestamp_ns
+	def ends_before(self, timestamp_ns):
+		return (self.start_ns is not None) and (timestamp_ns >= self.start_ns + self.window_ns)
+
+	# Method to update the aggregates with the tag values of one polled record, NaN values excluded
+	def add(self, record, good):
+		self.records += 1
+		if not good:
+			return
+		self.good_records += 1
+		count, total, minimum, maximum, last = self.count, self.total, self.minimum, self.maximum, self.last
+		for i, value in enumerate(map(record.get, self.analog_tags)):
+			if (value is None) or (value != value):
+				continue
+			count[i] += 1
+			total[i] += value
+			if value < minimum[i]:
+				minimum[i] = value
+			if value > maximum[i]:
+				maximum[i] = value
+			last[i] = value
+		bit_count, on_count, transitions, previous_bits = self.bit_count, self.on_count, self.transitions, self.previous_bits
+		for i, value in enumerate(map(record.get, self.bit_tags)):
+			if value is None:
+				continue
+			value = bool(value)
+			bit_count[i] += 1
+			on_count[i] += value
+			if (previous_bits[i] is not None) and (value != previous_bits[i]):
+				transitions[i] += 1
+			previous_bits[i] = value
+
+	# Method to merge the aggregates of a closed shorter window (whose length divides this one) into this window
+	def merge(self, window):
+		self.open(window.start_ns)
+		self.records += window.records
+		self.good_records += window.good_records
+		for i in range(len(self.analog_tags)):
+			if window.count[i] == 0:
+				continue
+			self.count[i] += window.count[i]
+			self.total[i] += window.total[i]
+			if window.minimum[i] < self.minimum[i]:
+				self.minimum[i] = window.minimum[i]
+			if window.maximum[i] > self.maximum[i]:
+				self.maximum[i] = window.maximum[i]
+			self.last[i] = window.last[i]
+		for i in range(len(self.bit_tags)):
+			self.bit_count[i] += window.bit_count[i]
+			self.on_count[i] += window.on_count[i]
+			self.transitions[i] += window.transitions[i]
+			if window.bit_count[i]:
+				self.previous_bits[i] = window.previous_bits[i]
+
+	# Method to return the rollup record of the open window and reset it, the tags without any value in the window are left out
+	def close(self, time_format):
+		ts_utc = datetime.datetime.fromtimestamp(self.start_ns // 1000000000, datetime.timezone.utc)
+		rollup_record = {
+			'timestamp_utc': ts_utc.strftime(time_format),
+			'timestamp_local': ts_utc.astimezone().strftime(time_format),
+			'quality': 1 if self.good_records else 0,
+			'timestamp_ns': self.start_ns,
+			'records': self.records,
+			'good_records': self.good_records
+		}
+		for i, tag_name in enumerate(self.analog_tags):
+			if self.count[i] == 0:
+				continue
+			rollup_record[tag_name+'_min'] = self.minimum[i]
+			rollup_record[tag_name+'_max'] = self.maximum[i]
+			rollup_record[tag_name+'_mean'] = self.total[i] / self.count[i]
+			rollup_record[tag_name+'_last'] = self.last[i]
+			rollup_record[tag_name+'_count'] = self.count[i]
+		for i, tag_name in enumerate(self.bit_tags):
+			if self.bit_count[i] == 0:
+				continue
+			rollup_record[tag_name+'_on_fraction'] = self.on_count[i] / self.bit_count[i]
+			rollup_record[tag_name+'_transitions'] = self.transitions[i]
+			rollup_record[tag_name+'_last'] = self.previous_bits[i]
+			rollup_record[tag_name+'_count'] = self.bit_count[i]
+		self.start_ns = None
+		self.reset()
+		return rollup_record
+
+# streaming rollups of the polled records over windows of windows_seconds seconds (ex: [60, 3600]), aligned on multiples of their length
+# since the Unix epoch (UTC), each closed window yields one rollup record timestamped with its start
+# only the windows whose length is not a multiple of a shorter one are updated by every record, the others are merged from the longest
+# shorter window dividing them when it closes (ex: 3600 from 60), so that the cost of a record does not grow with the number of windows
+# a window closes on the first record past its end, windows without any record are not written
+class RecordRollups(object):
+
+	def __init__(self, column_types, windows_seconds, time_format='%Y-%m-%d %H:%M:%S%z'):
+		self.time_format = time_format
+		# the bool tags (di, coil and packedbool bits) are aggregated as bits, the others as analog values
+		self.analog_tags = [tag_name for tag_name, column_type in column_types.items() if column_type != 'bool']
+		self.bit_tags = [tag_name for tag_name, column_type in column_types.items() if column_type == 'bool']
+		self.windows = [RollupWindow(window_seconds, self.analog_tags, self.bit_tags) for window_seconds in sorted(set(windows_seconds))]
+		# index of the window each one is merged from, None for the windows updated by every record
+		self.sources = []
+		for index, window in enumerate(self.windows):
+			source = None
+			for shorter_index in range(index):
+				if window.window_seconds % self.windows[shorter_index].window_seconds == 0:
+					source = shorter_index
+			self.sources.append(source)
+		self.stats = {
+			'records_in': 0,
+			'rollups_out': 0
+		}
+
+	@property
+	def windows_seconds(self):
+		return [window.window_seconds for window in self.windows]
+
+	# Method to return the column types of the rollup records, the timestamps and quality excluded
+	def column_types(self, column_types):
+		rollup_column_types = {'records': 'int64', 'good_records': 'int64'}
+		for tag_name in self.analog_tags:
+			# a scaled tag is float64, the extremes and last value of the others keep their data type
+			rollup_column_types[tag_name+'_min'] = column_types[tag_name]
+			rollup_column_types[tag_name+'_max'] = column_types[tag_name]
+			rollup_column_types[tag_name+'_mean'] = 'float64'
+			rollup_column_types[tag_name+'_last'] = column_types[tag_name]
+			rollup_column_types[tag_name+'_count'] = 'int64'
+		for tag_name in self.bit_tags:
+			rollup_column_types[tag_name+'_on_fraction'] = 'float64'
+			rollup_column_types[tag_name+'_transitions'] = 'int64'
+			rollup_column_types[tag_name+'_last'] = 'bool'
+			rollup_column_types[tag_name+'_count'] = 'int64'
+		return rollup_column_types
+
+	# Method to aggregate one polled record, it returns the rollup records of the windows it closed as a list of (window_seconds, rollup_record)
+	def add(self, record, good):
+		self.stats['records_in'] += 1
+		timestamp_ns = record['timestamp_ns']
+		rollups = []
+		# the shorter windows close first, so that they are merged into the longer ones before these are checked
+		for index, window in enumerate(self.windows):
+			if window.ends_before(timestamp_ns):
+				rollups.append(self.close_window(index))
+		for index, window in enumerate(self.windows):
+			if self.sources[index] is None:
+				window.open(timestamp_ns)
+				window.add(record, good)
+		return rollups
+
+	# Method to return the rollup records of the windows still open, to be called when exiting; they only cover the records received so far
+	def flush(self):
+		rollups = []
+		for index, window in enumerate(self.windows):
+			if window.start_ns is not None:
+				rollups.append(self.close_window(index))
+		return rollups
+
+	def close_window(self, index):
+		window = self.windows[index]
+		for longer_index in range(index+1, len(self.windows)):
+			if self.sources[longer_index] == index:
+				self.windows[longer_index].merge(window)
+		self.stats['rollups_out'] += 1
+		return window.window_seconds, window.close(self.time_format)
+
+	def print_stats(self):
+		for key, value in self.stats.items():
+			print('\t[INFO] rollups '+str(key)+':', str(value))
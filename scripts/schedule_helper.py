@@ -0,0 +1,192 @@
+import time, math, asyncio
+
+class PollScheduler(object):
+
+	# what to do with the deadlines missed when a poll cycle overruns the poll interval
+	#	'skip': drop the missed deadlines and resume on the next future grid point
+	#	'catch_up': run the missed deadlines back to back (up to max_catch_up_cycles) until the schedule is caught up
+	OVERRUN_POLICIES = ['skip', 'catch_up']
+
+	def __init__(self, interval_seconds=1, overrun_policy='skip', align_to_interval=True, max_catch_up_cycles=10):
+		if not interval_seconds > 0:
+			print('\t[ERROR] in PollScheduler: interval_seconds should be strictly positive, current value is',str(interval_seconds))
+			print('\t[ERROR] will default to 1 second')
+			interval_seconds = 1
+		if overrun_policy not in PollScheduler.OVERRUN_POLICIES:
+			print('\t[WARNING] in PollScheduler: unknown overrun_policy "'+str(overrun_policy)+'", supported are',PollScheduler.OVERRUN_POLICIES)
+			print('\t[WARNING] will default to "skip"')
+			overrun_policy = 'skip'
+		self.interval_seconds = interval_seconds
+		self.overrun_policy = overrun_policy
+		self.align_to_interval = align_to_interval
+		self.max_catch_up_cycles = max_catch_up_cycles
+		self.next_deadline = None
+		self.cycle_started = None
+		self.stats = {
+			'cycles': 0,
+			'late_cycles': 0,
+			'missed_deadlines': 0,
+			'jitter_mean_seconds': 0.0,
+			'jitter_max_seconds': 0.0,
+			'jitter_m2': 0.0,
+			'cycle_time_mean_seconds': 0.0,
+			'cycle_time_max_seconds': 0.0,
+			'idle_seconds': 0.0,
+			'started': None
+		}
+
+	# Method to compute the first deadline; when aligned, deadlines land on the wall clock grid of the interval (ex: every full second for 1.0)
+	# the grid offset is taken once from the wall clock, all following deadlines are on the monotonic clock so that they never drift
+	def start(self):
+		now = time.monotonic()
+		self.stats['started'] = now
+		if self.align_to_interval:
+			self.next_deadline = now + (self.interval_seconds - (time.time() % self.interval_seconds))
+		else:
+			self.next_deadline = now
+
+	# Method to block until the next poll deadline, to be called right before each poll cycle
+	# it returns the number of deadlines dropped since the previous call (0 when the previous cycle completed in time or with 'catch_up')
+	def wait(self):
+		delay, missed = self.time_to_next_deadline()
+		if delay > 0:
+			time.sleep(delay)
+		self.begin_cycle()
+		return missed
+
+	# Method to await the next poll deadline without blocking the asyncio event loop, same as wait()
+	async def async_wait(self):
+		delay, missed = self.time_to_next_deadline()
+		if delay > 0:
+			await asyncio.sleep(delay)
+		self.begin_cycle()
+		return missed
+
+	# Method to apply the overrun policy and return the delay in seconds until the next deadline along with the number of deadlines dropped
+	def time_to_next_deadline(self):
+		if self.next_deadline is None:
+			self.start()
+		now = time.monotonic()
+		missed = 0
+		if self.cycle_started is not None:
+			cycle_time = now - self.cycle_started
+			self.stats['cycle_time_mean_seconds'] += (cycle_time - self.stats['cycle_time_mean_seconds']) / self.stats['cycles']
+			self.stats['cycle_time_max_seconds'] = max(self.stats['cycle_time_max_seconds'], cycle_time)
+
+		if (self.cycle_started is not None) and (now > self.next_deadline):
+			# the previous cycle ran past this deadline, count the grid slots already passed (this deadline included)
+			self.stats['late_cycles'] += 1
+			passed_deadlines = int((now - self.next_deadline) // self.interval_seconds) + 1
+			if self.overrun_policy == 'skip':
+				missed = passed_deadlines
+			elif passed_deadlines > self.max_catch_up_cycles:
+				# 'catch_up' is bounded so that a long outage does not turn into an endless burst of polls
+				missed = passed_deadlines - self.max_catch_up_cycles
+			self.stats['missed_deadlines'] += missed
+			self.next_deadline += missed*self.interval_seconds
+		delay = self.next_deadline - now
+		if delay > 0:
+			self.stats['idle_seconds'] += delay
+		return delay, missed
+
+	# Method to record the start of a poll cycle and move to the next deadline
+	def begin_cycle(self):
+		self.cycle_started = time.monotonic()
+		jitter = max(0.0, self.cycle_started - self.next_deadline)
+		self.stats['cycles'] += 1
+		delta = jitter - self.stats['jitter_mean_seconds']
+		self.stats['jitter_mean_seconds'] += delta / self.stats['cycles']
+		self.stats['jitter_m2'] += delta * (jitter - self.stats['jitter_mean_seconds'])
+		self.stats['jitter_max_seconds'] = max(self.stats['jitter_max_seconds'], jitter)
+		self.next_deadline += self.interval_seconds
+
+	# Method to return a summary of the scheduling statistics gathered so far
+	def get_stats(self):
+		elapsed = 0.0
+		if self.stats['started'] is not None:
+			elapsed = time.monotonic() - self.stats['started']
+		jitter_std = 0.0
+		if self.stats['cycles'] > 1:
+			jitter_std = math.sqrt(self.stats['jitter_m2'] / (self.stats['cycles'] - 1))
+		idle_percent = 0.0
+		if elapsed > 0:
+			idle_percent = 100.0 * self.stats['idle_seconds'] / elapsed
+		return {
+			'interval_seconds': self.interval_seconds,
+			'overrun_policy': self.overrun_policy,
+			'cycles': self.stats['cycles'],
+			'late_cycles': self.stats['late_cycles'],
+			'missed_deadlines': self.stats['missed_deadlines'],
+			'jitter_mean_seconds': self.stats['jitter_mean_seconds'],
+			'jitter_std_seconds': jitter_std,
+			'jitter_max_seconds': self.stats['jitter_max_seconds'],
+			'cycle_time_mean_seconds': self.stats['cycle_time_mean_seconds'],
+			'cycle_time_max_seconds': self.stats['cycle_time_max_seconds'],
+			'idle_percent': idle_percent,
+			'elapsed_seconds': elapsed
+		}
+
+	def print_stats(self):
+		for key, value in self.get_stats().items():
+			print('\t[INFO] poll scheduler '+str(key)+':', str(value))
+
+# scan classes polled on one connection: the transactions of each poll_interval are only due once per poll_interval,
+# the PollScheduler ticks at base_interval_seconds, the greatest common divisor of the poll intervals (in milliseconds)
+# poll intervals that are not commensurate (ex: 0.333 and 1) would make the tick a mere millisecond, the tick is then the shortest poll interval
+# instead and the scan classes of the longer ones are polled at the tick nearest to their deadline (within half the shortest poll interval)
+class ScanClassSchedule(object):
+
+	# the greatest common divisor tick is kept when it is at least MIN_BASE_INTERVAL_SECONDS and a tenth of the shortest poll interval
+	MIN_BASE_INTERVAL_SECONDS = 0.01
+	MAX_TICKS_PER_SHORTEST_INTERVAL = 10
+
+	def __init__(self, transactions, default_interval_seconds=1):
+		self.scan_classes = {}
+		for transaction_index, transaction in enumerate(transactions):
+			interval_seconds = transaction.get('poll_interval')
+			if interval_seconds is None:
+				interval_seconds = default_interval_seconds
+			self.scan_classes.setdefault(interval_seconds, []).append(transaction_index)
+		if not self.scan_classes:
+			self.scan_classes[default_interval_seconds] = []
+		intervals = sorted(self.scan_classes)
+		if len(intervals) == 1:
+			self.base_interval_seconds = intervals[0]
+		else:
+			base_interval_ms = 0
+			for interval_seconds in intervals:
+				base_interval_ms = math.gcd(base_interval_ms, max(1, int(round(interval_seconds*1000))))
+			self.base_interval_seconds = base_interval_ms / 1000
+			if self.base_interval_seconds < max(ScanClassSchedule.MIN_BASE_INTERVAL_SECONDS, intervals[0] / ScanClassSchedule.MAX_TICKS_PER_SHORTEST_INTERVAL):
+				print('\t[WARNING] poll intervals',str(intervals),'are not commensurate, their common tick of',str(self.base_interval_seconds),'seconds would mostly wake the poll loop for nothing')
+				print('\t[WARNING] the scan classes will be interleaved on the shortest poll interval of',str(intervals[0]),'seconds, the longer ones being polled at the nearest tick')
+				self.base_interval_seconds = intervals[0]
+		self.all_transactions = list(range(len(transactions)))
+		self.next_due = {interval_seconds: None for interval_seconds in intervals}
+
+	# Method to list the indexes of the transactions due at this tick, in transaction order
+	# a scan class is due from half a tick before its deadline, so that tick jitter does not delay it by a whole tick; missed deadlines are skipped
+	def due(self, now=None):
+		if now is None:
+			now = time.monotonic()
+		if len(self.scan_classes) == 1:
+			return self.all_transactions
+		tolerance = self.base_interval_seconds / 2
+		due_transactions = []
+		for interval_seconds, transaction_indexes in self.scan_classes.items():
+			next_due = self.next_due[interval_seconds]
+			if (next_due is not None) and (now + tolerance < next_due):
+				continue
+			if next_due is None:
+				next_due = now
+			while next_due <= now + tolerance:
+				next_due += interval_seconds
+			self.next_due[interval_seconds] = next_due
+			due_transactions += transaction_indexes
+		due_transactions.sort()
+		return due_transactions
+
+	def print_scan_classes(self):
+		for interval_seconds, transaction_indexes in sorted(self.scan_classes.items()):
+			print('\t[INFO] scan class of',str(interval_seconds),'seconds:',str(len(transaction_indexes)),'read request(s)')
+		print('\t[INFO] scan classes interleaved on a base poll interval of',str(self.base_interval_seconds),'seconds')
@@ -0,0 +1,234 @@
+import os, sys, socket, socketserver, threading, struct, time, math, random, json
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper, ModbusTCPTransport
+from data_helper import DataHelper
+
+# local Modbus TCP Server stand-in serving FC01 to FC04 from a modbus-dl template .csv file
+# the tags of the template are served with synthetic values (or values replayed from a log file), every other address reads as 0
+# latency, jitter, dropped connections and Modbus exception responses can be injected to exercise the client
+class ModbusTCPSimulator(object):
+
+	# Modbus exception codes answered by the simulator
+	ILLEGAL_FUNCTION = 0x01
+	ILLEGAL_DATA_ADDRESS = 0x02
+	ILLEGAL_DATA_VALUE = 0x03
+	SERVER_DEVICE_FAILURE = 0x04
+
+	# raw Big-Endian bytes served for a value of each data_type, the reverse of ModbusHelper.DATA_TYPES_STRUCT_FORMAT and DATA_TYPES_CONVERTER
+	DATA_TYPES_ENCODER = {
+		'uint16': lambda value: struct.pack('>H', int(value) & 0xFFFF),
+		'sint16': lambda value: struct.pack('>h', max(-32768, min(32767, int(value)))),
+		'float32': lambda value: struct.pack('>f', value),
+		'float64': lambda value: struct.pack('>d', value),
+		'packedbool': lambda value: struct.pack('>H', int(value) & 0xFFFF),
+		'ruint16': lambda value: struct.pack('<H', int(value) & 0xFFFF),
+		'rsint16': lambda value: struct.pack('<h', max(-32768, min(32767, int(value)))),
+		'rfloat32_byte_swap': lambda value: struct.pack('<f', value)[2:4] + struct.pack('<f', value)[0:2],
+		'rfloat32_word_swap': lambda value: struct.pack('>f', value)[2:4] + struct.pack('>f', value)[0:2],
+		'rfloat32_byte_word_swap': lambda value: struct.pack('<f', value)
+	}
+
+	def __init__(self, full_path_to_modbus_template_csv=None, host='127.0.0.1', port=5020, latency_seconds=0, jitter_seconds=0, error_rate=0, exception_rate=0, full_path_to_replay_log=None, replay_interval_seconds=1, update_interval_seconds=0.1, seed=None):
+		self.host = host
+		self.port = port
+		self.latency_seconds = latency_seconds
+		self.jitter_seconds = jitter_seconds
+		self.error_rate = error_rate
+		self.exception_rate = exception_rate
+		self.update_interval_seconds = update_interval_seconds
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+		# one image of the 65536 addresses per function code: 1 byte per bit for FC01/FC02, 2 bytes per register for FC03/FC04
+		self.images = {'01': bytearray(65536), '02': bytearray(65536), '03': bytearray(2*65536), '04': bytearray(2*65536)}
+		self.tags = []
+		if full_path_to_modbus_template_csv is not None:
+			call_groups, interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv)
+			for fc in interpreter_helper:
+				for address, address_map in interpreter_helper[fc]['address_maps'].items():
+					scaling = ModbusHelper.parse_scaling(address_map['scaling_coeff'], address_map['scaling_offset'])
+					self.tags.append((fc, address, address_map['data_type'], address_map['tag_name'], scaling))
+		self.replay_records = None
+		self.replay_interval_seconds = replay_interval_seconds
+		if full_path_to_replay_log is not None:
+			self.replay_records = self.load_replay_log(full_path_to_replay_log)
+		self.started = time.monotonic()
+		self.last_update = None
+		self.server = None
+		self.thread = None
+		self.stats = {
+			'connections': 0,
+			'requests': 0,
+			'exceptions': 0,
+			'dropped_connections': 0
+		}
+		self.update_images()
+
+	# Method to load the records of a .csv, .json or .ndjson log file written by modbus-dl, to be served back in a loop
+	@classmethod
+	def load_replay_log(cls, full_path_to_replay_log):
+		extension = os.path.splitext(full_path_to_replay_log)[1]
+		if extension == '.csv':
+			records = DataHelper.csv_to_lod(full_path_to_replay_log)
+		elif extension == '.ndjson':
+			records = DataHelper.ndjson_to_lod(full_path_to_replay_log)
+		elif extension == '.json':
+			with open(full_path_to_replay_log) as json_file:
+				records = list(json.load(json_file).values())
+		else:
+			print('\t[ERROR] unsupported replay log file "'+str(full_path_to_replay_log)+'", supported are .csv, .json and .ndjson log files')
+			return None
+		if not records:
+			print('\t[WARNING] no records found in replay log file "'+str(full_path_to_replay_log)+'", serving synthetic values instead')
+			return None
+		return records
+
+	# Method to compute the synthetic value of a tag at time t: bits toggle, integers count and floats follow a sine wave, each tag with its own phase
+	def synthetic_value(self, fc, address, data_type, t):
+		if fc in ['01', '02']:
+			return (address + int(t)) & 1
+		if data_type in ['uint16', 'ruint16', 'packedbool']:
+			return (address*7 + int(10*t)) & 0xFFFF
+		if data_type in ['sint16', 'rsint16']:
+			return ((address*7 + int(10*t)) & 0xFFFF) - 32768
+		return 100.0*math.sin(t/10.0 + address)
+
+	# Method to compute the value of a tag replayed from a log file; engineering values are unscaled back to raw values
+	def replay_value(self, tag_name, data_type, scaling, t):
+		record = self.replay_records[int(t / self.replay_interval_seconds) % len(self.replay_records)]
+		value = record.get(tag_name)
+		if data_type == 'packedbool':
+			value = record.get(tag_name+'_uint16_value')
+		if (value is None) or (value == ''):
+			return None
+		value = float(value)
+		if (scaling is not None) and (data_type not in ['di', 'coil', 'packedbool']) and (scaling[0] != 0):
+			value = (value - scaling[1]) / scaling[0]
+		return value
+
+	# Method to refresh the served images of all the tags, at most every update_interval_seconds
+	def update_images(self):
+		now = time.monotonic()
+		if (self.last_update is not None) and (now - self.last_update < self.update_interval_seconds):
+			return
+		self.last_update = now
+		t = now - self.started
+		for fc, address, data_type, tag_name, scaling in self.tags:
+			value = None
+			if self.replay_records is not None:
+				value = self.replay_value(tag_name, data_type, scaling, t)
+			if value is None:
+				value = self.synthetic_value(fc, address, data_type, t)
+			if fc in ['01', '02']:
+				self.images[fc][address] = int(value) & 1
+			else:
+				raw = ModbusTCPSimulator.DATA_TYPES_ENCODER[data_type](value)
+				self.images[fc][2*address:2*address+len(raw)] = raw[:2*65536-2*address]
+
+	# Method to build the response PDU of one request PDU
+	def response_pdu(self, request_pdu):
+		if len(request_pdu) < 5:
+			return struct.pack('>BB', (request_pdu[0] if request_pdu else 0) | 0x80, ModbusTCPSimulator.ILLEGAL_DATA_VALUE)
+		function_code, start_address, quantity = struct.unpack_from('>BHH', request_pdu)
+		fc = '%02d' % function_code
+		if fc not in self.images:
+			return struct.pack('>BB', function_code | 0x80, ModbusTCPSimulator.ILLEGAL_FUNCTION)
+		if (quantity < 1) or (quantity > ModbusHelper.MAX_READ_SIZES[fc]):
+			return struct.pack('>BB', function_code | 0x80, ModbusTCPSimulator.ILLEGAL_DATA_VALUE)
+		if start_address + quantity > 65536:
+			return struct.pack('>BB', function_code | 0x80, ModbusTCPSimulator.ILLEGAL_DATA_ADDRESS)
+		if self.exception_rate and (self.random.random() < self.exception_rate):
+			self.stats['exceptions'] += 1
+			return struct.pack('>BB', function_code | 0x80, ModbusTCPSimulator.SERVER_DEVICE_FAILURE)
+		with self.lock:
+			self.update_images()
+			image = self.images[fc]
+			if fc in ['01', '02']:
+				# bits are packed 8 per byte, least significant bit first
+				data = bytearray((quantity + 7) // 8)
+				for bit_index in range(quantity):
+					if image[start_address + bit_index]:
+						data[bit_index >> 3] |= 1 << (bit_index & 7)
+			else:
+				data = image[2*start_address:2*(start_address + quantity)]
+		return struct.pack('>BB', function_code, len(data)) + bytes(data)
+
+	# Method to wait for the injected latency +/- jitter before answering a request
+	def inject_latency(self):
+		delay = self.latency_seconds
+		if self.jitter_seconds:
+			delay += self.random.uniform(-self.jitter_seconds, self.jitter_seconds)
+		if delay > 0:
+			time.sleep(delay)
+
+	# Method to serve one client connection; requests are answered in order, so pipelined requests are supported
+	def handle_connection(self, sock):
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.stats['connections'] += 1
+		buffer = b''
+		while True:
+			try:
+				received = sock.recv(65536)
+			except OSError:
+				return
+			if not received:
+				return
+			buffer += received
+			while len(buffer) >= 7:
+				transaction_id, protocol_id, length, unit_id = ModbusTCPTransport.MBAP_HEADER.unpack_from(buffer)
+				if len(buffer) < 6 + length:
+					break
+				request_pdu = buffer[7:6+length]
+				buffer = buffer[6+length:]
+				self.stats['requests'] += 1
+				if self.error_rate and (self.random.random() < self.error_rate):
+					self.stats['dropped_connections'] += 1
+					sock.close()
+					return
+				response_pdu = self.response_pdu(request_pdu)
+				self.inject_latency()
+				try:
+					sock.sendall(ModbusTCPTransport.MBAP_HEADER.pack(transaction_id, 0, len(response_pdu) + 1, unit_id) + response_pdu)
+				except OSError:
+					return
+
+	def build_server(self):
+		simulator = self
+		class RequestHandler(socketserver.BaseRequestHandler):
+			def handle(self):
+				simulator.handle_connection(self.request)
+		class Server(socketserver.ThreadingTCPServer):
+			allow_reuse_address = True
+			daemon_threads = True
+			request_queue_size = 512
+		self.server = Server((self.host, self.port), RequestHandler)
+		# with port 0 the OS picks a free port
+		self.port = self.server.server_address[1]
+
+	# Method to serve in a background thread, it returns the TCP port listened on
+	def start(self):
+		self.build_server()
+		self.thread = threading.Thread(target=self.server.serve_forever, name='modbus simulator', daemon=True)
+		self.thread.start()
+		return self.port
+
+	# Method to serve in the calling thread until Ctrl+C
+	def serve_forever(self):
+		self.build_server()
+		print('\t[INFO] Modbus TCP Server simulator listening on',str(self.host)+':'+str(self.port),'serving',str(len(self.tags)),'tags')
+		print('Press Ctrl+C to stop and exit gracefully...')
+		try:
+			self.server.serve_forever()
+		except KeyboardInterrupt:
+			print('\nYou pressed Ctrl+C!')
+		self.stop()
+		self.print_stats()
+		print('Bye!')
+
+	def stop(self):
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+
+	def print_stats(self):
+		print('\t[INFO] Modbus TCP Server simulator:',', '.join(str(key)+'='+str(value) for key, value in self.stats.items()))
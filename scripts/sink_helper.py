@@ -0,0 +1,85 @@
+import os, time, csv, operator
+
+# live .csv log file kept open between writes, with a fixed column schema
+# rows go through a large write buffer that is flushed to the OS every flush_records records or flush_seconds seconds,
+# and the flushed data is forced to the storage (fsync) at most every fsync_seconds seconds
+class CSVLogSink(object):
+	def __init__(self, full_path_to_csv_file, columns=None, buffer_bytes=1048576, flush_records=0, flush_seconds=0, fsync_seconds=0):
+		self.full_path_to_csv_file = full_path_to_csv_file
+		self.buffer_bytes = buffer_bytes
+		self.flush_records = flush_records
+		self.flush_seconds = flush_seconds
+		self.fsync_seconds = fsync_seconds
+		self.file = None
+		self.writer = None
+		self.columns = None
+		self.row_values = None
+		if columns is not None:
+			self.set_columns(columns)
+		self.unflushed_records = 0
+		self.last_flush = time.monotonic()
+		self.last_fsync = time.monotonic()
+
+	# Method to precompile the row formatter of the column schema; a record missing a column (ex: a failed read) leaves that cell empty
+	def set_columns(self, columns):
+		self.columns = list(columns)
+		record_values = operator.itemgetter(*self.columns)
+		if len(self.columns) == 1:
+			record_values = lambda record, getter=record_values: (getter(record),)
+		def row_values(record):
+			try:
+				return record_values(record)
+			except KeyError:
+				return [record.get(column, '') for column in self.columns]
+		self.row_values = row_values
+
+	def open(self):
+		self.file = open(self.full_path_to_csv_file, 'a', newline='', buffering=self.buffer_bytes)
+		self.writer = csv.writer(self.file)
+		# the header is only written to a new (empty) live file
+		if self.file.tell() == 0:
+			self.writer.writerow(self.columns)
+		self.last_flush = time.monotonic()
+
+	# Method to write a list of records to the live log file, flushing it when the record count or the time threshold is met
+	# without flush_records and flush_seconds the file is flushed after each call
+	def write_records(self, records):
+		if not records:
+			return
+		if self.columns is None:
+			self.set_columns(records[0].keys())
+		if self.file is None:
+			self.open()
+		self.writer.writerows(map(self.row_values, records))
+		self.unflushed_records += len(records)
+		if (not self.flush_records) and (not self.flush_seconds):
+			self.flush()
+		elif self.flush_records and (self.unflushed_records >= self.flush_records):
+			self.flush()
+		elif self.flush_seconds and (time.monotonic() - self.last_flush >= self.flush_seconds):
+			self.flush()
+
+	# Method to hand the buffered rows over to the OS, and to force them to the storage when fsync_seconds have passed since the last fsync
+	def flush(self, fsync=False):
+		if self.file is None:
+			return
+		self.file.flush()
+		self.unflushed_records = 0
+		now = time.monotonic()
+		self.last_flush = now
+		if fsync or (self.fsync_seconds and (now - self.last_fsync >= self.fsync_seconds)):
+			os.fsync(self.file.fileno())
+			self.last_fsync = now
+
+	# Method to hand the buffered rows over to the OS and force them to the storage, ex: before the spooled records they hold are released
+	def sync(self):
+		self.flush(fsync=True)
+
+	# Method to flush and close the live log file, to be called before the file is rotated and when exiting
+	def close(self):
+		if self.file is None:
+			return
+		self.flush(fsync=bool(self.fsync_seconds))
+		self.file.close()
+		self.file = None
+		self.writer = None
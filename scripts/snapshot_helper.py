@@ -0,0 +1,188 @@
+import os, sys, json, time, struct
+from multiprocessing import shared_memory, resource_tracker
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from columnar_helper import ColumnarLogFormat
+
+# shared memory block holding the latest polled record of one Modbus TCP Server, for the local processes (HMI, alarm engine, ...) that need live values
+# the layout is fixed once from the template, little-endian, every slot aligned on its own size:
+#
+#	header:		8 bytes magic b'MBSNAPv1'
+#				uint64 sequence, odd while a record is being written, even once it is complete
+#				uint32 length of the schema
+#				uint32 offset of the slots, a multiple of 8
+#	schema:		utf-8 json: {"format": "mbsnap", "version": 1, "byte_order": "little", "columns": [{"name": ..., "type": ..., "offset": ...}, ...]}
+#	slots:		one typed slot per column: "timestamp_ns" (int64 nanoseconds since the Unix epoch, UTC, the time of the poll cycle of the record),
+#				"quality" (bool) and each tag (bool, int16, uint16, float32 or float64 as in the .mbcol log files, NaN or 0 for a tag missing from a record)
+#
+# the publisher is the only writer, the readers never lock: a read is retried while the sequence is odd or has changed during the read (seqlock)
+class SnapshotFormat(object):
+
+	MAGIC = b'MBSNAPv1'
+	HEADER = struct.Struct('<8sQII')
+	SEQUENCE = struct.Struct('<Q')
+	SEQUENCE_OFFSET = 8
+	FORMAT = 'mbsnap'
+	VERSION = 1
+
+	# Method to lay out the slots of the columns, it returns the schema and the struct of all the slots (offsets relative to the first slot)
+	@classmethod
+	def layout(cls, column_types):
+		columns = []
+		struct_format = '<'
+		offset = 0
+		for name, column_type in column_types.items():
+			typecode, dtype, item_size, missing = ColumnarLogFormat.COLUMN_TYPES[column_type]
+			padding = (-offset) % item_size
+			struct_format += str(padding)+'x' if padding else ''
+			offset += padding
+			columns.append({'name': name, 'type': column_type, 'offset': offset})
+			struct_format += '?' if column_type == 'bool' else typecode
+			offset += item_size
+		return {'format': cls.FORMAT, 'version': cls.VERSION, 'byte_order': 'little', 'columns': columns}, struct.Struct(struct_format)
+
+	# Method to build the struct of all the slots from a schema read back from a block
+	@classmethod
+	def slots_struct(cls, schema):
+		return cls.layout({column['name']: column['type'] for column in schema['columns']})[1]
+
+# publisher of the latest polled record of one Modbus TCP Server into the shared memory block "name", created (or re-created) when instantiated
+class SnapshotPublisher(object):
+
+	TIMESTAMP_COLUMN = 'timestamp_ns'
+	QUALITY_COLUMN = 'quality'
+
+	def __init__(self, name, column_types):
+		self.name = name
+		self.column_types = {SnapshotPublisher.TIMESTAMP_COLUMN: 'int64', SnapshotPublisher.QUALITY_COLUMN: 'bool'}
+		self.column_types.update(column_types)
+		self.schema, self.slots = SnapshotFormat.layout(self.column_types)
+		schema_bytes = json.dumps(self.schema).encode('utf-8')
+		self.slots_offset = SnapshotFormat.HEADER.size + len(schema_bytes)
+		self.slots_offset += (-self.slots_offset) % 8
+		# tag columns (without the timestamp) and the value of a tag missing from a record
+		self.tag_columns = [(column, ColumnarLogFormat.COLUMN_TYPES[column_type][3]) for column, column_type in self.column_types.items() if column != SnapshotPublisher.TIMESTAMP_COLUMN]
+		size = self.slots_offset + self.slots.size
+		try:
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		except FileExistsError:
+			# left behind by a logger that did not exit gracefully, its readers keep their own mapping of the old block
+			print('\t[WARNING] shared memory block "'+str(name)+'" already exists, replacing it')
+			stale = shared_memory.SharedMemory(name=name)
+			stale.close()
+			stale.unlink()
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		self.buffer = self.shm.buf
+		self.sequence = 0
+		SnapshotFormat.HEADER.pack_into(self.buffer, 0, SnapshotFormat.MAGIC, self.sequence, len(schema_bytes), self.slots_offset)
+		self.buffer[SnapshotFormat.HEADER.size:SnapshotFormat.HEADER.size+len(schema_bytes)] = schema_bytes
+		self.stats = {
+			'records_published': 0
+		}
+		print('\t[INFO] latest records published to the shared memory block "'+str(name)+'" ('+str(size)+' bytes)')
+
+	# Method to publish one polled record, the values are packed before the sequence is made odd so that readers retry for as short as possible
+	def publish(self, record):
+		values = [record[SnapshotPublisher.TIMESTAMP_COLUMN]]
+		values += [record.get(column, missing) for column, missing in self.tag_columns]
+		packed = self.slots.pack(*values)
+		self.sequence += 1
+		SnapshotFormat.SEQUENCE.pack_into(self.buffer, SnapshotFormat.SEQUENCE_OFFSET, self.sequence)
+		self.buffer[self.slots_offset:self.slots_offset+self.slots.size] = packed
+		self.sequence += 1
+		SnapshotFormat.SEQUENCE.pack_into(self.buffer, SnapshotFormat.SEQUENCE_OFFSET, self.sequence)
+		self.stats['records_published'] += 1
+
+	# Method to release and remove the shared memory block, the readers still attached keep their mapping until they close it
+	def close(self):
+		if self.shm is None:
+			return
+		self.buffer.release()
+		self.shm.close()
+		try:
+			self.shm.unlink()
+		except FileNotFoundError:
+			pass
+		self.shm = None
+
+	def print_stats(self):
+		for key, value in self.stats.items():
+			print('\t[INFO] snapshot '+str(self.name)+' '+str(key)+':', str(value))
+
+# reader of the latest record published by a SnapshotPublisher, from any local process, without locking the publisher
+# ex:
+#	with SnapshotReader('my_logged_data') as snapshot:
+#		sequence, record = snapshot.read()
+#		sequence, record = snapshot.read(['hr_tag_0'])
+class SnapshotReader(object):
+	def __init__(self, name, max_retries=1000):
+		self.name = name
+		self.max_retries = max_retries
+		try:
+			self.shm = shared_memory.SharedMemory(name=name, track=False)
+		except TypeError:
+			# before Python 3.13 an attached block is tracked as if it was created here and would be removed when this process exits
+			self.shm = shared_memory.SharedMemory(name=name)
+			resource_tracker.unregister(self.shm._name, 'shared_memory')
+		self.buffer = self.shm.buf
+		magic, sequence, schema_length, self.slots_offset = SnapshotFormat.HEADER.unpack_from(self.buffer, 0)
+		if magic != SnapshotFormat.MAGIC:
+			self.close()
+			raise ValueError('shared memory block "'+str(name)+'" is not a snapshot block, magic: '+repr(magic))
+		self.schema = json.loads(bytes(self.buffer[SnapshotFormat.HEADER.size:SnapshotFormat.HEADER.size+schema_length]).decode('utf-8'))
+		self.slots = SnapshotFormat.slots_struct(self.schema)
+		self.columns = [column['name'] for column in self.schema['columns']]
+		# column: (absolute offset, struct of its slot)
+		self.offsets = {}
+		for column in self.schema['columns']:
+			typecode = '?' if column['type'] == 'bool' else ColumnarLogFormat.COLUMN_TYPES[column['type']][0]
+			self.offsets[column['name']] = (self.slots_offset + column['offset'], struct.Struct('<'+typecode))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		if self.shm is None:
+			return
+		self.buffer.release()
+		self.shm.close()
+		self.shm = None
+
+	# sequence of the latest record published, it changes (by 2) with each record, 0 until the first one
+	@property
+	def sequence(self):
+		return SnapshotFormat.SEQUENCE.unpack_from(self.buffer, SnapshotFormat.SEQUENCE_OFFSET)[0]
+
+	# Method to read a consistent copy of the latest record, all the columns by default; it returns (sequence, record)
+	# the values of a few columns are read from their own slots, all the columns with a single unpack of the slots
+	def read(self, columns=None):
+		for retry in range(self.max_retries):
+			sequence = self.sequence
+			if sequence & 1:
+				time.sleep(0)
+				continue
+			if columns is None:
+				record = dict(zip(self.columns, self.slots.unpack_from(self.buffer, self.slots_offset)))
+			else:
+				record = {}
+				for column in columns:
+					offset, slot = self.offsets[column]
+					record[column] = slot.unpack_from(self.buffer, offset)[0]
+			if self.sequence == sequence:
+				return sequence, record
+		raise TimeoutError('no consistent read of the shared memory block "'+str(self.name)+'" after '+str(self.max_retries)+' retries')
+
+	# Method to read the latest value of one column
+	def value(self, column):
+		return self.read([column])[1][column]
+
+	# Method to wait for a record newer than sequence, it returns (sequence, record) or None after timeout seconds
+	def wait(self, sequence, timeout=None, columns=None, poll_seconds=0.001):
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while self.sequence <= sequence:
+			if (deadline is not None) and (time.monotonic() >= deadline):
+				return None
+			time.sleep(poll_seconds)
+		return self.read(columns)
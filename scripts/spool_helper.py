@@ -0,0 +1,143 @@
+import os, time, glob, pickle, struct, zlib
+
+# write-ahead spool of the records buffered in memory by a ModbusDataLog, so that a SIGTERM, a crash or a power cut does not lose them
+# each batch of records handed over to the log file has its own segment file, <log_file_name>.spool.<segment>, deleted once the batch is
+# written to the live log file and forced to the storage; the segments left over by a logger that did not exit gracefully are replayed at startup
+#
+#	segment:	8 bytes magic b'MBSPOOL1'
+#				frames, one per record:	uint32 length of the payload, uint32 crc32 of the payload (little-endian), pickled record
+#
+# a torn frame at the end of a segment (cut while being written) fails its length or crc32 check, the records before it are replayed
+class RecordSpool(object):
+
+	MAGIC = b'MBSPOOL1'
+	FRAME_HEADER = struct.Struct('<II')
+
+	# the appended records are forced to the storage (group commit) once commit_records records or commit_seconds seconds are pending,
+	# and when a segment is sealed; without commit_records and commit_seconds every record is forced to the storage
+	def __init__(self, full_path_to_spool, commit_records=0, commit_seconds=0):
+		self.full_path_to_spool = full_path_to_spool
+		self.commit_records = commit_records
+		self.commit_seconds = commit_seconds
+		self.file = None
+		self.segment = max(self.segments() or [0])
+		self.uncommitted_records = 0
+		self.first_uncommitted = None
+		self.stats = {
+			'records_spooled': 0,
+			'commits': 0,
+			'commit_seconds_mean': 0.0,
+			'commit_seconds_max': 0.0,
+			'segments_released': 0,
+			'segments_replayed': 0,
+			'records_replayed': 0,
+			'torn_frames': 0
+		}
+
+	def segment_path(self, segment):
+		return self.full_path_to_spool+'.spool.'+str(segment)
+
+	# Method to list the segments on disk, oldest first
+	def segments(self):
+		segments = []
+		for path in glob.glob(glob.escape(self.full_path_to_spool)+'.spool.*'):
+			suffix = path.rsplit('.', 1)[1]
+			if suffix.isdigit():
+				segments.append(int(suffix))
+		return sorted(segments)
+
+	# Method to read the records of one segment, up to its first torn or corrupted frame
+	def read_segment(self, segment):
+		with open(self.segment_path(segment), 'rb') as spool_file:
+			data = spool_file.read()
+		records = []
+		if data[:len(RecordSpool.MAGIC)] != RecordSpool.MAGIC:
+			print('\t[WARNING] spool segment "'+self.segment_path(segment)+'" has no valid header, ignoring it')
+			return records
+		offset = len(RecordSpool.MAGIC)
+		while offset < len(data):
+			if offset + RecordSpool.FRAME_HEADER.size > len(data):
+				self.stats['torn_frames'] += 1
+				break
+			length, crc = RecordSpool.FRAME_HEADER.unpack_from(data, offset)
+			offset += RecordSpool.FRAME_HEADER.size
+			payload = data[offset:offset+length]
+			if (len(payload) != length) or (zlib.crc32(payload) != crc):
+				self.stats['torn_frames'] += 1
+				break
+			records.append(pickle.loads(payload))
+			offset += length
+		return records
+
+	# Method to iterate over the segments left over on disk as (segment, records), oldest first; each one is to be released once written
+	def replay(self):
+		for segment in self.segments():
+			records = self.read_segment(segment)
+			self.stats['segments_replayed'] += 1
+			self.stats['records_replayed'] += len(records)
+			yield segment, records
+
+	# Method to start a new segment, after the ones on disk
+	def open(self):
+		self.segment += 1
+		self.file = open(self.segment_path(self.segment), 'wb')
+		self.file.write(RecordSpool.MAGIC)
+
+	# Method to append one record to the current segment, forcing the pending records to the storage when the group commit is due
+	def append(self, record):
+		if self.file is None:
+			self.open()
+		payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+		self.file.write(RecordSpool.FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+		self.stats['records_spooled'] += 1
+		self.uncommitted_records += 1
+		if self.uncommitted_records == 1:
+			self.first_uncommitted = time.monotonic()
+		if (not self.commit_records) and (not self.commit_seconds):
+			self.commit()
+		elif self.commit_records and (self.uncommitted_records >= self.commit_records):
+			self.commit()
+		elif self.commit_seconds and (time.monotonic() - self.first_uncommitted >= self.commit_seconds):
+			self.commit()
+
+	# Method to force the pending records of the current segment to the storage
+	def commit(self):
+		if (self.file is None) or (self.uncommitted_records == 0):
+			return
+		started = time.perf_counter()
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		commit_seconds = time.perf_counter() - started
+		self.stats['commits'] += 1
+		self.stats['commit_seconds_mean'] += (commit_seconds - self.stats['commit_seconds_mean']) / self.stats['commits']
+		self.stats['commit_seconds_max'] = max(self.stats['commit_seconds_max'], commit_seconds)
+		self.uncommitted_records = 0
+		self.first_uncommitted = None
+
+	# Method to commit and close the current segment, holding the records of the batch about to be handed over; it returns the segment
+	# the next records go to a new segment, opened on the next append
+	def seal(self):
+		if self.file is None:
+			return None
+		self.commit()
+		self.file.close()
+		self.file = None
+		return self.segment
+
+	# Method to delete a segment once its batch is written to the live log file and forced to the storage
+	def release(self, segment):
+		try:
+			os.remove(self.segment_path(segment))
+		except FileNotFoundError:
+			pass
+		self.stats['segments_released'] += 1
+
+	# Method to close the current segment, to be called once every batch is written; an empty segment is deleted
+	def close(self):
+		segment = self.seal()
+		if (segment is not None) and (os.path.getsize(self.segment_path(segment)) == len(RecordSpool.MAGIC)):
+			self.release(segment)
+
+	def print_stats(self):
+		for key, value in self.stats.items():
+			print('\t[INFO] spool '+str(key)+':', str(value))
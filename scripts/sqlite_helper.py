@@ -0,0 +1,237 @@
+import os, sys, sqlite3, operator
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from columnar_helper import ColumnarLogFormat
+
+# .sqlite log database written with log_file_type "sqlite", in WAL mode so that it can be queried while the logger writes to it
+# table "records":
+#	id				INTEGER PRIMARY KEY, in insertion order
+#	timestamp_ns	INTEGER, the time of the poll cycle of the record in nanoseconds since the Unix epoch (UTC), indexed
+#	timestamp_utc	TEXT
+#	timestamp_local	TEXT
+#	quality			INTEGER, 1 for good, 0 for bad
+#	one column per tag, in the order of the template: INTEGER for the bool, int16, uint16 and int64 columns, REAL for float32 and float64
+#					a tag missing from a record (and a NaN value) is stored as NULL
+# SQLite limits the number of columns of a table, the tags after the first TAGS_PER_TABLE ones go to the tables "records_2", "records_3", ...
+# holding the id of the record and the next TAGS_PER_TABLE tags each (SQLiteLogReader joins them back)
+#
+# the database is never rotated: with retention_seconds, the records older than retention_seconds before the latest one are deleted
+class SQLiteLogFormat(object):
+
+	TABLE = 'records'
+	INDEX = 'records_timestamp_ns'
+	TIMESTAMP_COLUMN = 'timestamp_ns'
+	TAGS_PER_TABLE = 500
+	COLUMN_SQL_TYPES = {
+		'bool': 'INTEGER',
+		'int16': 'INTEGER',
+		'uint16': 'INTEGER',
+		'int64': 'INTEGER',
+		'float32': 'REAL',
+		'float64': 'REAL'
+	}
+	# a commit only syncs the WAL at checkpoints (synchronous NORMAL), which keeps the cost of a batch low without risking corruption
+	PRAGMAS = [
+		'PRAGMA journal_mode=WAL',
+		'PRAGMA synchronous=NORMAL',
+		'PRAGMA temp_store=MEMORY',
+		'PRAGMA cache_size=-16384'
+	]
+
+	@classmethod
+	def quote(cls, name):
+		return '"'+str(name).replace('"', '""')+'"'
+
+	# Method to list the tables of a database with their columns (id excluded), "records" first
+	@classmethod
+	def tables(cls, connection):
+		names = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND (name = ? OR name LIKE ?)", (cls.TABLE, cls.TABLE+'_%'))]
+		names = [name for name in names if (name == cls.TABLE) or name[len(cls.TABLE)+1:].isdigit()]
+		names.sort(key=lambda name: 1 if name == cls.TABLE else int(name[len(cls.TABLE)+1:]))
+		return {name: [row[1] for row in connection.execute('PRAGMA table_info('+cls.quote(name)+')') if row[1] != 'id'] for name in names}
+
+# live .sqlite log database, each batch of records handed over by ModbusDataLog is inserted in one transaction
+class SQLiteLogSink(object):
+
+	BASE_COLUMNS = [('timestamp_utc', 'TEXT'), ('timestamp_local', 'TEXT'), ('quality', 'INTEGER')]
+
+	def __init__(self, full_path_to_sqlite_file, column_types=None, retention_seconds=0):
+		self.full_path_to_sqlite_file = full_path_to_sqlite_file
+		self.retention_seconds = retention_seconds
+		self.column_types = None
+		if column_types is not None:
+			self.column_types = dict(column_types)
+		self.connection = None
+		# (insert statement, row values of a record) of each table
+		self.inserts = []
+		self.next_id = None
+
+	def open(self):
+		# the connection is opened by the thread writing the first batch and closed by the one exiting
+		self.connection = sqlite3.connect(self.full_path_to_sqlite_file, check_same_thread=False)
+		for pragma in SQLiteLogFormat.PRAGMAS:
+			self.connection.execute(pragma)
+		with self.connection:
+			tables = SQLiteLogFormat.tables(self.connection)
+			existing_columns = set(column for table_columns in tables.values() for column in table_columns)
+			# the tags not in the database yet: all of them when it is created, the ones added to the template since (the previous records hold NULL)
+			missing_columns = [(column, SQLiteLogFormat.COLUMN_SQL_TYPES[column_type]) for column, column_type in self.column_types.items() if column not in existing_columns]
+			if SQLiteLogFormat.TABLE not in tables:
+				columns = [(SQLiteLogFormat.TIMESTAMP_COLUMN, 'INTEGER NOT NULL')] + SQLiteLogSink.BASE_COLUMNS + missing_columns[:SQLiteLogFormat.TAGS_PER_TABLE]
+				tables[SQLiteLogFormat.TABLE] = self.create_table(SQLiteLogFormat.TABLE, columns)
+				self.connection.execute('CREATE INDEX '+SQLiteLogFormat.INDEX+' ON '+SQLiteLogFormat.TABLE+' ('+SQLiteLogFormat.TIMESTAMP_COLUMN+')')
+				missing_columns = missing_columns[SQLiteLogFormat.TAGS_PER_TABLE:]
+			else:
+				# the room left in the last table is filled first
+				table = list(tables)[-1]
+				room = SQLiteLogFormat.TAGS_PER_TABLE - len(tables[table]) + (len(SQLiteLogSink.BASE_COLUMNS) + 1 if table == SQLiteLogFormat.TABLE else 0)
+				for column, sql_type in missing_columns[:max(0, room)]:
+					self.connection.execute('ALTER TABLE '+SQLiteLogFormat.quote(table)+' ADD COLUMN '+SQLiteLogFormat.quote(column)+' '+sql_type)
+					tables[table].append(column)
+				missing_columns = missing_columns[max(0, room):]
+			while missing_columns:
+				table = SQLiteLogFormat.TABLE+'_'+str(len(tables) + 1)
+				tables[table] = self.create_table(table, missing_columns[:SQLiteLogFormat.TAGS_PER_TABLE])
+				missing_columns = missing_columns[SQLiteLogFormat.TAGS_PER_TABLE:]
+		self.next_id = (self.connection.execute('SELECT MAX(id) FROM '+SQLiteLogFormat.TABLE).fetchone()[0] or 0) + 1
+		self.inserts = []
+		for table, columns in tables.items():
+			insert = 'INSERT INTO '+SQLiteLogFormat.quote(table)+' (id, '+', '.join(SQLiteLogFormat.quote(column) for column in columns)+') VALUES (?, '+', '.join('?' for column in columns)+')'
+			self.inserts.append((insert, self.row_values(columns)))
+
+	# Method to create a table of (column, sql type) keyed by the id of the record, it returns its columns
+	def create_table(self, table, columns):
+		self.connection.execute('CREATE TABLE '+SQLiteLogFormat.quote(table)+' (id INTEGER PRIMARY KEY, '+', '.join(SQLiteLogFormat.quote(column)+' '+sql_type for column, sql_type in columns)+')')
+		return [column for column, sql_type in columns]
+
+	# Method to precompile the values of a table row from a record, None for a column missing from the record (ex: a failed read)
+	def row_values(self, columns):
+		record_values = operator.itemgetter(*columns)
+		if len(columns) == 1:
+			record_values = lambda record, getter=record_values: (getter(record),)
+		def row_values(record):
+			try:
+				return tuple(record_values(record))
+			except KeyError:
+				return tuple(record.get(column) for column in columns)
+		return row_values
+
+	# Method to insert a list of records in one transaction, then delete the records older than retention_seconds before the latest one
+	def write_records(self, records):
+		if not records:
+			return
+		if self.column_types is None:
+			self.column_types = {column: ColumnarLogFormat.infer_column_type(value) for column, value in records[0].items() if column not in ['timestamp_utc', 'timestamp_local', 'quality', SQLiteLogFormat.TIMESTAMP_COLUMN]}
+		if self.connection is None:
+			self.open()
+		ids = range(self.next_id, self.next_id + len(records))
+		with self.connection:
+			for insert, row_values in self.inserts:
+				self.connection.executemany(insert, [(record_id,) + row_values(record) for record_id, record in zip(ids, records)])
+			if self.retention_seconds:
+				self.prune(records[-1][SQLiteLogFormat.TIMESTAMP_COLUMN] - int(self.retention_seconds*1000000000))
+		self.next_id += len(records)
+
+	# Method to delete the records older than cutoff_ns from every table, by id since the ids follow the insertion order
+	def prune(self, cutoff_ns):
+		last_id = self.connection.execute('SELECT MAX(id) FROM '+SQLiteLogFormat.TABLE+' WHERE '+SQLiteLogFormat.TIMESTAMP_COLUMN+' < ?', (cutoff_ns,)).fetchone()[0]
+		if last_id is None:
+			return
+		for table in SQLiteLogFormat.tables(self.connection):
+			self.connection.execute('DELETE FROM '+SQLiteLogFormat.quote(table)+' WHERE id <= ?', (last_id,))
+
+	# Method to force the committed records to the storage, ex: before the spooled records they hold are released
+	def sync(self):
+		if self.connection is None:
+			return
+		self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+	# Method to close the live database, to be called when exiting
+	def close(self):
+		if self.connection is None:
+			return
+		self.connection.execute('PRAGMA optimize')
+		self.connection.close()
+		self.connection = None
+
+# read-only access to a .sqlite log database, also while the logger writes to it
+# ex:
+#	with SQLiteLogReader('data/my_logged_data.sqlite') as log:
+#		records = log.read(start_ns, end_ns, ['hr_tag_0'])
+#		stats = log.stats('hr_tag_0', seconds=3600)
+class SQLiteLogReader(object):
+	def __init__(self, full_path_to_sqlite_file):
+		self.full_path_to_sqlite_file = full_path_to_sqlite_file
+		self.connection = sqlite3.connect('file:'+str(full_path_to_sqlite_file)+'?mode=ro', uri=True)
+		self.tables = SQLiteLogFormat.tables(self.connection)
+		if SQLiteLogFormat.TABLE not in self.tables:
+			self.close()
+			raise ValueError('"'+str(full_path_to_sqlite_file)+'" is not a .sqlite log database')
+		# column: table holding it
+		self.column_tables = {column: table for table, columns in self.tables.items() for column in columns}
+
+	@property
+	def columns(self):
+		return list(self.column_tables)
+
+	# Method to return the FROM clause joining the tables holding some columns, and the qualified name of each column
+	def source(self, columns):
+		tables = [SQLiteLogFormat.TABLE] + [table for table in self.tables if (table != SQLiteLogFormat.TABLE) and (table in set(self.column_tables[column] for column in columns))]
+		source = ' FROM '+SQLiteLogFormat.TABLE+''.join(' JOIN '+SQLiteLogFormat.quote(table)+' ON '+SQLiteLogFormat.quote(table)+'.id = '+SQLiteLogFormat.TABLE+'.id' for table in tables[1:])
+		return source, [SQLiteLogFormat.quote(self.column_tables[column])+'.'+SQLiteLogFormat.quote(column) for column in columns]
+
+	# Method to return the WHERE clause and parameters of a time range, with seconds the range is the last seconds seconds up to the latest record
+	def time_range(self, start_ns=None, end_ns=None, seconds=None):
+		if seconds is not None:
+			end_ns = self.connection.execute('SELECT MAX('+SQLiteLogFormat.TIMESTAMP_COLUMN+') FROM '+SQLiteLogFormat.TABLE).fetchone()[0]
+			if end_ns is None:
+				return '', []
+			start_ns = end_ns - int(seconds*1000000000)
+		conditions = []
+		parameters = []
+		if start_ns is not None:
+			conditions.append(SQLiteLogFormat.TABLE+'.'+SQLiteLogFormat.TIMESTAMP_COLUMN+' >= ?')
+			parameters.append(int(start_ns))
+		if end_ns is not None:
+			conditions.append(SQLiteLogFormat.TABLE+'.'+SQLiteLogFormat.TIMESTAMP_COLUMN+' <= ?')
+			parameters.append(int(end_ns))
+		if not conditions:
+			return '', parameters
+		return ' WHERE '+' AND '.join(conditions), parameters
+
+	# Method to read the records between start_ns and end_ns (both included, nanoseconds since the Unix epoch) as lists of values by column,
+	# some columns (all of them by default), oldest first
+	def read(self, start_ns=None, end_ns=None, columns=None, seconds=None):
+		if columns is None:
+			columns = self.columns
+		columns = [column for column in columns if column in self.column_tables]
+		if not columns:
+			return {}
+		source, qualified_columns = self.source(columns)
+		where, parameters = self.time_range(start_ns, end_ns, seconds)
+		rows = self.connection.execute('SELECT '+', '.join(qualified_columns)+source+where+' ORDER BY '+SQLiteLogFormat.TABLE+'.'+SQLiteLogFormat.TIMESTAMP_COLUMN+', '+SQLiteLogFormat.TABLE+'.id', parameters).fetchall()
+		if not rows:
+			return {column: [] for column in columns}
+		return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+	# Method to compute the count, min, max and mean of one column over a time range (see read()), quality-bad records and NULL excluded
+	def stats(self, column, start_ns=None, end_ns=None, seconds=None):
+		if column not in self.column_tables:
+			print('\t[WARNING] column "'+str(column)+'" not found in "'+str(self.full_path_to_sqlite_file)+'"')
+			return None
+		source, qualified_columns = self.source([column])
+		where, parameters = self.time_range(start_ns, end_ns, seconds)
+		where += (' AND ' if where else ' WHERE ')+SQLiteLogFormat.TABLE+'.quality = 1'
+		quoted = qualified_columns[0]
+		count, minimum, maximum, mean = self.connection.execute('SELECT COUNT('+quoted+'), MIN('+quoted+'), MAX('+quoted+'), AVG('+quoted+')'+source+where, parameters).fetchone()
+		return {'count': count, 'min': minimum, 'max': maximum, 'mean': mean}
+
+	def close(self):
+		if self.connection is not None:
+			self.connection.close()
+			self.connection = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -0,0 +1,269 @@
+import os, sys, time, queue, signal, multiprocessing
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from modbus_helper import ModbusHelper
+from async_helper import AsyncModbusTCPPoller
+from connection_helper import ReconnectBackoff
+
+# devices of a fleet manifest spread over worker processes, balanced by their estimated cost per second
+class FleetPlan(object):
+
+	# Method to estimate the decode and logging work of one device per second: each read request costs its round trip plus
+	# the columns it decodes (a packedbool tag decodes to 17 columns), times its polling rate
+	@classmethod
+	def device_cost(cls, modbus_config, call_groups, interpreter_helper):
+		cost = 0.0
+		for transaction in ModbusHelper.build_transactions(call_groups, interpreter_helper, modbus_config['server_id']):
+			decode_plan = transaction['decode_plan']
+			if 'bits' in decode_plan:
+				columns = len(decode_plan['bits'])
+			else:
+				columns = sum(1 if bit_tags is None else 1 + len(bit_tags) for tag_name, data_type, byte_offset, scaling, bit_tags in decode_plan['array_fields'])
+			poll_interval = transaction['poll_interval']
+			if poll_interval is None:
+				poll_interval = modbus_config['poll_interval_seconds']
+			cost += (1 + columns) / poll_interval
+		return cost
+
+	# Method to parse the config and template of each (config, template) pair of a manifest and estimate its cost
+	# it returns a list of {'config': ..., 'template': ..., 'name': ..., 'cost': ...}, the invalid devices are skipped as by AsyncModbusTCPPoller
+	@classmethod
+	def estimate(cls, devices, data_logging=True):
+		device_costs = []
+		log_file_names = []
+		for full_path_to_modbus_config_json, full_path_to_modbus_template_csv in devices:
+			modbus_config = ModbusHelper.parse_json_config(full_path_to_modbus_config_json)
+			if modbus_config is None:
+				print('\t[WARNING] Skipping device configured in',str(full_path_to_modbus_config_json))
+				continue
+			# two devices writing to the same live log file would corrupt it, even from two different worker processes
+			if data_logging and (modbus_config['log_file_name'] in log_file_names):
+				print('\t[ERROR] "log_file_name" of',str(full_path_to_modbus_config_json),'is already used by another device:',str(modbus_config['log_file_name']))
+				print('\t[WARNING] Skipping device configured in',str(full_path_to_modbus_config_json))
+				continue
+			log_file_names.append(modbus_config['log_file_name'])
+			call_groups, interpreter_helper = ModbusHelper.parse_template_build_calls(full_path_to_modbus_template_csv, modbus_config['max_gap'], modbus_config['max_read_sizes'])
+			device_costs.append({
+				'config': full_path_to_modbus_config_json,
+				'template': full_path_to_modbus_template_csv,
+				'name': str(modbus_config['log_file_name'])+' @ '+str(modbus_config['server_ip'])+':'+str(modbus_config['server_port'])+' ID '+str(modbus_config['server_id']),
+				'cost': cls.device_cost(modbus_config, call_groups, interpreter_helper)
+			})
+		return device_costs
+
+	# Method to spread the devices over at most workers shards, the most costly device first to the least loaded shard (longest processing time first)
+	# it returns a list of {'devices': [...], 'cost': ...}, without empty shards
+	@classmethod
+	def balance(cls, device_costs, workers):
+		shards = [{'devices': [], 'cost': 0.0} for worker_index in range(max(1, min(workers, len(device_costs))))]
+		for device_cost in sorted(device_costs, key=lambda device_cost: device_cost['cost'], reverse=True):
+			shard = min(shards, key=lambda shard: shard['cost'])
+			shard['devices'].append(device_cost)
+			shard['cost'] += device_cost['cost']
+		return [shard for shard in shards if shard['devices']]
+
+	@classmethod
+	def print_plan(cls, shards):
+		print('')
+		for worker_index, shard in enumerate(shards):
+			print('\t[INFO] worker',str(worker_index)+':',str(len(shard['devices'])),'device(s), estimated cost',str(round(shard['cost'], 1)),'per second')
+			for device_cost in shard['devices']:
+				print('\t[INFO]\t'+device_cost['name'],'estimated cost',str(round(device_cost['cost'], 1)),'per second')
+		print('')
+
+# Method run by each worker process: poll its shard of devices with an AsyncModbusTCPPoller, reporting their stats to the supervisor
+# the worker ignores Ctrl+C, the supervisor stops it with SIGTERM so that it writes its buffered records to disk before exiting
+def run_worker(worker_index, devices, full_path_to_logged_data, quiet, data_logging, profile, reports, report_interval_seconds):
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	modbus_poller = AsyncModbusTCPPoller(
+			devices=devices,
+			full_path_to_logged_data=full_path_to_logged_data,
+			quiet=quiet,
+			data_logging=data_logging,
+			profile=profile,
+			report=lambda devices_stats: reports.put((worker_index, os.getpid(), devices_stats)),
+			report_interval_seconds=report_interval_seconds
+		)
+	modbus_poller.run()
+
+# supervisor of the worker processes polling the devices of a fleet manifest, one AsyncModbusTCPPoller per worker
+# a worker that crashes (or is killed) is restarted with a jittered exponential backoff, the stats reported by the workers are gathered
+# and printed every report_interval_seconds seconds (unless quiet) and when exiting
+class FleetSupervisor(object):
+
+	# a worker running for longer than this before crashing is restarted right away (after the initial backoff delay)
+	HEALTHY_SECONDS = 60
+	STOP_TIMEOUT_SECONDS = 30
+	# stats summed over the devices of a worker, counted from the first start of the worker (through its restarts)
+	COUNTERS = ['cycles', 'errors', 'bad_quality_records', 'late_cycles', 'batches_dropped']
+
+	def __init__(self, devices=None, workers=0, full_path_to_logged_data=None, quiet=True, data_logging=True, profile=False, report_interval_seconds=10):
+		self.shards = []
+		if not devices:
+			print('\t[ERROR] no devices provided to FleetSupervisor, please provide a list of (config, template) pairs')
+			return
+		if 'fork' not in multiprocessing.get_all_start_methods():
+			print('\t[ERROR] the worker processes of FleetSupervisor are forked, which this platform does not support; please poll the manifest without workers')
+			return
+		if full_path_to_logged_data is None:
+			full_path_to_logged_data = ModbusHelper.default_log_file_location()
+		if workers <= 0:
+			workers = os.cpu_count() or 1
+		self.full_path_to_logged_data = full_path_to_logged_data
+		self.quiet = quiet
+		self.data_logging = data_logging
+		self.profile = profile
+		self.report_interval_seconds = report_interval_seconds
+		self.shards = FleetPlan.balance(FleetPlan.estimate(devices, data_logging), workers)
+		# the workers are forked: modbus-dl.py is not re-imported by them and they inherit the parsed modules
+		self.context = multiprocessing.get_context('fork')
+		self.reports = self.context.Queue()
+		self.workers = []
+		for worker_index, shard in enumerate(self.shards):
+			self.workers.append({
+				'index': worker_index,
+				'devices': [(device_cost['config'], device_cost['template']) for device_cost in shard['devices']],
+				'cost': shard['cost'],
+				'process': None,
+				'started': None,
+				'restart_at': None,
+				'backoff': ReconnectBackoff(initial_seconds=1, max_seconds=60),
+				'finished': False,
+				'stats': {
+					'pid': None,
+					'restarts': 0,
+					'crashes': 0,
+					'last_exitcode': None,
+					'devices': len(shard['devices']),
+					'connected': 0,
+					'cycles': 0,
+					'cycles_per_second': 0.0,
+					'errors': 0,
+					'bad_quality_records': 0,
+					'late_cycles': 0,
+					'batches_dropped': 0
+				},
+				# counters of the previous runs of the worker, before its last restart
+				'counters_base': None,
+				# (monotonic time, cycles) of the previous report, for the cycles per second
+				'last_report': None
+			})
+		print('\t[INFO] FleetSupervisor will poll',str(sum(len(worker['devices']) for worker in self.workers)),'Modbus TCP Server(s) from',str(len(self.workers)),'worker process(es)')
+		FleetPlan.print_plan(self.shards)
+
+	def start_worker(self, worker):
+		worker['process'] = self.context.Process(
+				target=run_worker,
+				args=(worker['index'], worker['devices'], self.full_path_to_logged_data, self.quiet, self.data_logging, self.profile, self.reports, self.report_interval_seconds),
+				name='modbus-dl worker '+str(worker['index']),
+				daemon=False
+			)
+		worker['process'].start()
+		worker['started'] = time.monotonic()
+		worker['restart_at'] = None
+		worker['stats']['pid'] = worker['process'].pid
+		worker['stats']['cycles_per_second'] = 0.0
+		worker['counters_base'] = {key: worker['stats'][key] for key in FleetSupervisor.COUNTERS}
+		worker['last_report'] = None
+
+	# Method to gather the stats of one report of a worker: the sums over its devices and its cycles per second since its previous report
+	def gather(self, worker_index, pid, devices_stats):
+		worker = self.workers[worker_index]
+		if pid != worker['stats']['pid']:
+			# late report of a worker that was restarted since
+			return
+		now = time.monotonic()
+		cycles = sum(device_stats['cycles'] for device_stats in devices_stats)
+		if worker['last_report'] is not None:
+			report_time, report_cycles = worker['last_report']
+			if now > report_time:
+				worker['stats']['cycles_per_second'] = (cycles - report_cycles) / (now - report_time)
+		worker['last_report'] = (now, cycles)
+		worker['stats']['devices'] = len(devices_stats)
+		worker['stats']['connected'] = sum(1 for device_stats in devices_stats if device_stats['connected'])
+		for key in FleetSupervisor.COUNTERS:
+			worker['stats'][key] = worker['counters_base'][key] + sum(device_stats.get(key, 0) for device_stats in devices_stats)
+
+	# Method to restart the crashed workers once their backoff delay is over
+	def check_workers(self):
+		now = time.monotonic()
+		for worker in self.workers:
+			if worker['finished']:
+				continue
+			if worker['restart_at'] is not None:
+				if now >= worker['restart_at']:
+					worker['stats']['restarts'] += 1
+					print('\t[INFO] restarting worker',str(worker['index']),'(restart',str(worker['stats']['restarts'])+')')
+					self.start_worker(worker)
+				continue
+			if worker['process'].is_alive():
+				continue
+			worker['process'].join()
+			exitcode = worker['process'].exitcode
+			worker['stats']['last_exitcode'] = exitcode
+			if exitcode == 0:
+				# nothing left to poll, ex: none of its devices could be configured
+				print('\t[WARNING] worker',str(worker['index']),'exited, its',str(len(worker['devices'])),'device(s) are no longer polled')
+				worker['finished'] = True
+				continue
+			worker['stats']['crashes'] += 1
+			if now - worker['started'] >= FleetSupervisor.HEALTHY_SECONDS:
+				worker['backoff'].reset()
+			delay = worker['backoff'].next_delay()
+			worker['restart_at'] = now + delay
+			print('\t[WARNING] worker',str(worker['index']),'(pid',str(worker['stats']['pid'])+') crashed with exit code',str(exitcode)+', restarting it in',str(round(delay, 2)),'seconds')
+
+	# Method to run the workers until Ctrl+C, then stop them so that they write their buffered records to disk
+	def run(self):
+		if not self.shards:
+			return
+		print('Press Ctrl+C to stop and exit gracefully...')
+		for worker in self.workers:
+			self.start_worker(worker)
+		next_print = time.monotonic() + self.report_interval_seconds
+		try:
+			while not all(worker['finished'] for worker in self.workers):
+				try:
+					self.gather(*self.reports.get(timeout=0.5))
+				except queue.Empty:
+					pass
+				self.check_workers()
+				if time.monotonic() >= next_print:
+					next_print += self.report_interval_seconds
+					if not self.quiet:
+						self.print_stats()
+		except KeyboardInterrupt:
+			print('\nYou pressed Ctrl+C!')
+		self.stop()
+		self.print_stats()
+		print('Bye!')
+
+	def stop(self):
+		for worker in self.workers:
+			if (worker['process'] is not None) and worker['process'].is_alive():
+				worker['process'].terminate()
+		# the reports are gathered while waiting: a worker only exits once its last reports are flushed to the pipe,
+		# which blocks as long as the pipe is full
+		deadline = time.monotonic() + FleetSupervisor.STOP_TIMEOUT_SECONDS
+		while (time.monotonic() < deadline) and any((worker['process'] is not None) and worker['process'].is_alive() for worker in self.workers):
+			try:
+				self.gather(*self.reports.get(timeout=0.1))
+			except queue.Empty:
+				pass
+		for worker in self.workers:
+			if worker['process'] is None:
+				continue
+			if worker['process'].is_alive():
+				print('\t[WARNING] worker',str(worker['index']),'still busy after',str(FleetSupervisor.STOP_TIMEOUT_SECONDS),'seconds, killing it')
+				worker['process'].kill()
+			worker['process'].join()
+		# the reports still queued are gathered so that the final stats are up to date
+		while True:
+			try:
+				self.gather(*self.reports.get_nowait())
+			except queue.Empty:
+				break
+
+	def print_stats(self):
+		for worker in self.workers:
+			print('\t[INFO] worker '+str(worker['index'])+':',', '.join(str(key)+'='+str(round(value, 1) if isinstance(value, float) else value) for key, value in worker['stats'].items()))
+		print('\t[INFO] fleet: cycles_per_second='+str(round(sum(worker['stats']['cycles_per_second'] for worker in self.workers), 1)))
@@ -0,0 +1,133 @@
+import time, threading, queue
+
+class BackgroundWriter(object):
+
+	# what to do with a new batch when the queue of batches waiting to be written is full
+	#	'block': wait for the writer to free a slot (backpressure, no data loss, the poll loop may be delayed)
+	#	'drop_newest': discard the new batch, the poll loop is never delayed
+	#	'drop_oldest': discard the oldest queued batch to make room for the new one, the poll loop is never delayed
+	QUEUE_POLICIES = ['block', 'drop_newest', 'drop_oldest']
+
+	# sentinel put on the queue to stop the writer thread once all the batches before it are written
+	STOP = object()
+
+	# on_drop is an optional callable handed each dropped batch, ex: to release the resources held by its records
+	def __init__(self, write_batch, queue_size=16, queue_policy='block', name='writer', on_drop=None):
+		if not queue_size > 0:
+			print('\t[ERROR] in BackgroundWriter: queue_size should be strictly positive, current value is',str(queue_size))
+			print('\t[ERROR] will default to 16 batches')
+			queue_size = 16
+		if queue_policy not in BackgroundWriter.QUEUE_POLICIES:
+			print('\t[WARNING] in BackgroundWriter: unknown queue_policy "'+str(queue_policy)+'", supported are',BackgroundWriter.QUEUE_POLICIES)
+			print('\t[WARNING] will default to "block"')
+			queue_policy = 'block'
+		self.write_batch = write_batch
+		self.on_drop = on_drop
+		self.queue_size = queue_size
+		self.queue_policy = queue_policy
+		self.name = name
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.thread = None
+		self.stats_lock = threading.Lock()
+		self.stats = {
+			'batches_queued': 0,
+			'batches_written': 0,
+			'batches_dropped': 0,
+			'write_errors': 0,
+			'last_error': None,
+			'queue_depth_max': 0,
+			'write_latency_mean_seconds': 0.0,
+			'write_latency_max_seconds': 0.0,
+			'blocked_seconds': 0.0
+		}
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name=str(self.name)+' writer', daemon=True)
+		self.thread.start()
+
+	# Method to hand a batch over to the writer thread; it returns False when the batch (or an older one, with 'drop_oldest') was dropped
+	def put(self, batch):
+		accepted = True
+		dropped = None
+		if self.queue_policy == 'block':
+			try:
+				self.queue.put_nowait(batch)
+			except queue.Full:
+				blocked = time.monotonic()
+				self.queue.put(batch)
+				with self.stats_lock:
+					self.stats['blocked_seconds'] += time.monotonic() - blocked
+		elif self.queue_policy == 'drop_newest':
+			try:
+				self.queue.put_nowait(batch)
+			except queue.Full:
+				accepted = False
+				dropped = batch
+		else:
+			while True:
+				try:
+					self.queue.put_nowait(batch)
+					break
+				except queue.Full:
+					try:
+						dropped = self.queue.get_nowait()
+						self.queue.task_done()
+						accepted = False
+					except queue.Empty:
+						pass
+		with self.stats_lock:
+			if accepted:
+				self.stats['batches_queued'] += 1
+			else:
+				self.stats['batches_dropped'] += 1
+			self.stats['queue_depth_max'] = max(self.stats['queue_depth_max'], self.queue.qsize())
+		if not accepted:
+			print('\t[WARNING] '+str(self.name)+': writer queue full ('+str(self.queue_size)+' batches), one batch of records dropped')
+			if self.on_drop is not None:
+				self.on_drop(dropped)
+		return accepted
+
+	# writer thread: serializes, appends and rotates one batch at a time, a failed write is counted and reported but never stops the thread
+	def run(self):
+		while True:
+			batch = self.queue.get()
+			if batch is BackgroundWriter.STOP:
+				self.queue.task_done()
+				return
+			started = time.monotonic()
+			try:
+				self.write_batch(batch)
+			except Exception as err:
+				with self.stats_lock:
+					self.stats['write_errors'] += 1
+					self.stats['last_error'] = repr(err)
+				print('\t[ERROR] '+str(self.name)+': failed writing a batch of records to disk with',repr(err))
+			else:
+				latency = time.monotonic() - started
+				with self.stats_lock:
+					self.stats['batches_written'] += 1
+					self.stats['write_latency_mean_seconds'] += (latency - self.stats['write_latency_mean_seconds']) / self.stats['batches_written']
+					self.stats['write_latency_max_seconds'] = max(self.stats['write_latency_max_seconds'], latency)
+			self.queue.task_done()
+
+	# Method to write all the queued batches and stop the writer thread, to be called when exiting
+	def close(self, timeout=None):
+		if (self.thread is None) or (not self.thread.is_alive()):
+			return
+		self.queue.put(BackgroundWriter.STOP)
+		self.thread.join(timeout)
+		if self.thread.is_alive():
+			print('\t[WARNING] '+str(self.name)+': writer thread still busy after',str(timeout),'seconds,',str(self.queue.qsize()),'batch(es) not written')
+
+	# Method to return a summary of the writer statistics gathered so far
+	def get_stats(self):
+		with self.stats_lock:
+			stats = dict(self.stats)
+		stats['queue_depth'] = self.queue.qsize()
+		stats['queue_size'] = self.queue_size
+		stats['queue_policy'] = self.queue_policy
+		return stats
+
+	def print_stats(self):
+		for key, value in self.get_stats().items():
+			print('\t[INFO] '+str(self.name)+' writer '+str(key)+':', str(value))
@@ -0,0 +1,58 @@
+import os, sys, socket, struct, unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'scripts'))
+from modbus_helper import ModbusHelper, ModbusTCPTransport
+
+# two uint16 holding registers read by one FC03 request, the responses are written ahead on the other end of a socket pair
+class TestTransportResponseChecks(unittest.TestCase):
+
+	SERVER_ID = 1
+
+	def setUp(self):
+		template_lod = [
+			{'address': '0', 'read_type': 'HR', 'data_type': 'uint16', 'tag_name': 'a', 'scaling_coeff': '', 'scaling_offset': ''},
+			{'address': '1', 'read_type': 'HR', 'data_type': 'uint16', 'tag_name': 'b', 'scaling_coeff': '', 'scaling_offset': ''}
+		]
+		call_groups, interpreter_helper = ModbusHelper.parse_template_lod_build_calls(template_lod)
+		self.transactions = ModbusHelper.build_transactions(call_groups, interpreter_helper, TestTransportResponseChecks.SERVER_ID)
+		self.client_socket, self.server_socket = socket.socketpair()
+		self.client_socket.settimeout(1)
+		self.transport = ModbusTCPTransport(self.client_socket, self.transactions)
+		self.transaction_id = 0
+
+	def tearDown(self):
+		self.client_socket.close()
+		self.server_socket.close()
+
+	def respond(self, response_pdu, unit_id=SERVER_ID):
+		self.transaction_id += 1
+		self.server_socket.sendall(struct.pack('>HHHB', self.transaction_id, 0, len(response_pdu) + 1, unit_id) + response_pdu)
+
+	def test_valid_response(self):
+		self.respond(bytes([3, 4, 0, 11, 0, 22]))
+		self.assertEqual(self.transport.poll()[0], {'a': 11, 'b': 22})
+
+	def test_short_response(self):
+		self.respond(bytes([3, 4, 0, 11, 0, 22]))
+		self.transport.poll()
+		# a short response shall not be decoded over the bytes left in the response buffer by the previous cycle
+		self.respond(bytes([3, 2, 0, 99]))
+		with self.assertRaises(ValueError):
+			self.transport.poll()
+
+	def test_wrong_function_code(self):
+		self.respond(bytes([4, 4, 0, 11, 0, 22]))
+		with self.assertRaises(ValueError):
+			self.transport.poll()
+
+	def test_wrong_byte_count(self):
+		self.respond(bytes([3, 2, 0, 11, 0, 22]))
+		with self.assertRaises(ValueError):
+			self.transport.poll()
+
+	def test_wrong_unit_id(self):
+		self.respond(bytes([3, 4, 0, 11, 0, 22]), unit_id=TestTransportResponseChecks.SERVER_ID + 1)
+		with self.assertRaises(ValueError):
+			self.transport.poll()
+
+if __name__ == '__main__':
+	unittest.main()